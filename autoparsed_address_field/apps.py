@@ -1,6 +1,7 @@
 import logging
 
 from django.apps import AppConfig
+from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 
 
@@ -15,3 +16,8 @@ class AutoParsedAddressFieldConfig(AppConfig):
     def ready(self):
         logger.debug("AutoParsedAddressFieldConfig ready")
         from .signals import address_parsed
+
+        if getattr(settings, "ADDRESS_USZIPCODE_PRELOAD", False):
+            from .services.scourgify import get_search_engine
+
+            get_search_engine()
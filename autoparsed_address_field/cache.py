@@ -0,0 +1,517 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .utils.raw_key import generate_raw_key
+
+DEFAULT_TIMEOUT = 60 * 60 * 24 * 30
+DEFAULT_NEGATIVE_TIMEOUT = 60 * 60 * 24
+DEFAULT_MAXSIZE = 1024
+DEFAULT_SIZE_LIMIT = 64 * 1024 * 1024
+DEFAULT_REFERENCE_MAXSIZE = 4096
+
+# Models resolved through ReferenceDataManager.get_or_create_cached()
+REFERENCE_MODELS = {
+    "autoparsed_address_field.Country",
+    "autoparsed_address_field.State",
+    "autoparsed_address_field.Locality",
+}
+
+# Cached in place of the components of a raw address the provider failed on
+FAILED = "failed"
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    A bounded, thread-safe mapping that evicts the least recently used entry.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteGeocodeCache:
+    """
+    A single-file cache that every process on a host can share.
+
+    Entries are JSON encoded in a SQLite database in WAL mode, so readers don't
+    block each other or the writer. A running total of the stored size is kept
+    by triggers; once it exceeds `size_limit` bytes the least recently used
+    entries are removed until it is back under 90% of the limit. Connections
+    are opened per thread and reopened after a fork.
+    """
+
+    schema = (
+        """
+        CREATE TABLE IF NOT EXISTS geocode_cache (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            expires_at REAL,
+            accessed_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS geocode_cache_accessed_at "
+        "ON geocode_cache (accessed_at)",
+        """
+        CREATE TABLE IF NOT EXISTS geocode_cache_size (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            total INTEGER NOT NULL
+        )
+        """,
+        "INSERT OR IGNORE INTO geocode_cache_size (id, total) VALUES (0, 0)",
+        """
+        CREATE TRIGGER IF NOT EXISTS geocode_cache_insert
+        AFTER INSERT ON geocode_cache BEGIN
+            UPDATE geocode_cache_size SET total = total + NEW.size WHERE id = 0;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS geocode_cache_update
+        AFTER UPDATE OF size ON geocode_cache BEGIN
+            UPDATE geocode_cache_size
+            SET total = total - OLD.size + NEW.size WHERE id = 0;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS geocode_cache_delete
+        AFTER DELETE ON geocode_cache BEGIN
+            UPDATE geocode_cache_size SET total = total - OLD.size WHERE id = 0;
+        END
+        """,
+    )
+
+    # Seconds between access time updates for the same entry
+    touch_interval = 60
+    cull_ratio = 0.9
+    cull_batch = 100
+
+    def __init__(self, path, size_limit=DEFAULT_SIZE_LIMIT, timeout=DEFAULT_TIMEOUT):
+        self.path = path
+        self.size_limit = size_limit
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._connection() as connection:
+            for statement in self.schema:
+                connection.execute(statement)
+
+    def get(self, key):
+        now = time.time()
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value, expires_at, accessed_at FROM geocode_cache "
+                "WHERE key = ?",
+                (key,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+
+        value, expires_at, accessed_at = row
+        if expires_at is not None and expires_at <= now:
+            self.delete(key)
+            return None
+        if now - accessed_at > self.touch_interval:
+            with self._connection() as connection:
+                connection.execute(
+                    "UPDATE geocode_cache SET accessed_at = ? WHERE key = ?",
+                    (now, key),
+                )
+        return json.loads(value)
+
+    def set(self, key, value, timeout=None):
+        """
+        Stores a value for `timeout` seconds, defaulting to the cache's timeout.
+        """
+        now = time.time()
+        encoded = json.dumps(value)
+        timeout = self.timeout if timeout is None else timeout
+        expires_at = now + timeout if timeout is not None else None
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT INTO geocode_cache (key, value, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, "
+                "size = excluded.size, expires_at = excluded.expires_at, "
+                "accessed_at = excluded.accessed_at",
+                (key, encoded, len(key) + len(encoded), expires_at, now),
+            )
+            self._cull(connection)
+
+    def delete(self, key):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM geocode_cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM geocode_cache")
+
+    def size(self):
+        return (
+            self._connection()
+            .execute("SELECT total FROM geocode_cache_size WHERE id = 0")
+            .fetchone()[0]
+        )
+
+    def __len__(self):
+        return (
+            self._connection()
+            .execute("SELECT COUNT(*) FROM geocode_cache")
+            .fetchone()[0]
+        )
+
+    def _cull(self, connection):
+        target = self.size_limit * self.cull_ratio
+        (total,) = connection.execute(
+            "SELECT total FROM geocode_cache_size WHERE id = 0"
+        ).fetchone()
+        if total <= self.size_limit:
+            return
+
+        connection.execute(
+            "DELETE FROM geocode_cache WHERE expires_at <= ?", (time.time(),)
+        )
+        while True:
+            (total,) = connection.execute(
+                "SELECT total FROM geocode_cache_size WHERE id = 0"
+            ).fetchone()
+            if total <= target:
+                break
+            deleted = connection.execute(
+                "DELETE FROM geocode_cache WHERE key IN ("
+                "SELECT key FROM geocode_cache ORDER BY accessed_at LIMIT ?)",
+                (self.cull_batch,),
+            ).rowcount
+            if not deleted:
+                break
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+
+class GeocodeCache:
+    """
+    Caches geocoding results keyed on the provider and normalized raw address.
+
+    Lookups go through a bounded in-process LRU first, then the optional
+    on-disk `disk` cache shared by the processes on the host, then the Django
+    cache named by `alias`. The LRU and Django tiers can be disabled with a
+    `maxsize` of 0 or an `alias` of None. Raw addresses the provider failed on
+    are cached too, for the shorter `negative_timeout` (0 disables it). Hit and
+    miss counts are kept to help size the cache.
+    """
+
+    key_prefix = "autoparsed_address_field:geocode"
+
+    def __init__(
+        self,
+        alias="default",
+        timeout=DEFAULT_TIMEOUT,
+        maxsize=DEFAULT_MAXSIZE,
+        disk=None,
+        negative_timeout=DEFAULT_NEGATIVE_TIMEOUT,
+    ):
+        self.alias = alias
+        self.timeout = timeout
+        self.negative_timeout = negative_timeout
+        self.local = LRUCache(maxsize) if maxsize else None
+        self.disk = disk
+        self._lock = threading.Lock()
+        self._counts = {
+            "local_hits": 0,
+            "disk_hits": 0,
+            "shared_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+        }
+
+    @property
+    def shared(self):
+        return caches[self.alias] if self.alias else None
+
+    def make_key(self, provider, raw):
+        raw_key = generate_raw_key(raw)
+        if raw_key is None:
+            return None
+        return f"{self.key_prefix}:{provider}:{raw_key}"
+
+    def lookup(self, provider, raw):
+        """
+        Returns `(hit, components)` for a raw address. A hit with None
+        components means the provider recently failed on the address.
+        """
+        key = self.make_key(provider, raw)
+        if key is None:
+            return False, None
+
+        if self.local is not None:
+            entry = self.local.get(key)
+            if entry is not None:
+                # Entries are stored locally with their expiry time
+                value, expires_at = entry
+                if expires_at is not None and expires_at <= time.time():
+                    self.local.delete(key)
+                elif value == FAILED:
+                    self._count("negative_hits")
+                    return True, None
+                else:
+                    self._count("local_hits")
+                    return True, value
+
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                return self._hit("disk_hits", key, value, disk=False)
+
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                return self._hit("shared_hits", key, value, disk=True)
+
+        self._count("misses")
+        return False, None
+
+    def get(self, provider, raw):
+        """
+        Returns the cached components for a raw address, or None on a miss.
+        """
+        return self.lookup(provider, raw)[1]
+
+    def set(self, provider, raw, components):
+        key = self.make_key(provider, raw)
+        if key is None:
+            return
+
+        self._set_local(key, components, self.timeout)
+        if self.disk is not None:
+            self.disk.set(key, components)
+        if self.shared is not None:
+            self.shared.set(key, components, self.timeout)
+
+    def set_failed(self, provider, raw):
+        """
+        Remembers that the provider failed on a raw address for
+        `negative_timeout` seconds, so it isn't called again for it.
+        """
+        key = self.make_key(provider, raw)
+        if key is None or not self.negative_timeout:
+            return
+
+        self._set_local(key, FAILED, self.negative_timeout)
+        if self.disk is not None:
+            self.disk.set(key, FAILED, timeout=self.negative_timeout)
+        if self.shared is not None:
+            self.shared.set(key, FAILED, self.negative_timeout)
+
+    def get_or_geocode(self, provider, raw, geocode):
+        """
+        Returns the cached components for a raw address, calling `geocode(raw)`
+        and caching its result on a miss. A failed geocode (None) is cached
+        for `negative_timeout` seconds; exceptions aren't cached.
+        """
+        hit, components = self.lookup(provider, raw)
+        if not hit:
+            components = geocode(raw)
+            if components is not None:
+                self.set(provider, raw, components)
+            else:
+                self.set_failed(provider, raw)
+        return components
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        counts["hits"] = (
+            counts["local_hits"] + counts["disk_hits"] + counts["shared_hits"]
+        )
+        counts["local_size"] = len(self.local) if self.local is not None else 0
+        return counts
+
+    def clear(self):
+        """
+        Empties the in-process tier and resets the counters.
+        """
+        if self.local is not None:
+            self.local.clear()
+        with self._lock:
+            self._counts = dict.fromkeys(self._counts, 0)
+
+    def _hit(self, name, key, value, disk):
+        """
+        Counts a hit on a slower tier and copies it to the faster ones.
+        """
+        if value == FAILED:
+            if not self.negative_timeout:
+                self._count("misses")
+                return False, None
+            self._count("negative_hits")
+            self._set_local(key, FAILED, self.negative_timeout)
+            if disk and self.disk is not None:
+                self.disk.set(key, FAILED, timeout=self.negative_timeout)
+            return True, None
+
+        self._count(name)
+        self._set_local(key, value, self.timeout)
+        if disk and self.disk is not None:
+            self.disk.set(key, value)
+        return True, value
+
+    def _set_local(self, key, value, timeout):
+        if self.local is not None:
+            expires_at = time.time() + timeout if timeout is not None else None
+            self.local.set(key, (value, expires_at))
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+
+_geocode_cache = None
+_geocode_cache_lock = threading.Lock()
+
+
+def get_geocode_cache():
+    """
+    Returns the process-wide GeocodeCache configured from settings, or None
+    when `ADDRESS_GEOCODE_CACHE_ENABLED` is False.
+    """
+    global _geocode_cache
+
+    if not getattr(settings, "ADDRESS_GEOCODE_CACHE_ENABLED", True):
+        return None
+
+    with _geocode_cache_lock:
+        if _geocode_cache is None:
+            timeout = getattr(
+                settings, "ADDRESS_GEOCODE_CACHE_TIMEOUT", DEFAULT_TIMEOUT
+            )
+            path = getattr(settings, "ADDRESS_GEOCODE_CACHE_PATH", None)
+            disk = None
+            if path:
+                disk = SQLiteGeocodeCache(
+                    path,
+                    size_limit=getattr(
+                        settings, "ADDRESS_GEOCODE_CACHE_SIZE_LIMIT", DEFAULT_SIZE_LIMIT
+                    ),
+                    timeout=timeout,
+                )
+            _geocode_cache = GeocodeCache(
+                alias=getattr(settings, "ADDRESS_GEOCODE_CACHE_ALIAS", "default"),
+                timeout=timeout,
+                maxsize=getattr(
+                    settings, "ADDRESS_GEOCODE_CACHE_MAXSIZE", DEFAULT_MAXSIZE
+                ),
+                disk=disk,
+                negative_timeout=getattr(
+                    settings,
+                    "ADDRESS_GEOCODE_CACHE_NEGATIVE_TIMEOUT",
+                    DEFAULT_NEGATIVE_TIMEOUT,
+                ),
+            )
+        return _geocode_cache
+
+
+@receiver(setting_changed)
+def reset_geocode_cache(setting, **kwargs):
+    global _geocode_cache
+
+    if setting.startswith("ADDRESS_GEOCODE_CACHE") or setting == "CACHES":
+        with _geocode_cache_lock:
+            _geocode_cache = None
+
+
+_reference_cache = None
+_reference_cache_lock = threading.Lock()
+
+
+def get_reference_cache():
+    """
+    Returns the process-wide LRUCache of Countries, States and Localities keyed
+    on their natural keys, or None when `ADDRESS_REFERENCE_CACHE_MAXSIZE` is 0.
+    """
+    global _reference_cache
+
+    maxsize = getattr(
+        settings, "ADDRESS_REFERENCE_CACHE_MAXSIZE", DEFAULT_REFERENCE_MAXSIZE
+    )
+    if not maxsize:
+        return None
+
+    with _reference_cache_lock:
+        if _reference_cache is None:
+            _reference_cache = LRUCache(maxsize)
+        return _reference_cache
+
+
+@receiver(setting_changed)
+def reset_reference_cache(setting, **kwargs):
+    global _reference_cache
+
+    if setting == "ADDRESS_REFERENCE_CACHE_MAXSIZE":
+        with _reference_cache_lock:
+            _reference_cache = None
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_reference_cache(sender, created=False, **kwargs):
+    """
+    Clears the reference cache when a cached model changes. New rows can't
+    make cached entries stale, so creating one keeps the cache.
+    """
+    if created or sender._meta.label not in REFERENCE_MODELS:
+        return
+
+    with _reference_cache_lock:
+        reference_cache = _reference_cache
+    if reference_cache is not None:
+        reference_cache.clear()
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import weakref
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    function, and callers arriving while it runs wait for it and share its
+    result or exception. Nothing is kept once the call returns.
+
+    `do()` coalesces threads; `ado()` coalesces coroutines on the same event
+    loop. `stats()` counts the calls made and the callers that shared one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = weakref.WeakKeyDictionary()
+        self._counts = {"calls": 0, "shared": 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._counts["calls" if leader else "shared"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def ado(self, key, fn):
+        """
+        Async counterpart of `do()`; `fn` returns an awaitable. The call runs
+        in its own task, so cancelling one caller doesn't cancel it for the
+        others.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            tasks = self._tasks.setdefault(loop, {})
+            task = tasks.get(key)
+            if task is None:
+                task = tasks[key] = loop.create_task(fn())
+                task.add_done_callback(lambda _: tasks.pop(key, None))
+                self._counts["calls"] += 1
+            else:
+                self._counts["shared"] += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def clear(self):
+        """
+        Resets the counters.
+        """
+        with self._lock:
+            self._counts = dict.fromkeys(self._counts, 0)
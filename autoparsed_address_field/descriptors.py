@@ -1,36 +1,46 @@
 import logging
 
+from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
+
 from .models import Address
 
 logger = logging.getLogger(__name__)
 
 
-class AddressDescriptor:
+class AddressDescriptor(ForwardManyToOneDescriptor):
     """
     Custom descriptor to handle assignment of raw addresses to the field.
     Adds protection against infinite recursion and robust handling for `__get__`.
-    """
 
-    def __init__(self, field):
-        self.field = field
+    Extends Django's forward foreign key descriptor, so the resolved Address
+    is cached on the owning instance and objects loaded by `select_related()`
+    and `prefetch_related()` are used instead of querying again. Changing the
+    foreign key (through this descriptor, the ``*_id`` attribute or
+    ``refresh_from_db()``) clears the cache.
 
-    def __get__(self, instance, owner):
+    If the field defers parsing, a raw string is kept as an unsaved pending
+    Address until the owning instance is saved.
+    """
+
+    def __get__(self, instance, cls=None):
         if instance is None:
             return self
 
-        # Safely attempt to retrieve the attribute, handle AttributeError
+        pending = instance.__dict__.get(self.field.pending_attname)
+        if pending is not None:
+            return pending
+
         try:
-            value = getattr(instance, self.field.attname, None)
-            if value:
-                # Retrieve the related Address instance if the value is a primary key
-                return Address.objects.get(pk=value)
+            return super().__get__(instance, cls)
+        except Address.DoesNotExist:
+            # Raised (as RelatedObjectDoesNotExist) for a non-null field with no
+            # Address yet, or when the Address is deleted but the reference remains
+            if getattr(instance, self.field.attname) is not None:
+                self.field.set_cached_value(instance, None)
             return None
         except AttributeError as e:
             # Log the error for debugging purposes
-            logger.error(f"Error in AddressDescriptor __get__: {e}")
-            return None
-        except Address.DoesNotExist:
-            # Handle the case where the Address object is deleted but the reference remains
+            logger.debug(f"Error in AddressDescriptor __get__: {e}")
             return None
 
     def __set__(self, instance, value):
@@ -42,13 +52,20 @@ class AddressDescriptor:
             # Set guard to prevent re-entrant calls
             setattr(instance, "_address_guard", True)
 
-            if isinstance(value, str):
-                address_instance, _ = Address.objects.get_or_create(raw=value)
-                setattr(instance, self.field.attname, address_instance.pk)
-            elif isinstance(value, Address):
-                setattr(instance, self.field.attname, value.pk)
-            elif value is None:
-                setattr(instance, self.field.attname, None)
+            instance.__dict__.pop(self.field.pending_attname, None)
+
+            if isinstance(value, str) and self.field.defer_parsing:
+                # Resolved by the field's pre_save when the owner is saved. The
+                # pending Address stays out of the fields cache so Django doesn't
+                # refuse to save the owner with an unsaved related object.
+                super().__set__(instance, None)
+                self.field.delete_cached_value(instance)
+                instance.__dict__[self.field.pending_attname] = Address(raw=value)
+            elif isinstance(value, str):
+                address_instance, _ = Address.objects.get_or_create_from_raw(value)
+                super().__set__(instance, address_instance)
+            elif isinstance(value, Address) or value is None:
+                super().__set__(instance, value)
             else:
                 raise ValueError(
                     f"{self.field.name} must be a raw address string or an Address instance."
@@ -7,18 +7,64 @@ class AutoParsedAddressField(models.ForeignKey):
     A custom ForeignKey that integrates with autoparsed address fields.
     """
 
-    def __init__(self, foreign_key_class=models.ForeignKey, **kwargs):
+    def __init__(
+        self, foreign_key_class=models.ForeignKey, defer_parsing=False, **kwargs
+    ):
         """
         Initialize the custom ForeignKey.
+
+        When `defer_parsing` is True, assigning a raw address string only records
+        it as pending; the Address is looked up or created, and parsed, when the
+        owning instance is saved. A pending address counts as a value when the
+        instance is validated. `save(update_fields=...)` only resolves it when
+        the field is among the updated fields.
         """
         self.foreign_key_class = foreign_key_class
+        self.defer_parsing = defer_parsing
         kwargs["to"] = "autoparsed_address_field.Address"
         kwargs["on_delete"] = kwargs.get("on_delete", models.CASCADE)
         super().__init__(**kwargs)
 
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.defer_parsing:
+            kwargs["defer_parsing"] = True
+        return name, path, args, kwargs
+
     def contribute_to_class(self, cls, name, **kwargs):
         """
         Adds custom behavior to the model class.
         """
         super().contribute_to_class(cls, name, **kwargs)
         setattr(cls, name, AddressDescriptor(self))
+
+    @property
+    def pending_attname(self):
+        """
+        Instance attribute holding an Address assigned while parsing was deferred.
+        """
+        return f"_{self.name}_pending_address"
+
+    def validate(self, value, model_instance):
+        """
+        Treats a pending raw address as present, so non-null fields validate
+        before the Address exists.
+        """
+        if (
+            value is None
+            and model_instance is not None
+            and model_instance.__dict__.get(self.pending_attname) is not None
+        ):
+            return
+        super().validate(value, model_instance)
+
+    def pre_save(self, model_instance, add):
+        """
+        Resolves a pending raw address before the owning instance is written.
+        """
+        pending = model_instance.__dict__.pop(self.pending_attname, None)
+        if pending is not None:
+            address_manager = self.remote_field.model.objects
+            address_instance, _ = address_manager.get_or_create_from_raw(pending.raw)
+            setattr(model_instance, self.name, address_instance)
+        return super().pre_save(model_instance, add)
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...zip_centroids import build_zip_centroids
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the ZIP centroid table used by the scourgify provider from the "
+        "uszipcode database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            help="Output file. Defaults to the ADDRESS_ZIP_CENTROIDS_PATH setting.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"] or getattr(settings, "ADDRESS_ZIP_CENTROIDS_PATH", None)
+        if not path:
+            raise CommandError("Pass an output path or set ADDRESS_ZIP_CENTROIDS_PATH.")
+
+        count = build_zip_centroids(path)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} ZIP codes to {path}"))
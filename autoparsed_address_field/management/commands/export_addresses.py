@@ -0,0 +1,139 @@
+import csv
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from ...models import Address
+
+# Exported columns, named like the keys `import_addresses` reads
+ADDRESS_FIELDS = [
+    "id",
+    "address_id",
+    "raw",
+    "formatted",
+    "address_line_1",
+    "address_line_2",
+    "latitude",
+    "longitude",
+]
+RELATED_FIELDS = {
+    "locality_name": F("locality__name"),
+    "postal_code": F("locality__postal_code"),
+    "state_name": F("locality__state__name"),
+    "state_code": F("locality__state__code"),
+    "country_name": F("locality__state__country__name"),
+    "country_code": F("locality__state__country__code"),
+}
+FIELDS = ADDRESS_FIELDS + list(RELATED_FIELDS)
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports addresses with their locality, state and country as CSV, JSONL "
+        "or GeoJSON, streaming rows from the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path", nargs="?", default="-", help="Output file, or - for stdout."
+        )
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl", "geojson"],
+            help="Output format. Defaults to the file extension, or csv.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Rows fetched from the database at a time. Defaults to 2000.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or os.path.splitext(path)[1].lstrip(".")
+        if file_format not in ("csv", "jsonl", "geojson"):
+            if options["format"] or path != "-":
+                raise CommandError("Pass --format csv, jsonl or geojson.")
+            file_format = "csv"
+
+        # values() avoids building model instances, and iterator() uses a
+        # server-side cursor where the database supports one
+        rows = (
+            Address.objects.order_by("pk")
+            .values(*ADDRESS_FIELDS, **RELATED_FIELDS)
+            .iterator(chunk_size=options["chunk_size"])
+        )
+
+        started = time.monotonic()
+        with self.open_output(path) as out:
+            count = getattr(self, f"write_{file_format}")(out, rows)
+
+        elapsed = time.monotonic() - started
+        message = (
+            f"Exported {count} addresses in {elapsed:.1f}s "
+            f"({count / max(elapsed, 1e-9):.0f} rows/s)"
+        )
+        if path == "-":
+            self.stderr.write(message)
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
+
+    @contextmanager
+    def open_output(self, path):
+        if path == "-":
+            self.stdout.ending = ""
+            yield self.stdout
+            return
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            yield f
+
+    def write_csv(self, out, rows):
+        writer = csv.DictWriter(out, FIELDS)
+        writer.writeheader()
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+        return count
+
+    def write_jsonl(self, out, rows):
+        count = 0
+        for row in rows:
+            out.write(json.dumps(row) + "\n")
+            count += 1
+        return count
+
+    def write_geojson(self, out, rows):
+        out.write('{"type": "FeatureCollection", "features": [\n')
+        count = 0
+        for row in rows:
+            if count:
+                out.write(",\n")
+            out.write(json.dumps(self.feature(row)))
+            count += 1
+        out.write("\n]}\n")
+        return count
+
+    def feature(self, row):
+        geometry = None
+        if row["latitude"] is not None and row["longitude"] is not None:
+            geometry = {
+                "type": "Point",
+                "coordinates": [row["longitude"], row["latitude"]],
+            }
+        properties = {
+            key: value
+            for key, value in row.items()
+            if key not in ("id", "latitude", "longitude")
+        }
+        return {
+            "type": "Feature",
+            "id": row["id"],
+            "geometry": geometry,
+            "properties": properties,
+        }
@@ -0,0 +1,163 @@
+import csv
+import json
+import os
+import tempfile
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...models import Address
+from ...utils.create_address_from_keys import create_addresses_from_keys
+
+FLOAT_FIELDS = {"latitude", "longitude"}
+# Rows with any of these are created from their components, keeping their raw
+COMPONENT_FIELDS = (
+    "address_line_1",
+    "locality_name",
+    "state_name",
+    "postal_code",
+    "country_name",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports addresses from a CSV or JSONL file. Rows with address "
+        "components (address_line_1, locality_name, state_name, postal_code, "
+        "country_name, ...) are created from them, such as files written by "
+        "export_addresses; other rows with a raw address are looked up or "
+        "created and parsed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file to import.")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="File format. Defaults to the file extension.",
+        )
+        parser.add_argument(
+            "--raw-field",
+            default="raw",
+            help="Column or key holding the raw address. Defaults to 'raw'.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Rows imported per transaction. Defaults to 1000.",
+        )
+        parser.add_argument(
+            "--skip-parsing",
+            action="store_true",
+            help="Create the addresses without geocoding them.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="Checkpoint file. Defaults to the input path with '.checkpoint'.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore an existing checkpoint and import from the first row.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or os.path.splitext(path)[1].lstrip(".")
+        if file_format not in ("csv", "jsonl"):
+            raise CommandError("Pass --format csv or --format jsonl.")
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive.")
+
+        checkpoint = options["checkpoint"] or f"{path}.checkpoint"
+        done = 0 if options["restart"] else self.read_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(f"Resuming after row {done}")
+
+        started = time.monotonic()
+        imported = 0
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            rows = islice(self.read_rows(f, file_format), done, None)
+            while chunk := list(islice(rows, options["chunk_size"])):
+                with transaction.atomic():
+                    self.import_chunk(chunk, options)
+                done += len(chunk)
+                imported += len(chunk)
+                # Written after the commit; a chunk imported again after a crash
+                # resolves to the same Addresses
+                self.write_checkpoint(checkpoint, done)
+
+                if options["verbosity"] >= 1:
+                    self.stdout.write(
+                        f"{done} rows ({self.rate(imported, started):.0f} rows/s)"
+                    )
+
+        if os.path.exists(checkpoint):
+            os.unlink(checkpoint)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {imported} rows in {time.monotonic() - started:.1f}s "
+                f"({self.rate(imported, started):.0f} rows/s)"
+            )
+        )
+
+    def import_chunk(self, chunk, options):
+        raw_field = options["raw_field"]
+        raws = []
+        keyed = []
+        for row in chunk:
+            if any(row.get(key) for key in COMPONENT_FIELDS):
+                keyed.append({**row, "raw": row.get(raw_field)})
+            elif row.get(raw_field):
+                raws.append(row[raw_field])
+
+        if raws:
+            Address.objects.bulk_create_from_raw(
+                raws, batch_size=len(raws), skip_parsing=options["skip_parsing"]
+            )
+        if keyed:
+            create_addresses_from_keys(
+                keyed, skip_parsing=options["skip_parsing"], chunk_size=len(keyed)
+            )
+
+    def read_rows(self, f, file_format):
+        if file_format == "csv":
+            for row in csv.DictReader(f):
+                yield self.clean_row(row)
+            return
+
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise CommandError(f"Invalid JSON on line {line_number}: {e}")
+            yield self.clean_row(row)
+
+    def clean_row(self, row):
+        row = {key: (value if value != "" else None) for key, value in row.items()}
+        for key in FLOAT_FIELDS & row.keys():
+            if row[key] is not None:
+                row[key] = float(row[key])
+        return row
+
+    def read_checkpoint(self, checkpoint):
+        try:
+            with open(checkpoint) as f:
+                return json.load(f)["rows"]
+        except FileNotFoundError:
+            return 0
+
+    def write_checkpoint(self, checkpoint, rows):
+        directory = os.path.dirname(os.path.abspath(checkpoint))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"rows": rows}, f)
+        os.replace(tmp_path, checkpoint)
+
+    def rate(self, rows, started):
+        return rows / max(time.monotonic() - started, 1e-9)
@@ -0,0 +1,278 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Q
+
+from ...models import Address
+from ...models.address import UNNAMED_ADDRESS
+from ...signals import addresses_parsed
+from ...utils.uuid import generate_uuid_from_address
+
+UPDATE_FIELDS = [
+    "address_line_1",
+    "address_line_2",
+    "formatted",
+    "latitude",
+    "longitude",
+    "locality",
+    "address_id",
+    "parse_status",
+]
+
+
+def _geocode(provider, raws, refresh):
+    """
+    Geocodes raw addresses in a worker. Runs in threads or child processes, so
+    it only returns components; the database is updated by the command.
+    """
+    service = Address._get_geocoding_service(provider)
+    return service.cached_geocode_many(raws, refresh=refresh)
+
+
+def _init_process():
+    # Only needed with the spawn start method; a no-op after a fork
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        "Parses existing addresses again, e.g. after switching geocoding provider. "
+        "Geocoding runs in a thread or process pool; results are written back "
+        "with bulk_update() in chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--provider",
+            help="Geocoding provider. Defaults to ADDRESS_GEOCODER_PROVIDER.",
+        )
+        parser.add_argument(
+            "--missing-coordinates",
+            action="store_true",
+            help="Only addresses without a latitude or longitude.",
+        )
+        parser.add_argument(
+            "--unparsed",
+            action="store_true",
+            help="Only addresses without a locality.",
+        )
+        parser.add_argument(
+            "--pending",
+            action="store_true",
+            help="Only addresses whose parsing was deferred, e.g. while the "
+            "provider was unavailable.",
+        )
+        parser.add_argument(
+            "--country",
+            help="Only addresses in the country with this code or name.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of geocoding workers. Defaults to 4.",
+        )
+        parser.add_argument(
+            "--processes",
+            action="store_true",
+            help="Use a process pool instead of a thread pool.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Addresses updated per transaction. Defaults to 500.",
+        )
+        parser.add_argument(
+            "--refresh",
+            action="store_true",
+            help="Ignore cached geocoding results.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default="reparse_addresses.checkpoint",
+            help="Checkpoint file. Defaults to reparse_addresses.checkpoint.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore an existing checkpoint and start from the first address.",
+        )
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1 or options["chunk_size"] < 1:
+            raise CommandError("--workers and --chunk-size must be positive.")
+
+        provider = options["provider"]
+        try:
+            service = Address._get_geocoding_service(provider)
+        except ValueError as e:
+            raise CommandError(e)
+
+        filters = {
+            key: options[key]
+            for key in (
+                "provider",
+                "missing_coordinates",
+                "unparsed",
+                "pending",
+                "country",
+            )
+        }
+        checkpoint = options["checkpoint"]
+        last_pk = 0 if options["restart"] else self.read_checkpoint(checkpoint, filters)
+        if last_pk:
+            self.stdout.write(f"Resuming after address {last_pk}")
+
+        queryset = self.get_queryset(options).exclude(raw=None).exclude(raw="")
+        total = queryset.filter(pk__gt=last_pk).count()
+        done = updated = 0
+        started = time.monotonic()
+
+        with self.get_executor(options) as executor:
+            while True:
+                addresses = list(
+                    queryset.filter(pk__gt=last_pk)[: options["chunk_size"]]
+                )
+                if not addresses:
+                    break
+
+                results, unavailable = self.geocode(
+                    executor, provider, addresses, options
+                )
+                service.populate_many(addresses, results)
+                changed = []
+                updated_addresses = []
+                for index, (address, components) in enumerate(zip(addresses, results)):
+                    if components is not None:
+                        service.set_parse_status(address, components)
+                        if str(address) != UNNAMED_ADDRESS:
+                            address.address_id = generate_uuid_from_address(address)
+                        changed.append(address)
+                        updated_addresses.append(address)
+                    elif address.parse_status != Address.ParseStatus.OK:
+                        # Addresses parsed before keep their values and status
+                        address.parse_status = (
+                            Address.ParseStatus.PENDING
+                            if index in unavailable
+                            else Address.ParseStatus.FAILED
+                        )
+                        updated_addresses.append(address)
+
+                with transaction.atomic():
+                    Address.objects.bulk_update(updated_addresses, UPDATE_FIELDS)
+                last_pk = addresses[-1].pk
+                self.write_checkpoint(checkpoint, filters, last_pk)
+                if changed:
+                    addresses_parsed.send(
+                        sender=Address,
+                        model_name=Address._meta.model_name,
+                        address_instances=changed,
+                    )
+
+                done += len(addresses)
+                updated += len(changed)
+                self.report_progress(done, total, started)
+
+        if os.path.exists(checkpoint):
+            os.unlink(checkpoint)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Parsed {done} addresses, updated {updated}, in "
+                f"{timedelta(seconds=round(time.monotonic() - started))}"
+            )
+        )
+
+    def get_queryset(self, options):
+        queryset = Address.objects.order_by("pk")
+        if options["missing_coordinates"]:
+            queryset = queryset.filter(Q(latitude=None) | Q(longitude=None))
+        if options["unparsed"]:
+            queryset = queryset.filter(locality=None)
+        if options["pending"]:
+            queryset = queryset.filter(parse_status=Address.ParseStatus.PENDING)
+        if options["country"]:
+            # Scourgify only sets the country name, e.g. "USA" with no code
+            queryset = queryset.filter(
+                Q(locality__state__country__code__iexact=options["country"])
+                | Q(locality__state__country__name__iexact=options["country"])
+            )
+        return queryset
+
+    def get_executor(self, options):
+        if not options["processes"]:
+            return ThreadPoolExecutor(max_workers=options["workers"])
+
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        return ProcessPoolExecutor(
+            max_workers=options["workers"],
+            mp_context=context,
+            initializer=_init_process,
+        )
+
+    def geocode(self, executor, provider, addresses, options):
+        """
+        Splits the chunk between the workers, returning the components for each
+        address in order, and the indexes of the addresses whose worker failed.
+        """
+        raws = [address.raw for address in addresses]
+        if isinstance(executor, ProcessPoolExecutor):
+            # Workers are forked on submit, and must not share the parent's
+            # database connections; Django reconnects here on the next query
+            connections.close_all()
+        size = -(-len(raws) // options["workers"])
+        starts = range(0, len(raws), size)
+        futures = [
+            executor.submit(
+                _geocode, provider, raws[start : start + size], options["refresh"]
+            )
+            for start in starts
+        ]
+
+        results = []
+        unavailable = set()
+        for start, future in zip(starts, futures):
+            count = min(size, len(raws) - start)
+            try:
+                results.extend(future.result())
+            except Exception as e:
+                self.stderr.write(f"Error geocoding {count} addresses: {e}")
+                results.extend([None] * count)
+                unavailable.update(range(start, start + count))
+        return results, unavailable
+
+    def report_progress(self, done, total, started):
+        elapsed = time.monotonic() - started
+        rate = done / max(elapsed, 1e-9)
+        eta = timedelta(seconds=round(max(total - done, 0) / rate)) if rate else "?"
+        self.stdout.write(f"{done}/{total} addresses ({rate:.1f}/s, ETA {eta})")
+
+    def read_checkpoint(self, checkpoint, filters):
+        try:
+            with open(checkpoint) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return 0
+
+        if state["filters"] != filters:
+            raise CommandError(
+                f"{checkpoint} was written with different options "
+                f"({state['filters']}). Pass --restart to start over."
+            )
+        return state["last_pk"]
+
+    def write_checkpoint(self, checkpoint, filters, last_pk):
+        directory = os.path.dirname(os.path.abspath(checkpoint))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"filters": filters, "last_pk": last_pk}, f)
+        os.replace(tmp_path, checkpoint)
@@ -0,0 +1,359 @@
+import logging
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+
+from .cache import get_reference_cache
+from .signals import addresses_parsed
+from .utils.raw_key import generate_raw_key
+from .utils.uuid import generate_uuid_from_address
+
+logger = logging.getLogger(__name__)
+
+
+class AddressManager(models.Manager):
+    def get_or_create_from_raw(self, raw, defaults=None):
+        """
+        Looks up an Address by its normalized raw key, creating it when missing.
+
+        Equivalent spellings of the same raw address ("123 Main St" and
+        "123  main st ") resolve to the same Address through the indexed
+        `raw_key` column. An existing Address is returned unchanged; `defaults`
+        only apply to a new one.
+
+        Args:
+            raw (str): The raw address string.
+            defaults (dict): Extra field values used when creating the Address.
+
+        Returns:
+            tuple: The Address instance and whether it was created.
+        """
+        defaults = {"raw": raw, **(defaults or {})}
+        raw_key = generate_raw_key(raw)
+        if raw_key is None:
+            # Blank addresses have no key to match on
+            return self.create(**defaults), True
+
+        address = self.filter(raw_key=raw_key).first()
+        if address is not None:
+            return address, False
+
+        address = self.model(**defaults)
+        try:
+            address.parse_address()
+        except Exception as e:
+            logger.error("Error parsing address: %s", e)
+            address.parse_status = self.model.ParseStatus.PENDING
+        return self._create_parsed(address, raw_key)
+
+    async def aget_or_create_from_raw(self, raw, defaults=None):
+        """
+        Async counterpart of `get_or_create_from_raw()`.
+
+        A missing Address is geocoded on the event loop before it is inserted,
+        so concurrent calls overlap their provider round trips. If another
+        caller inserts the same raw key meanwhile, that Address is returned.
+
+        Returns:
+            tuple: The Address instance and whether it was created.
+        """
+        defaults = {"raw": raw, **(defaults or {})}
+        raw_key = generate_raw_key(raw)
+        if raw_key is None:
+            address = self.model(**defaults)
+            await address.asave(using=self.db)
+            return address, True
+
+        address = await sync_to_async(self.filter(raw_key=raw_key).first)()
+        if address is not None:
+            return address, False
+
+        address = self.model(**defaults)
+        try:
+            await address.aparse_address()
+        except Exception as e:
+            logger.error("Error parsing address: %s", e)
+            address.parse_status = self.model.ParseStatus.PENDING
+        return await sync_to_async(self._create_parsed)(address, raw_key)
+
+    def _create_parsed(self, address, raw_key):
+        # Another caller may have inserted the address while it was geocoded,
+        # which save() reports as a ValidationError (or the database as an
+        # IntegrityError when the insert races)
+        try:
+            with transaction.atomic(using=self.db):
+                address.save(force_insert=True, using=self.db, skip_parsing=True)
+            return address, True
+        except (IntegrityError, ValidationError):
+            return self.get(raw_key=raw_key), False
+
+    def bulk_create_from_raw(self, raws, batch_size=1000, skip_parsing=False):
+        """
+        Looks up or creates the Addresses for many raw address strings.
+
+        Raw strings are deduplicated by their normalized key, and processed in
+        batches of `batch_size` keys: existing Addresses are read with one
+        query, the rest are parsed together through the geocoding service's
+        `parse_many()` (resolving their Localities with set-based queries) and
+        inserted with one conflict-ignoring `bulk_create()`. Per-instance
+        `save()` and `address_parsed` aren't used; `addresses_parsed` is sent
+        once per batch with the new Addresses instead.
+
+        Args:
+            raws (iterable): Raw address strings.
+            batch_size (int): Number of distinct addresses per batch.
+            skip_parsing (bool): Whether to create the Addresses unparsed.
+
+        Returns:
+            list: The Address for each raw string, in order, or None for blank
+            strings.
+        """
+        raws = list(raws)
+        keys = [generate_raw_key(raw) for raw in raws]
+        distinct = {}
+        for raw, raw_key in zip(raws, keys):
+            if raw_key is not None:
+                distinct.setdefault(raw_key, raw)
+
+        service = None if skip_parsing else self.model._get_geocoding_service()
+        items = list(distinct.items())
+        addresses = {}
+        for start in range(0, len(items), batch_size):
+            addresses.update(
+                self._bulk_create_batch(
+                    dict(items[start : start + batch_size]), service
+                )
+            )
+        return [addresses.get(raw_key) for raw_key in keys]
+
+    def _bulk_create_batch(self, raws_by_key, service):
+        addresses = {
+            address.raw_key: address
+            for address in self.filter(raw_key__in=list(raws_by_key))
+        }
+        new = [
+            self.model(raw=raw, raw_key=raw_key)
+            for raw_key, raw in raws_by_key.items()
+            if raw_key not in addresses
+        ]
+        if not new:
+            return addresses
+
+        if service is not None:
+            try:
+                service.parse_many(new)
+            except Exception as e:
+                logger.error("Error parsing addresses: %s", e)
+                for address in new:
+                    address.parse_status = self.model.ParseStatus.PENDING
+        for address in new:
+            address.address_id = generate_uuid_from_address(address)
+
+        self._bulk_insert(new)
+        for address in new:
+            addresses[address.raw_key] = address
+
+        addresses_parsed.send(
+            sender=self.model,
+            model_name=self.model._meta.model_name,
+            address_instances=new,
+        )
+        return addresses
+
+    def _bulk_insert(self, addresses):
+        """
+        Inserts new Addresses with `bulk_create()` and marks them as saved.
+
+        Another worker may insert the same raw keys meanwhile, so conflicts are
+        ignored and the primary keys are read back by raw key.
+        """
+        keyed = [address for address in addresses if address.raw_key is not None]
+        self.bulk_create(keyed, ignore_conflicts=True)
+        pks = dict(
+            self.filter(raw_key__in=[address.raw_key for address in keyed]).values_list(
+                "raw_key", "pk"
+            )
+        )
+        for address in keyed:
+            address.pk = pks[address.raw_key]
+            address._state.adding = False
+            address._state.db = self.db
+
+        # Without a key there's nothing to conflict on
+        unkeyed = [address for address in addresses if address.raw_key is None]
+        self.bulk_create(unkeyed)
+
+        for address in addresses:
+            address._loaded_raw = address.raw
+
+
+class ReferenceDataManager(models.Manager):
+    def get_or_insert(self, defaults=None, **kwargs):
+        """
+        Like `get_or_create()`, but safe to race against other workers.
+
+        A missing row is inserted with `bulk_create(ignore_conflicts=True)`,
+        which the database turns into a conflict-ignoring insert (`ON CONFLICT
+        DO NOTHING` or equivalent), and then read back. A concurrent insert of
+        the same row therefore neither raises nor aborts the surrounding
+        transaction. `created` is True when the row was missing at first, even
+        if another worker inserted it first.
+
+        Raises IntegrityError if the row conflicts with an existing row on a
+        different unique constraint (e.g. a Country code used by another name).
+        """
+        instance = self._first(kwargs)
+        if instance is not None:
+            return instance, False
+
+        self.bulk_create(
+            [self.model(**kwargs, **(defaults or {}))], ignore_conflicts=True
+        )
+        instance = self._first(kwargs)
+        if instance is None:
+            raise IntegrityError(
+                f"Could not insert {self.model._meta.object_name} {kwargs}: it "
+                "conflicts with an existing row."
+            )
+        return instance, True
+
+    def _first(self, lookup):
+        # Localities without a postal code aren't covered by the unique
+        # constraint, so duplicates are possible; use the oldest.
+        return self.filter(**lookup).order_by("pk").first()
+
+    def get_or_create_cached(self, defaults=None, **kwargs):
+        """
+        Like `get_or_insert()`, but remembers the result in the process-local
+        reference cache, so resolving the same natural key again doesn't query.
+
+        Instances are only cached once the surrounding transaction commits, so a
+        rollback can't leave a missing primary key behind. Cached instances are
+        shared, and shouldn't be modified.
+        """
+        reference_cache = get_reference_cache()
+        if reference_cache is None:
+            return self.get_or_insert(defaults=defaults, **kwargs)
+
+        key = self._cache_key(kwargs)
+        instance = reference_cache.get(key)
+        if instance is not None:
+            return instance, False
+
+        instance, created = self.get_or_insert(defaults=defaults, **kwargs)
+        transaction.on_commit(
+            partial(reference_cache.set, key, instance), using=self.db
+        )
+        return instance, created
+
+    def get_or_create_cached_many(self, lookups, defaults=None):
+        """
+        Resolves several natural keys at once, returning the instances in the
+        order of `lookups`.
+
+        Keys missing from the reference cache are read with one set-based query,
+        the rows still missing are inserted with a single conflict-ignoring
+        `bulk_create()`, and those are read back with another query. `lookups`
+        are dicts of `get_or_create()` keyword arguments, all with the same
+        keys; `defaults` is an optional parallel list of defaults.
+        """
+        lookups = list(lookups)
+        if defaults is None:
+            defaults = [None] * len(lookups)
+        reference_cache = get_reference_cache()
+
+        keys = []
+        resolved = {}
+        missing = {}
+        for lookup, lookup_defaults in zip(lookups, defaults):
+            key = self._cache_key(lookup)
+            keys.append(key)
+            if key in resolved or key in missing:
+                continue
+            instance = None if reference_cache is None else reference_cache.get(key)
+            if instance is not None:
+                resolved[key] = instance
+            else:
+                missing[key] = (lookup, lookup_defaults)
+
+        if missing:
+            found = self._find_many(missing)
+            new = [
+                self.model(**lookup, **(lookup_defaults or {}))
+                for key, (lookup, lookup_defaults) in missing.items()
+                if key not in found
+            ]
+            if new:
+                self.bulk_create(new, ignore_conflicts=True)
+                found.update(
+                    self._find_many(
+                        {key: missing[key] for key in missing if key not in found}
+                    )
+                )
+
+            for key, (lookup, _) in missing.items():
+                if key not in found:
+                    raise IntegrityError(
+                        f"Could not insert {self.model._meta.object_name} "
+                        f"{lookup}: it conflicts with an existing row."
+                    )
+            resolved.update(found)
+            if reference_cache is not None:
+                transaction.on_commit(
+                    partial(_set_many, reference_cache, found), using=self.db
+                )
+
+        return [resolved[key] for key in keys]
+
+    def _cache_key(self, lookup):
+        return (
+            self.db,
+            self.model._meta.label,
+            tuple(
+                sorted(
+                    (name, value.pk if isinstance(value, models.Model) else value)
+                    for name, value in lookup.items()
+                )
+            ),
+        )
+
+    def _find_many(self, missing, chunk_size=500):
+        """
+        Returns the existing rows for `{key: (lookup, defaults)}`, by key.
+        """
+        found = {}
+        items = list(missing.values())
+        for start in range(0, len(items), chunk_size):
+            chunk = [lookup for lookup, _ in items[start : start + chunk_size]]
+            names = list(chunk[0])
+            fields = [self.model._meta.get_field(name) for name in names]
+
+            # Narrow down with one IN per column, then match exactly below
+            query = models.Q()
+            for name in names:
+                values = {
+                    value.pk if isinstance(value, models.Model) else value
+                    for value in (lookup[name] for lookup in chunk)
+                }
+                condition = models.Q(**{f"{name}__in": values - {None}})
+                if None in values:
+                    condition |= models.Q(**{f"{name}__isnull": True})
+                query &= condition
+
+            for instance in self.filter(query).order_by("pk"):
+                key = self._cache_key(
+                    {
+                        name: getattr(instance, field.attname)
+                        for name, field in zip(names, fields)
+                    }
+                )
+                if key in missing:
+                    found.setdefault(key, instance)
+        return found
+
+
+def _set_many(cache, items):
+    for key, value in items.items():
+        cache.set(key, value)
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "autoparsed_address_field",
+            "0002_address_address_id_alter_address_address_line_1_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="address",
+            name="raw_key",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="SHA-256 of the normalized raw address, used for lookups",
+                max_length=64,
+                null=True,
+                verbose_name="Raw Address Key",
+            ),
+        ),
+    ]
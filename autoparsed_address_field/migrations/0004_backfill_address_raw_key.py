@@ -0,0 +1,58 @@
+from django.db import migrations, transaction
+
+from autoparsed_address_field.utils.raw_key import generate_raw_key
+
+BATCH_SIZE = 2000
+
+
+def backfill_raw_key(apps, schema_editor):
+    """
+    Fills `raw_key` in primary key order, committing one chunk at a time.
+
+    When several existing rows normalize to the same key, only the oldest one
+    receives it; the duplicates keep a NULL key so the unique index added by the
+    next migration can be built.
+    """
+    Address = apps.get_model("autoparsed_address_field", "Address")
+    db_alias = schema_editor.connection.alias
+    addresses = Address.objects.using(db_alias)
+
+    last_pk = 0
+    while True:
+        with transaction.atomic(using=db_alias):
+            batch = list(
+                addresses.filter(pk__gt=last_pk, raw_key__isnull=True)
+                .order_by("pk")
+                .only("pk", "raw")[:BATCH_SIZE]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            keyed = {}
+            for address in batch:
+                raw_key = generate_raw_key(address.raw)
+                if raw_key and raw_key not in keyed:
+                    keyed[raw_key] = address
+
+            taken = set(
+                addresses.filter(raw_key__in=keyed).values_list("raw_key", flat=True)
+            )
+            updated = []
+            for raw_key, address in keyed.items():
+                if raw_key not in taken:
+                    address.raw_key = raw_key
+                    updated.append(address)
+            addresses.bulk_update(updated, ["raw_key"])
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("autoparsed_address_field", "0003_address_raw_key"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_raw_key, migrations.RunPython.noop),
+    ]
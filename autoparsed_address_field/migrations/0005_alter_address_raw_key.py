@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("autoparsed_address_field", "0004_backfill_address_raw_key"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="address",
+            name="raw_key",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="SHA-256 of the normalized raw address, used for lookups",
+                max_length=64,
+                null=True,
+                unique=True,
+                verbose_name="Raw Address Key",
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("autoparsed_address_field", "0005_alter_address_raw_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="address",
+            name="parse_status",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("ok", "Parsed"),
+                    ("failed", "Failed"),
+                    ("pending", "Pending"),
+                ],
+                db_index=True,
+                default="",
+                help_text="Pending addresses couldn't be geocoded yet, and are retried",
+                max_length=16,
+                verbose_name="Parse Status",
+            ),
+            preserve_default=False,
+        ),
+    ]
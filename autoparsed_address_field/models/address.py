@@ -1,18 +1,30 @@
 import logging
 
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.db import models, router
 from django.utils.translation import gettext_lazy as _
 
-from ..services import ArcGISGeocodingService, ScourgifyGeocodingService
+from ..managers import AddressManager
+from ..services.registry import get_geocoding_service
 from ..signals import address_parsed
+from ..utils.raw_key import generate_raw_key
 from ..utils.uuid import generate_uuid_from_address
 
 UNNAMED_ADDRESS = "Unnamed Address"
 
+# Marks an instance whose raw value was never loaded from the database
+_RAW_NOT_LOADED = object()
+
 logger = logging.getLogger(__name__)
 
 
 class Address(models.Model):
+    class ParseStatus(models.TextChoices):
+        OK = "ok", _("Parsed")
+        FAILED = "failed", _("Failed")
+        PENDING = "pending", _("Pending")
+
     address_line_1 = models.CharField(
         _("Address Line 1"), max_length=255, blank=True, null=True
     )
@@ -28,33 +40,144 @@ class Address(models.Model):
         verbose_name=_("Locality"),
     )
     raw = models.TextField(_("Raw Address"), blank=True, null=True)
+    raw_key = models.CharField(
+        _("Raw Address Key"),
+        max_length=64,
+        unique=True,
+        blank=True,
+        null=True,
+        editable=False,
+        help_text=_("SHA-256 of the normalized raw address, used for lookups"),
+    )
     formatted = models.TextField(_("Formatted Address"), blank=True, null=True)
     latitude = models.FloatField(_("Latitude"), blank=True, null=True)
     longitude = models.FloatField(_("Longitude"), blank=True, null=True)
 
     address_id = models.TextField(blank=True, db_index=True)
+    parse_status = models.CharField(
+        _("Parse Status"),
+        max_length=16,
+        choices=ParseStatus.choices,
+        blank=True,
+        db_index=True,
+        help_text=_("Pending addresses couldn't be geocoded yet, and are retried"),
+    )
+
+    objects = AddressManager()
 
     class Meta:
         verbose_name_plural = _("Addresses")
 
-    def save(self, *args, skip_parsing=False, **kwargs):
-        if not skip_parsing:
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_raw = instance.__dict__.get("raw", _RAW_NOT_LOADED)
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        if "raw" in self.__dict__ and (fields is None or "raw" in fields):
+            self._loaded_raw = self.raw
+
+    def save(self, *args, skip_parsing=False, force_parsing=False, **kwargs):
+        """
+        Saves the address, parsing it first when the raw text has changed.
+
+        Parsing only runs for new addresses, or when `raw` differs from the value
+        loaded from the database, so saving unrelated field changes doesn't
+        geocode again. Pass `force_parsing=True` to parse regardless, or
+        `skip_parsing=True` to never parse.
+
+        If the provider is unavailable (e.g. its circuit breaker is open), the
+        Address is saved unparsed with `parse_status` set to pending.
+
+        Raises ValidationError when the normalized raw text belongs to another
+        Address; use `Address.objects.get_or_create_from_raw()` to reuse it.
+        """
+        raw_changed = self.raw_has_changed()
+        if raw_changed:
+            self.raw_key = generate_raw_key(self.raw)
+            self._validate_raw_key(self.raw_key, kwargs.get("using"))
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "raw" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "raw_key", "parse_status"}
+
+        if force_parsing or (raw_changed and not skip_parsing):
             if self.raw:
                 try:
                     self.parse_address()
                 except Exception as e:
                     logger.error(_("Error parsing address: %s"), e)
-        print(str(self))
+                    self.parse_status = self.ParseStatus.PENDING
         if str(self) != UNNAMED_ADDRESS:
             self.address_id = generate_uuid_from_address(self)
 
         super().save(*args, **kwargs)
+        self._loaded_raw = self.__dict__.get("raw", _RAW_NOT_LOADED)
         self._send_parsed_signal()
 
+    async def asave(self, *args, skip_parsing=False, force_parsing=False, **kwargs):
+        """
+        Async counterpart of `save()`. Parsing geocodes without blocking the
+        event loop; the Address is then saved in Django's sync thread.
+        """
+        if force_parsing or (self.raw_has_changed() and not skip_parsing):
+            if self.raw:
+                try:
+                    await self.aparse_address()
+                except Exception as e:
+                    logger.error(_("Error parsing address: %s"), e)
+                    self.parse_status = self.ParseStatus.PENDING
+
+        await sync_to_async(self.save)(*args, skip_parsing=True, **kwargs)
+
+    def validate_unique(self, exclude=None):
+        super().validate_unique(exclude=exclude)
+        if exclude is None or "raw" not in exclude:
+            self._validate_raw_key(generate_raw_key(self.raw))
+
+    def _validate_raw_key(self, raw_key, using=None):
+        """
+        Raises ValidationError when another Address has the same raw key.
+        """
+        if raw_key is None:
+            return
+        using = using or router.db_for_write(self.__class__, instance=self)
+        duplicates = self.__class__._default_manager.using(using).filter(
+            raw_key=raw_key
+        )
+        if self.pk is not None:
+            duplicates = duplicates.exclude(pk=self.pk)
+        if duplicates.exists():
+            raise ValidationError(
+                {
+                    "raw": ValidationError(
+                        _("An address with this raw text already exists."),
+                        code="unique",
+                    )
+                }
+            )
+
+    def raw_has_changed(self):
+        """
+        Returns whether `raw` differs from the value loaded from the database.
+        """
+        if self._state.adding:
+            return True
+        if "raw" not in self.__dict__:
+            # Deferred and never accessed, so it can't have been modified
+            return False
+        loaded_raw = getattr(self, "_loaded_raw", _RAW_NOT_LOADED)
+        return loaded_raw is _RAW_NOT_LOADED or self.raw != loaded_raw
+
     def parse_address(self):
         geocoding_service = self._get_geocoding_service()
         geocoding_service.parse(self)
 
+    async def aparse_address(self):
+        geocoding_service = self._get_geocoding_service()
+        await geocoding_service.aparse(self)
+
     def _send_parsed_signal(self):
         address_parsed.send(
             sender=self.__class__,
@@ -62,16 +185,9 @@ class Address(models.Model):
             address_instance=self,
         )
 
-    def _get_geocoding_service(self):
-        from django.conf import settings
-
-        provider = getattr(settings, "ADDRESS_GEOCODER_PROVIDER", "scourgify")
-        if provider == "arcgis":
-            return ArcGISGeocodingService()
-        elif provider == "scourgify":
-            return ScourgifyGeocodingService()
-        else:
-            raise ValueError(_("Unsupported geocoding provider: %s") % provider)
+    @classmethod
+    def _get_geocoding_service(cls, provider=None):
+        return get_geocoding_service(provider)
 
     def __str__(self):
         return self.formatted if self.formatted else (self.raw or UNNAMED_ADDRESS)
@@ -3,6 +3,8 @@ import logging
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from ..managers import ReferenceDataManager
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,6 +21,8 @@ class Country(models.Model):
         help_text=_("ISO 3166-1 alpha-2 or alpha-3 codes"),
     )
 
+    objects = ReferenceDataManager()
+
     class Meta:
         verbose_name_plural = _("Countries")
 
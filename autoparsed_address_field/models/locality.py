@@ -3,6 +3,8 @@ import logging
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from ..managers import ReferenceDataManager
+
 logger = logging.getLogger(__name__)
 
 
@@ -18,6 +20,8 @@ class Locality(models.Model):
         verbose_name=_("State"),
     )
 
+    objects = ReferenceDataManager()
+
     class Meta:
         unique_together = ("name", "postal_code", "state")
         verbose_name_plural = _("Localities")
@@ -3,6 +3,8 @@ import logging
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from ..managers import ReferenceDataManager
+
 logger = logging.getLogger(__name__)
 
 
@@ -16,6 +18,8 @@ class State(models.Model):
         verbose_name=_("Country"),
     )
 
+    objects = ReferenceDataManager()
+
     class Meta:
         unique_together = ("name", "country")
         verbose_name_plural = _("States")
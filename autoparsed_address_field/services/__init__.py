@@ -1,4 +1,13 @@
 from .arcgis import ArcGISGeocodingService
+from .chain import ChainedGeocodingService
+from .registry import get_geocoding_service, register_provider, unregister_provider
 from .scourgify import ScourgifyGeocodingService
 
-__all__ = ["ArcGISGeocodingService", "ScourgifyGeocodingService"]
+__all__ = [
+    "ArcGISGeocodingService",
+    "ChainedGeocodingService",
+    "ScourgifyGeocodingService",
+    "get_geocoding_service",
+    "register_provider",
+    "unregister_provider",
+]
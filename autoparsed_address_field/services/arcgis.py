@@ -1,56 +1,449 @@
+import asyncio
+import json
 import logging
+import os
+import threading
+import weakref
+from functools import partial
 
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from geopy.adapters import AioHTTPAdapter, RequestsAdapter
+from geopy.exc import GeocoderServiceError
 from geopy.geocoders import ArcGIS
-from ..models import Country, State, Locality
+from geopy.geocoders.base import DEFAULT_SENTINEL
+from geopy.location import Location
+from ..throttling import CircuitBreaker, TokenBucket
+from .base import BaseGeocodingService, finalize_with_loop
 
 logger = logging.getLogger(__name__)
 
+# Used when the service doesn't advertise a suggested batch size
+DEFAULT_BATCH_SIZE = 150
+
+# Consecutive failures that open the circuit breaker, and seconds it stays open
+DEFAULT_CIRCUIT_BREAKER_THRESHOLD = 5
+DEFAULT_CIRCUIT_BREAKER_TIMEOUT = 30
+
+# Seconds a geocode may wait for the rate limiter before giving up
+DEFAULT_RATE_LIMIT_WAIT = 1
+
+_geolocator = None
+_geolocator_lock = threading.Lock()
+
+_rate_limiter = None
+_circuit_breaker = None
+_throttling_lock = threading.Lock()
+
+# aiohttp sessions belong to the event loop they were created on. Each entry
+# holds the geolocator and the async generator that closes it with the loop.
+_async_geolocators = weakref.WeakKeyDictionary()
+
+
+class PooledAioHTTPAdapter(AioHTTPAdapter):
+    """
+    geopy's aiohttp adapter, keeping at most `pool_size` connections open.
+    """
+
+    def __init__(self, *, pool_size, **kwargs):
+        super().__init__(**kwargs)
+        self.pool_size = pool_size
+
+    @property
+    def session(self):
+        session = self.__dict__.get("session")
+        if session is None:
+            import aiohttp
+
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                trust_env=False,
+                raise_for_status=False,
+            )
+            self.__dict__["session"] = session
+        return session
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        # Don't create a session just to close it
+        session = self.__dict__.pop("session", None)
+        if session is not None:
+            await session.close()
+
+
+def _geolocator_options():
+    return {
+        "scheme": getattr(settings, "ADDRESS_ARCGIS_SCHEME", None),
+        "domain": getattr(settings, "ADDRESS_ARCGIS_DOMAIN", "geocode.arcgis.com"),
+        "timeout": getattr(settings, "ADDRESS_ARCGIS_TIMEOUT", DEFAULT_SENTINEL),
+    }
+
+
+def get_geolocator():
+    """
+    Returns the process-wide ArcGIS geolocator, creating it on first use.
+
+    The geolocator is shared by every thread and keeps a pooled HTTP session,
+    so connections to ArcGIS are reused between geocodes. It is configured by
+    the `ADDRESS_ARCGIS_*` settings and recreated after a fork.
+    """
+    global _geolocator
+
+    with _geolocator_lock:
+        if _geolocator is None:
+            pool_size = getattr(settings, "ADDRESS_ARCGIS_POOL_SIZE", 10)
+            _geolocator = ArcGIS(
+                **_geolocator_options(),
+                adapter_factory=partial(
+                    RequestsAdapter,
+                    pool_connections=pool_size,
+                    pool_maxsize=pool_size,
+                    max_retries=getattr(settings, "ADDRESS_ARCGIS_MAX_RETRIES", 2),
+                ),
+            )
+        return _geolocator
+
+
+def get_async_geolocator():
+    """
+    Returns the ArcGIS geolocator for the running event loop, created on first
+    use with an aiohttp session of `ADDRESS_ARCGIS_POOL_SIZE` connections.
+
+    Requires aiohttp (the `async` extra). The session is closed when the loop
+    shuts down its async generators, as `asyncio.run()` and `async_to_sync()`
+    do before closing it, or earlier by `aclose_async_geolocator()`.
+    """
+    loop = asyncio.get_running_loop()
+    entry = _async_geolocators.get(loop)
+    if entry is None:
+        geolocator = ArcGIS(
+            **_geolocator_options(),
+            adapter_factory=partial(
+                PooledAioHTTPAdapter,
+                pool_size=getattr(settings, "ADDRESS_ARCGIS_POOL_SIZE", 10),
+            ),
+        )
+        closer = finalize_with_loop(_close_with_loop(loop, geolocator))
+        entry = _async_geolocators[loop] = (geolocator, closer)
+    return entry[0]
+
+
+async def _close_with_loop(loop, geolocator):
+    try:
+        yield
+    finally:
+        if _async_geolocators.get(loop, (None,))[0] is geolocator:
+            del _async_geolocators[loop]
+        await geolocator.__aexit__(None, None, None)
+
+
+async def aclose_async_geolocator():
+    """
+    Closes the running event loop's ArcGIS geolocator, if it has one.
+    """
+    entry = _async_geolocators.get(asyncio.get_running_loop())
+    if entry is not None:
+        await entry[1].aclose()
+
+
+def reset_geolocator():
+    """
+    Drops the process-wide geolocator so the next geocode creates a new one.
+    """
+    global _geolocator
+
+    with _geolocator_lock:
+        _geolocator = None
+    # Sessions can't be closed from sync code; each loop finalizes the dropped
+    # generators, which closes them
+    _async_geolocators.clear()
+
+
+def get_rate_limiter():
+    """
+    Returns the process-wide token bucket limiting ArcGIS requests to
+    `ADDRESS_ARCGIS_RATE_LIMIT` per second, or None when it isn't set.
+    """
+    global _rate_limiter
+
+    rate = getattr(settings, "ADDRESS_ARCGIS_RATE_LIMIT", None)
+    if not rate:
+        return None
+
+    with _throttling_lock:
+        if _rate_limiter is None:
+            _rate_limiter = TokenBucket(
+                rate, burst=getattr(settings, "ADDRESS_ARCGIS_RATE_LIMIT_BURST", None)
+            )
+        return _rate_limiter
+
+
+def get_circuit_breaker():
+    """
+    Returns the process-wide ArcGIS circuit breaker, or None when
+    `ADDRESS_ARCGIS_CIRCUIT_BREAKER_THRESHOLD` is 0.
+    """
+    global _circuit_breaker
+
+    threshold = getattr(
+        settings,
+        "ADDRESS_ARCGIS_CIRCUIT_BREAKER_THRESHOLD",
+        DEFAULT_CIRCUIT_BREAKER_THRESHOLD,
+    )
+    if not threshold:
+        return None
+
+    with _throttling_lock:
+        if _circuit_breaker is None:
+            _circuit_breaker = CircuitBreaker(
+                threshold,
+                timeout=getattr(
+                    settings,
+                    "ADDRESS_ARCGIS_CIRCUIT_BREAKER_TIMEOUT",
+                    DEFAULT_CIRCUIT_BREAKER_TIMEOUT,
+                ),
+            )
+        return _circuit_breaker
+
+
+def reset_throttling():
+    """
+    Drops the rate limiter and circuit breaker, closing the circuit.
+    """
+    global _rate_limiter, _circuit_breaker
+
+    with _throttling_lock:
+        _rate_limiter = None
+        _circuit_breaker = None
+
+
+def _reset_geolocator_after_fork():
+    global _geolocator, _geolocator_lock, _rate_limiter, _circuit_breaker
+    global _throttling_lock
+
+    # The parent's session sockets and lock state can't be shared with a child
+    _geolocator = None
+    _geolocator_lock = threading.Lock()
+    _async_geolocators.clear()
+    _rate_limiter = None
+    _circuit_breaker = None
+    _throttling_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_geolocator_after_fork)
+
+
+@receiver(setting_changed)
+def _reset_geolocator_on_setting_changed(setting, **kwargs):
+    if setting.startswith("ADDRESS_ARCGIS_"):
+        reset_geolocator()
+        reset_throttling()
+
 
 # Service Classes for Geocoding
-class ArcGISGeocodingService:
-    def parse(self, address_instance):
-        geolocator = ArcGIS()
-        result = geolocator.geocode(
-            address_instance.raw, exactly_one=True, out_fields="*"
+class ArcGISGeocodingService(BaseGeocodingService):
+    name = "arcgis"
+
+    def __init__(self):
+        self._batch_size = None
+
+    def geocode(self, raw):
+        geolocator = get_geolocator()
+        result = self._throttled(
+            geolocator.geocode, raw, exactly_one=True, out_fields="*"
+        )
+        return self._components_from_result(raw, result)
+
+    async def ageocode(self, raw):
+        geolocator = get_async_geolocator()
+        result = await self._athrottled(
+            geolocator.geocode, raw, exactly_one=True, out_fields="*"
+        )
+        return self._components_from_result(raw, result)
+
+    def _throttled(self, call, *args, **kwargs):
+        """
+        Makes a request through the rate limiter and circuit breaker. While
+        the circuit is open, CircuitOpenError is raised without a request.
+        """
+        rate_limiter = get_rate_limiter()
+        if rate_limiter is not None:
+            rate_limiter.acquire(self._rate_limit_wait())
+        circuit_breaker = get_circuit_breaker()
+        if circuit_breaker is None:
+            return call(*args, **kwargs)
+
+        circuit_breaker.before_call()
+        try:
+            result = call(*args, **kwargs)
+        except Exception:
+            circuit_breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled, e.g. by asyncio or a KeyboardInterrupt
+            circuit_breaker.release()
+            raise
+        circuit_breaker.record_success()
+        return result
+
+    async def _athrottled(self, call, *args, **kwargs):
+        rate_limiter = get_rate_limiter()
+        if rate_limiter is not None:
+            wait = rate_limiter.reserve(self._rate_limit_wait())
+            if wait:
+                await asyncio.sleep(wait)
+        circuit_breaker = get_circuit_breaker()
+        if circuit_breaker is None:
+            return await call(*args, **kwargs)
+
+        circuit_breaker.before_call()
+        try:
+            result = await call(*args, **kwargs)
+        except Exception:
+            circuit_breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled, e.g. by asyncio or a KeyboardInterrupt
+            circuit_breaker.release()
+            raise
+        circuit_breaker.record_success()
+        return result
+
+    def _rate_limit_wait(self):
+        return getattr(
+            settings, "ADDRESS_ARCGIS_RATE_LIMIT_WAIT", DEFAULT_RATE_LIMIT_WAIT
         )
 
+    def _components_from_result(self, raw, result):
         if not result or ("score" in result.raw and result.raw["score"] < 90):
-            logger.error(
-                f"ArcGIS could not geocode the address: {address_instance.raw}"
-            )
-            return
+            logger.error(f"ArcGIS could not geocode the address: {raw}")
+            return None
 
         attributes = result.raw.get("attributes", {})
-        self._populate_address_from_attributes(address_instance, attributes, result)
+        return self._components_from_attributes(attributes, result)
 
-    def _populate_address_from_attributes(self, address_instance, attributes, result):
+    def geocode_many(self, raws):
+        """
+        Geocodes raw addresses through the ArcGIS `geocodeAddresses` batch
+        operation, in chunks no larger than the service allows.
 
-        address_instance.address_line_1 = attributes.get(
-            "StAddr", result.address.split(",")[0]
-        ).upper()
-        address_instance.address_line_2 = attributes.get("SubAddr", "").upper()
+        Batch geocoding requires an ArcGIS API key or token in
+        `ADDRESS_ARCGIS_API_KEY`; without one, each address is geocoded on its
+        own.
+        """
+        if not getattr(settings, "ADDRESS_ARCGIS_API_KEY", None):
+            return super().geocode_many(raws)
+
+        raws = list(raws)
+        results = [None] * len(raws)
+        batch_size = self.get_batch_size()
+        for start in range(0, len(raws), batch_size):
+            batch = raws[start : start + batch_size]
+            for index, components in self._geocode_batch(batch).items():
+                results[start + index] = components
+        return results
+
+    def get_batch_size(self):
+        """
+        Returns `ADDRESS_ARCGIS_BATCH_SIZE`, or the batch size suggested by the
+        geocode service (capped at its maximum), fetched once per process.
+        """
+        batch_size = getattr(settings, "ADDRESS_ARCGIS_BATCH_SIZE", None)
+        if batch_size:
+            return batch_size
+
+        if self._batch_size is None:
+            properties = self._request("GET", "").get("locatorProperties", {})
+            batch_size = properties.get("SuggestedBatchSize") or DEFAULT_BATCH_SIZE
+            max_batch_size = properties.get("MaxBatchSize")
+            self._batch_size = (
+                min(batch_size, max_batch_size) if max_batch_size else batch_size
+            )
+        return self._batch_size
+
+    def _geocode_batch(self, raws):
+        records = [
+            {"attributes": {"OBJECTID": index, "SingleLine": raw}}
+            for index, raw in enumerate(raws)
+        ]
+        response = self._request(
+            "POST",
+            "geocodeAddresses",
+            {"addresses": json.dumps({"records": records}), "outFields": "*"},
+        )
+
+        # Locations come back in any order; ResultID is the record's OBJECTID
+        results = {}
+        for location in response.get("locations", []):
+            attributes = location.get("attributes", {})
+            index = attributes.get("ResultID")
+            point = location.get("location") or {}
+            if index is None or not 0 <= index < len(raws):
+                continue
+            if location.get("score", 0) < 90 or point.get("x") is None:
+                logger.error(f"ArcGIS could not geocode the address: {raws[index]}")
+                continue
+
+            result = Location(location["address"], (point["y"], point["x"]), location)
+            results[index] = self._components_from_attributes(attributes, result)
+        return results
+
+    def _request(self, method, operation, params=None):
+        """
+        Calls a GeocodeServer operation through the shared geolocator's session.
+        """
+        return self._throttled(self._send_request, method, operation, params)
+
+    def _send_request(self, method, operation, params):
+        geolocator = get_geolocator()
+        url = geolocator.api.rsplit("/", 1)[0]
+        if operation:
+            url = f"{url}/{operation}"
+
+        params = {**(params or {}), "f": "json"}
+        token = getattr(settings, "ADDRESS_ARCGIS_API_KEY", None)
+        if token:
+            params["token"] = token
+
+        session = geolocator.adapter.session
+        if method == "GET":
+            response = session.get(url, params=params, timeout=geolocator.timeout)
+        else:
+            response = session.post(url, data=params, timeout=geolocator.timeout)
+        response.raise_for_status()
+
+        payload = response.json()
+        if "error" in payload:
+            raise GeocoderServiceError(str(payload["error"]))
+        return payload
+
+    def _components_from_attributes(self, attributes, result):
+        address_line_1 = attributes.get("StAddr", result.address.split(",")[0]).upper()
+        address_line_2 = attributes.get("SubAddr", "").upper()
         locality_name = attributes.get("City", "").upper()
         state_name = attributes.get("Region", "").upper()
         state_code = attributes.get("RegionAbbr", "").upper()
         postal_code = attributes.get("Postal", "").upper()
         country_code = attributes.get("Country", "USA")
 
-        address_instance.formatted = (
-            f"{address_instance.address_line_1 or ''}"
-            f"{', ' + address_instance.address_line_2 if address_instance.address_line_2 else ''}, "
+        formatted = (
+            f"{address_line_1 or ''}"
+            f"{', ' + address_line_2 if address_line_2 else ''}, "
             f"{locality_name or ''}, {state_name or ''} {postal_code or ''}".strip(", ")
         ).upper()
 
         location = result.raw.get("location", {})
-        address_instance.latitude = location.get("y", None)
-        address_instance.longitude = location.get("x", None)
-
-        country, _ = Country.objects.get_or_create(
-            name=country_code, defaults={"code": country_code}
-        )
-        state, _ = State.objects.get_or_create(
-            name=state_name, country=country, defaults={"code": state_code}
-        )
-        address_instance.locality, _ = Locality.objects.get_or_create(
-            name=locality_name, postal_code=postal_code, state=state
-        )
+        return {
+            "address_line_1": address_line_1,
+            "address_line_2": address_line_2,
+            "formatted": formatted,
+            "latitude": location.get("y", None),
+            "longitude": location.get("x", None),
+            "locality_name": locality_name,
+            "postal_code": postal_code,
+            "state_name": state_name,
+            "state_code": state_code,
+            "country_name": country_code,
+            "country_code": country_code,
+        }
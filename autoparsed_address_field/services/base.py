@@ -0,0 +1,327 @@
+import asyncio
+import logging
+import os
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from ..cache import get_geocode_cache
+from ..coalescing import SingleFlight
+from ..models import Country, State, Locality
+from ..utils.raw_key import generate_raw_key
+
+logger = logging.getLogger(__name__)
+
+# Geocodes in flight per event loop, unless ADDRESS_ASYNC_CONCURRENCY is set
+DEFAULT_ASYNC_CONCURRENCY = 100
+
+# A contended semaphore refers to its loop, so entries are dropped when the
+# loop shuts down rather than when it is collected
+_async_semaphores = weakref.WeakKeyDictionary()
+
+
+def finalize_with_loop(agen):
+    """
+    Starts an async generator on the running event loop, which finalizes it
+    when it shuts down its async generators, as `asyncio.run()` and
+    `async_to_sync()` do before closing it. Returns the generator.
+    """
+    try:
+        agen.asend(None).send(None)
+    except StopIteration:
+        pass
+    return agen
+
+
+def get_async_semaphore():
+    """
+    Returns the semaphore bounding the geocodes in flight on the running event
+    loop, sized by `ADDRESS_ASYNC_CONCURRENCY`.
+    """
+    loop = asyncio.get_running_loop()
+    entry = _async_semaphores.get(loop)
+    if entry is None:
+        semaphore = asyncio.Semaphore(
+            getattr(settings, "ADDRESS_ASYNC_CONCURRENCY", DEFAULT_ASYNC_CONCURRENCY)
+        )
+        entry = _async_semaphores[loop] = (
+            semaphore,
+            finalize_with_loop(_drop_with_loop(loop, semaphore)),
+        )
+    return entry[0]
+
+
+async def _drop_with_loop(loop, semaphore):
+    try:
+        yield
+    finally:
+        if _async_semaphores.get(loop, (None,))[0] is semaphore:
+            del _async_semaphores[loop]
+
+
+@receiver(setting_changed)
+def _reset_async_semaphores(setting, **kwargs):
+    if setting == "ADDRESS_ASYNC_CONCURRENCY":
+        _async_semaphores.clear()
+
+
+# Concurrent geocodes of the same raw address share one provider call
+_flights = SingleFlight()
+
+
+def get_single_flight():
+    """
+    Returns the SingleFlight coalescing cached geocodes in this process, or
+    None when `ADDRESS_GEOCODE_COALESCING` is False.
+    """
+    if not getattr(settings, "ADDRESS_GEOCODE_COALESCING", True):
+        return None
+    return _flights
+
+
+def _reset_single_flight_after_fork():
+    global _flights
+
+    # Calls in flight in the parent never finish in the child
+    _flights = SingleFlight()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_single_flight_after_fork)
+
+
+class BaseGeocodingService:
+    """
+    Base class for geocoding services.
+
+    Subclasses implement `geocode()`, which turns a raw address into a dict of
+    address components (see `populate()` for the keys), and may override
+    `geocode_many()` when the provider has a batch API. Results are cached per
+    provider and normalized raw address, so repeated raw strings don't call the
+    provider again, and concurrent parses of the same raw address share one
+    provider call.
+
+    The `a`-prefixed methods are async counterparts for use under ASGI. They
+    geocode through `ageocode()` without blocking the event loop, at most
+    `ADDRESS_ASYNC_CONCURRENCY` at a time per loop.
+    """
+
+    name = None
+
+    def parse(self, address_instance):
+        components = self.cached_geocode(address_instance.raw)
+        if components is not None:
+            self.populate(address_instance, components)
+        self.set_parse_status(address_instance, components)
+
+    def parse_many(self, address_instances):
+        """
+        Parses several Addresses, geocoding the raw strings that aren't cached
+        together through `geocode_many()`.
+        """
+        address_instances = list(address_instances)
+        results = self.cached_geocode_many(
+            [address_instance.raw for address_instance in address_instances]
+        )
+        self.populate_many(address_instances, results)
+        for address_instance, components in zip(address_instances, results):
+            self.set_parse_status(address_instance, components)
+
+    async def aparse(self, address_instance):
+        """
+        Async counterpart of `parse()`. Resolving the Locality runs in Django's
+        sync thread, like any other ORM call from async code.
+        """
+        components = await self.acached_geocode(address_instance.raw)
+        if components is not None:
+            await sync_to_async(self.populate)(address_instance, components)
+        self.set_parse_status(address_instance, components)
+
+    def set_parse_status(self, address_instance, components):
+        address_instance.parse_status = (
+            address_instance.ParseStatus.OK
+            if components is not None
+            else address_instance.ParseStatus.FAILED
+        )
+
+    def geocode(self, raw):
+        """
+        Returns the address components for a raw address, or None when the
+        provider can't geocode it.
+        """
+        raise NotImplementedError
+
+    def geocode_many(self, raws):
+        """
+        Returns the address components (or None) for each raw address, in order.
+        """
+        return [self.geocode(raw) for raw in raws]
+
+    async def ageocode(self, raw):
+        """
+        Async counterpart of `geocode()`. Runs `geocode()` in a worker thread;
+        services with an async HTTP client override it.
+        """
+        return await sync_to_async(self.geocode, thread_sensitive=False)(raw)
+
+    def cached_geocode(self, raw):
+        flights, key = self._flight(raw)
+        if flights is None:
+            return self._cached_geocode(raw)
+        return flights.do(key, lambda: self._cached_geocode(raw))
+
+    def _cached_geocode(self, raw):
+        geocode_cache = get_geocode_cache()
+        if geocode_cache is None:
+            return self.geocode(raw)
+        return geocode_cache.get_or_geocode(self.name, raw, self.geocode)
+
+    async def acached_geocode(self, raw):
+        """
+        Async counterpart of `cached_geocode()`. Cache hits don't wait for the
+        concurrency limit.
+        """
+        flights, key = self._flight(raw)
+        if flights is None:
+            return await self._acached_geocode(raw)
+        return await flights.ado(key, lambda: self._acached_geocode(raw))
+
+    async def _acached_geocode(self, raw):
+        geocode_cache = get_geocode_cache()
+        if geocode_cache is not None:
+            hit, components = await sync_to_async(
+                geocode_cache.lookup, thread_sensitive=False
+            )(self.name, raw)
+            if hit:
+                return components
+
+        async with get_async_semaphore():
+            components = await self.ageocode(raw)
+
+        if geocode_cache is not None:
+            await sync_to_async(self._cache_result, thread_sensitive=False)(
+                geocode_cache, raw, components
+            )
+        return components
+
+    def _flight(self, raw):
+        """
+        Returns the SingleFlight and key coalescing geocodes of a raw address,
+        or None for both when it isn't coalesced.
+        """
+        flights = get_single_flight()
+        raw_key = generate_raw_key(raw)
+        if flights is None or raw_key is None:
+            return None, None
+        return flights, (self.name, raw_key)
+
+    def cached_geocode_many(self, raws, refresh=False):
+        """
+        Returns the components for each raw address, calling `geocode_many()`
+        once for the distinct raw strings missing from the cache. Blank raw
+        strings aren't geocoded. With `refresh`, every raw string is geocoded
+        again and the cache updated.
+        """
+        geocode_cache = get_geocode_cache()
+        if geocode_cache is None:
+            return self.geocode_many(raws)
+
+        keys = [geocode_cache.make_key(self.name, raw) for raw in raws]
+        if refresh:
+            lookups = [(False, None)] * len(raws)
+        else:
+            lookups = [geocode_cache.lookup(self.name, raw) for raw in raws]
+
+        pending = {}
+        for raw, key, (hit, _) in zip(raws, keys, lookups):
+            if not hit and key is not None:
+                pending.setdefault(key, raw)
+
+        fetched = dict(zip(pending, self.geocode_many(list(pending.values()))))
+        for key, components in fetched.items():
+            self._cache_result(geocode_cache, pending[key], components)
+
+        return [
+            components if hit else fetched.get(key)
+            for key, (hit, components) in zip(keys, lookups)
+        ]
+
+    def _cache_result(self, geocode_cache, raw, components):
+        if components is not None:
+            geocode_cache.set(self.name, raw, components)
+        else:
+            geocode_cache.set_failed(self.name, raw)
+
+    def populate(self, address_instance, components):
+        """
+        Applies address components to an Address, resolving its Locality.
+
+        `components` holds `address_line_1`, `address_line_2`, `formatted`,
+        `latitude`, `longitude`, `locality_name`, `postal_code`, `state_name`,
+        `state_code`, `country_name` and `country_code`. Codes may be None, in
+        which case they aren't set on newly created States and Countries.
+        """
+        self.populate_many([address_instance], [components])
+
+    def populate_many(self, address_instances, components_list):
+        """
+        Applies components to each Address, resolving the Countries, States and
+        Localities of all of them with set-based queries. Addresses whose
+        components are None are left untouched.
+        """
+        pairs = [
+            (address_instance, components)
+            for address_instance, components in zip(address_instances, components_list)
+            if components is not None
+        ]
+        if not pairs:
+            return
+
+        for address_instance, components in pairs:
+            self.apply_components(address_instance, components)
+
+        countries = Country.objects.get_or_create_cached_many(
+            [{"name": components["country_name"]} for _, components in pairs],
+            defaults=[
+                _code_defaults(components["country_code"]) for _, components in pairs
+            ],
+        )
+        states = State.objects.get_or_create_cached_many(
+            [
+                {"name": components["state_name"], "country": country}
+                for (_, components), country in zip(pairs, countries)
+            ],
+            defaults=[
+                _code_defaults(components["state_code"]) for _, components in pairs
+            ],
+        )
+        localities = Locality.objects.get_or_create_cached_many(
+            [
+                {
+                    "name": components["locality_name"],
+                    "postal_code": components["postal_code"],
+                    "state": state,
+                }
+                for (_, components), state in zip(pairs, states)
+            ]
+        )
+        for (address_instance, _), locality in zip(pairs, localities):
+            address_instance.locality = locality
+
+    def apply_components(self, address_instance, components):
+        """
+        Sets the Address's own fields from the components.
+        """
+        address_instance.address_line_1 = components["address_line_1"]
+        address_instance.address_line_2 = components["address_line_2"]
+        address_instance.formatted = components["formatted"]
+        if components["latitude"] is not None:
+            address_instance.latitude = components["latitude"]
+            address_instance.longitude = components["longitude"]
+
+
+def _code_defaults(code):
+    return {"code": code} if code is not None else {}
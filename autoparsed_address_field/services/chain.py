@@ -0,0 +1,216 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+
+from .base import BaseGeocodingService
+from .registry import get_geocoding_service
+
+DEFAULT_CHAIN = ["scourgify", "arcgis"]
+
+logger = logging.getLogger(__name__)
+
+
+class ChainedGeocodingService(BaseGeocodingService):
+    """
+    Tries several providers in order, moving on to the next one only for the
+    addresses the previous ones failed on or returned incomplete results for.
+
+    Put fast local providers first, so remote ones are only called on a miss.
+    The providers are named by `ADDRESS_GEOCODER_CHAIN`, and each one uses its
+    own cache. An incomplete result is kept when no later provider resolves
+    the address. A provider that raises is logged and skipped; addresses no
+    other provider resolves are then treated as unavailable rather than
+    failed. `stats()` counts the addresses resolved by each provider.
+    """
+
+    name = "chain"
+
+    # Results missing any of these are treated as low confidence
+    required_components = (
+        "address_line_1",
+        "locality_name",
+        "state_name",
+        "postal_code",
+    )
+
+    def __init__(self, providers=None):
+        if providers is None:
+            providers = getattr(settings, "ADDRESS_GEOCODER_CHAIN", DEFAULT_CHAIN)
+        self.providers = list(providers)
+        if not self.providers or self.name in self.providers:
+            raise ValueError(_("Invalid geocoding provider chain: %s") % self.providers)
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys([*self.providers, "misses"], 0)
+
+    def tiers(self):
+        return [
+            (provider, get_geocoding_service(provider)) for provider in self.providers
+        ]
+
+    def is_confident(self, components):
+        return components is not None and all(
+            components.get(key) for key in self.required_components
+        )
+
+    def geocode(self, raw):
+        return self._resolve_one(raw, lambda service: service.geocode)
+
+    def cached_geocode(self, raw):
+        return self._resolve_one(raw, lambda service: service.cached_geocode)
+
+    def geocode_many(self, raws):
+        return self._results(
+            *self._resolve_many(raws, lambda service, raws: service.geocode_many(raws))
+        )
+
+    def cached_geocode_many(self, raws, refresh=False):
+        return self._results(
+            *self._resolve_many(
+                raws,
+                lambda service, raws: service.cached_geocode_many(
+                    raws, refresh=refresh
+                ),
+            )
+        )
+
+    def parse_many(self, address_instances):
+        """
+        Parses several Addresses, marking the ones left unresolved because a
+        provider raised as pending, and keeping the results of the others.
+        """
+        address_instances = list(address_instances)
+        results, errors = self._resolve_many(
+            [address_instance.raw for address_instance in address_instances],
+            lambda service, raws: service.cached_geocode_many(raws),
+        )
+        self.populate_many(address_instances, results)
+        for index, (address_instance, components) in enumerate(
+            zip(address_instances, results)
+        ):
+            self.set_parse_status(address_instance, components)
+            if index in errors:
+                address_instance.parse_status = address_instance.ParseStatus.PENDING
+
+    async def ageocode(self, raw):
+        return await self._aresolve_one(raw, lambda service: service.ageocode)
+
+    async def acached_geocode(self, raw):
+        return await self._aresolve_one(raw, lambda service: service.acached_geocode)
+
+    def apply_components(self, address_instance, components):
+        # Providers may set more than the components, e.g. Scourgify adds
+        # coordinates, so the provider that produced them applies them
+        provider = components.get("provider")
+        if provider is None:
+            return super().apply_components(address_instance, components)
+        get_geocoding_service(provider).apply_components(address_instance, components)
+
+    def stats(self):
+        """
+        Returns the number of addresses resolved by each provider, and the
+        number no provider resolved.
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    def clear_stats(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self._counts, 0)
+
+    def _resolve_one(self, raw, method):
+        fallback = error = None
+        for provider, service in self.tiers():
+            try:
+                components = method(service)(raw)
+            except Exception as e:
+                logger.error("Error geocoding with %s: %s", provider, e)
+                error = e
+                continue
+            if self.is_confident(components):
+                return self._resolved(provider, components)
+            if fallback is None and components is not None:
+                fallback = (provider, components)
+        return self._unresolved(fallback, error)
+
+    async def _aresolve_one(self, raw, method):
+        fallback = error = None
+        for provider, service in self.tiers():
+            try:
+                components = await method(service)(raw)
+            except Exception as e:
+                logger.error("Error geocoding with %s: %s", provider, e)
+                error = e
+                continue
+            if self.is_confident(components):
+                return self._resolved(provider, components)
+            if fallback is None and components is not None:
+                fallback = (provider, components)
+        return self._unresolved(fallback, error)
+
+    def _unresolved(self, fallback, error):
+        if fallback is not None:
+            return self._resolved(*fallback)
+        if error is not None:
+            # A provider that couldn't be asked might have resolved it
+            raise error
+        return self._resolved(None, None)
+
+    def _resolve_many(self, raws, method):
+        """
+        Returns the result for each raw address, and the errors of the
+        providers that raised, keyed on the index of each address left
+        without a result.
+        """
+        raws = list(raws)
+        results = [None] * len(raws)
+        fallbacks = {}
+        errors = {}
+        pending = list(range(len(raws)))
+        for provider, service in self.tiers():
+            if not pending:
+                break
+            try:
+                components_list = method(service, [raws[index] for index in pending])
+            except Exception as e:
+                logger.error(
+                    "Error geocoding %d addresses with %s: %s",
+                    len(pending),
+                    provider,
+                    e,
+                )
+                errors.update(dict.fromkeys(pending, e))
+                continue
+            unresolved = []
+            for index, components in zip(pending, components_list):
+                if self.is_confident(components):
+                    results[index] = self._resolved(provider, components)
+                    errors.pop(index, None)
+                    continue
+                if components is not None:
+                    fallbacks.setdefault(index, (provider, components))
+                unresolved.append(index)
+            pending = unresolved
+
+        for index in pending:
+            if index in fallbacks:
+                errors.pop(index, None)
+                results[index] = self._resolved(*fallbacks[index])
+            elif index not in errors:
+                results[index] = self._resolved(None, None)
+        return results, errors
+
+    def _results(self, results, errors):
+        # Without any result to keep, the error is raised like a single
+        # provider's would be
+        if errors and len(errors) == len(results):
+            raise next(iter(errors.values()))
+        return results
+
+    def _resolved(self, provider, components):
+        with self._lock:
+            self._counts[provider or "misses"] += 1
+        if components is None:
+            return None
+        return {**components, "provider": provider}
@@ -0,0 +1,122 @@
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext_lazy as _
+
+DEFAULT_PROVIDER = "scourgify"
+
+# Provider names mapped to service classes or their dotted paths. Paths are
+# imported on first use, which keeps this module free of circular imports.
+_providers = {
+    "arcgis": "autoparsed_address_field.services.arcgis.ArcGISGeocodingService",
+    "chain": "autoparsed_address_field.services.chain.ChainedGeocodingService",
+    "scourgify": (
+        "autoparsed_address_field.services.scourgify.ScourgifyGeocodingService"
+    ),
+}
+
+# Services are stateless, so one instance per provider is reused across saves.
+# The instance for the configured default provider is also kept under None, so
+# resolving it doesn't read settings again.
+_services = {}
+_services_lock = threading.Lock()
+
+
+def register_provider(name, service_class=None):
+    """
+    Registers a geocoding service class, or its dotted path, under `name`.
+
+    Without `service_class`, returns a class decorator:
+
+        @register_provider("geocodio")
+        class GeocodioGeocodingService(BaseGeocodingService):
+            ...
+    """
+    if service_class is None:
+
+        def decorator(service_class):
+            register_provider(name, service_class)
+            return service_class
+
+        return decorator
+
+    with _services_lock:
+        _providers[name] = service_class
+        _services.clear()
+    return service_class
+
+
+def unregister_provider(name):
+    """
+    Removes a registered provider.
+    """
+    with _services_lock:
+        _providers.pop(name, None)
+        _services.clear()
+
+
+def get_provider_class(provider):
+    """
+    Returns the service class for a provider name, or for the dotted path of a
+    service class. `ADDRESS_GEOCODER_PROVIDERS` entries take precedence over
+    registered providers.
+    """
+    service_class = getattr(settings, "ADDRESS_GEOCODER_PROVIDERS", {}).get(
+        provider, _providers.get(provider)
+    )
+    if service_class is None and "." in provider:
+        service_class = provider
+    if service_class is None:
+        raise ValueError(_("Unsupported geocoding provider: %s") % provider)
+
+    if isinstance(service_class, str):
+        try:
+            service_class = import_string(service_class)
+        except ImportError as e:
+            raise ValueError(_("Unsupported geocoding provider: %s") % provider) from e
+    return service_class
+
+
+def get_geocoding_service(provider=None):
+    """
+    Returns the service instance for a provider, defaulting to
+    `ADDRESS_GEOCODER_PROVIDER`. Instances are created once and reused until
+    the provider settings change.
+    """
+    service = _services.get(provider)
+    if service is not None:
+        return service
+
+    with _services_lock:
+        service = _services.get(provider)
+        if service is None:
+            name = provider
+            if name is None:
+                name = getattr(settings, "ADDRESS_GEOCODER_PROVIDER", DEFAULT_PROVIDER)
+            service = _services.get(name)
+            if service is None:
+                service = get_provider_class(name)()
+                _services[name] = service
+            _services[provider] = service
+        return service
+
+
+def reset_geocoding_services():
+    """
+    Drops the service instances, so the next lookup creates new ones.
+    """
+    with _services_lock:
+        _services.clear()
+
+
+@receiver(setting_changed)
+def _reset_geocoding_services_on_setting_changed(setting, **kwargs):
+    if setting in (
+        "ADDRESS_GEOCODER_PROVIDER",
+        "ADDRESS_GEOCODER_PROVIDERS",
+        "ADDRESS_GEOCODER_CHAIN",
+    ):
+        reset_geocoding_services()
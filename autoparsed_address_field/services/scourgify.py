@@ -1,45 +1,183 @@
 import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
-from scourgify import normalize_address_record
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from scourgify.exceptions import UnParseableAddressError
 from uszipcode import SearchEngine
-from ..models import Country, State, Locality
+from ..utils.normalize import normalize_chunk, normalize_components
+from ..zip_centroids import get_zip_centroids
+from .base import BaseGeocodingService
 
 logger = logging.getLogger(__name__)
 
+# Raw addresses per work unit sent to the process pool
+DEFAULT_CHUNK_SIZE = 500
 
-class ScourgifyGeocodingService:
-    def parse(self, address_instance):
-        try:
-            parsed = normalize_address_record(address_instance.raw)
-            print(parsed)
-        except UnParseableAddressError as e:
-            logger.error(
-                f"Scourgify could not parse the address: {address_instance.raw} {e}"
+_search_engine = None
+_search_engine_lock = threading.RLock()
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def get_search_engine():
+    """
+    Returns the process-wide uszipcode SearchEngine, creating it on first use.
+
+    Creating an engine opens the ZIP code database (downloading it if needed),
+    which costs far more than a lookup, so it is shared by every thread and
+    recreated after a fork. Lookups go through `lookup_zipcode()`, since the
+    engine's database session can't be used by several threads at once.
+    """
+    global _search_engine
+
+    with _search_engine_lock:
+        if _search_engine is None:
+            _search_engine = SearchEngine()
+        return _search_engine
+
+
+def lookup_zipcode(postal_code):
+    """
+    Returns the uszipcode record for a ZIP code, or None if it is unknown.
+    """
+    with _search_engine_lock:
+        return get_search_engine().by_zipcode(postal_code)
+
+
+def reset_search_engine():
+    """
+    Closes the process-wide SearchEngine so the next lookup creates a new one.
+    """
+    global _search_engine
+
+    with _search_engine_lock:
+        if _search_engine is not None:
+            _search_engine.close()
+        _search_engine = None
+
+
+def get_process_pool():
+    """
+    Returns the process-wide pool used to normalize large batches, or None when
+    `ADDRESS_SCOURGIFY_PROCESSES` is below 2.
+
+    Workers are spawned rather than forked, so they never inherit the parent's
+    database connections; they only run scourgify and return components.
+    """
+    global _process_pool
+
+    processes = getattr(settings, "ADDRESS_SCOURGIFY_PROCESSES", None) or 0
+    if processes < 2:
+        return None
+
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context("spawn"),
             )
-            return
+        return _process_pool
 
-        address_instance.address_line_1 = parsed.get("address_line_1", "")
-        address_instance.address_line_2 = parsed.get("address_line_2", "")
-        locality_name = parsed.get("city", "")
-        postal_code = parsed.get("postal_code", "")
-        state_name = parsed.get("state", "")
 
-        address_instance.formatted = (
-            f"{address_instance.address_line_1 or ''}"
-            f"{', ' + address_instance.address_line_2 if address_instance.address_line_2 else ''}, "
-            f"{locality_name or ''}, {state_name or ''} {postal_code or ''}".strip(", ")
-        )
+def reset_process_pool():
+    """
+    Shuts the process pool down so the next large batch starts a new one.
+    """
+    global _process_pool
+
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown()
+        _process_pool = None
 
-        country, _ = Country.objects.get_or_create(name="USA")
-        state, _ = State.objects.get_or_create(name=state_name, country=country)
-        address_instance.locality, _ = Locality.objects.get_or_create(
-            name=locality_name, postal_code=postal_code, state=state
+
+def _reset_search_engine_after_fork():
+    global _search_engine, _search_engine_lock, _process_pool, _process_pool_lock
+
+    # The parent's database connection can't be shared with a child
+    _search_engine = None
+    _search_engine_lock = threading.RLock()
+    # Nor can its worker processes
+    _process_pool = None
+    _process_pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_search_engine_after_fork)
+
+
+@receiver(setting_changed)
+def _reset_process_pool_on_setting_changed(setting, **kwargs):
+    if setting == "ADDRESS_SCOURGIFY_PROCESSES":
+        reset_process_pool()
+
+
+class ScourgifyGeocodingService(BaseGeocodingService):
+    name = "scourgify"
+
+    def apply_components(self, address_instance, components):
+        # Only the normalization is cached; coordinates come from the local
+        # ZIP code database.
+        super().apply_components(address_instance, components)
+        self._populate_coordinates(address_instance, components["postal_code"])
+
+    def geocode(self, raw):
+        try:
+            return normalize_components(raw)
+        except UnParseableAddressError as e:
+            logger.error(f"Scourgify could not parse the address: {raw} {e}")
+            return None
+
+    def geocode_many(self, raws):
+        """
+        Normalizes raw addresses, spreading batches larger than
+        `ADDRESS_SCOURGIFY_CHUNK_SIZE` across the process pool in chunks of
+        that size. Resolving Localities and saving stay in this process.
+        """
+        raws = list(raws)
+        chunk_size = getattr(
+            settings, "ADDRESS_SCOURGIFY_CHUNK_SIZE", DEFAULT_CHUNK_SIZE
         )
+        process_pool = get_process_pool() if len(raws) > chunk_size else None
+        if process_pool is None:
+            return super().geocode_many(raws)
+
+        chunks = [
+            raws[start : start + chunk_size]
+            for start in range(0, len(raws), chunk_size)
+        ]
+        results = []
+        for chunk, components_list in zip(
+            chunks, process_pool.map(normalize_chunk, chunks)
+        ):
+            for raw, components in zip(chunk, components_list):
+                if components is None:
+                    logger.error(f"Scourgify could not parse the address: {raw}")
+            results.extend(components_list)
+        return results
+
+    async def ageocode(self, raw):
+        # Normalization is local and fast, so it runs on the event loop
+        return self.geocode(raw)
+
+    def _populate_coordinates(self, address_instance, postal_code):
+        if not postal_code:
+            return
+
+        zip_centroids = get_zip_centroids()
+        if zip_centroids is not None:
+            coordinates = zip_centroids.lookup(postal_code)
+            if coordinates:
+                address_instance.latitude, address_instance.longitude = coordinates
+            return
 
-        if postal_code:
-            search = SearchEngine()
-            zipcode = search.by_zipcode(postal_code)
-            if zipcode:
-                address_instance.latitude = zipcode.lat
-                address_instance.longitude = zipcode.lng
+        zipcode = lookup_zipcode(postal_code)
+        if zipcode:
+            address_instance.latitude = zipcode.lat
+            address_instance.longitude = zipcode.lng
@@ -2,3 +2,6 @@ from django.dispatch import Signal
 
 # Define the signal with additional arguments
 address_parsed = Signal()
+
+# Sent once per batch by Address.objects.bulk_create_from_raw()
+addresses_parsed = Signal()
@@ -0,0 +1,80 @@
+import re
+import threading
+
+from django.core.cache import cache
+
+from ..cache import get_geocode_cache
+from ..services.base import BaseGeocodingService
+
+ADDRESS_PATTERN = re.compile(
+    r"^\s*(?P<street>[^,]+),\s*(?P<city>[^,]+),\s*(?P<state>[A-Za-z]{2}),?\s+(?P<zip>\d{5})"
+)
+
+
+def make_raws(count, city="Springfield", state="IL", postal_code="62701"):
+    """
+    Returns `count` distinct raw addresses that FakeGeocodingService parses.
+    """
+    return [
+        f"{number} Main St, {city}, {state} {postal_code}"
+        for number in range(1, count + 1)
+    ]
+
+
+class FakeGeocodingService(BaseGeocodingService):
+    """
+    Geocoding service that parses "street, city, ST 12345" strings locally,
+    recording the raw strings it is asked to geocode. Anything else fails to
+    geocode.
+    """
+
+    name = "fake"
+
+    def __init__(self):
+        self.geocoded = []
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def geocode(self, raw):
+        with self._lock:
+            self.geocoded.append(raw)
+        match = ADDRESS_PATTERN.match(raw or "")
+        if match is None:
+            return None
+
+        street = match["street"].upper()
+        city = match["city"].upper()
+        state = match["state"].upper()
+        return {
+            "address_line_1": street,
+            "address_line_2": "",
+            "formatted": f"{street}, {city}, {state} {match['zip']}",
+            "latitude": 39.78,
+            "longitude": -89.65,
+            "locality_name": city,
+            "postal_code": match["zip"],
+            "state_name": state,
+            "state_code": state,
+            "country_name": "USA",
+            "country_code": "USA",
+        }
+
+    def geocode_many(self, raws):
+        with self._lock:
+            self.batches.append(list(raws))
+        return super().geocode_many(raws)
+
+
+class GeocodeCacheTestMixin:
+    """
+    Test case mixin clearing the geocode cache tiers before each test, so
+    results cached by earlier tests don't skip the geocoder.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.clear_geocode_cache()
+
+    def clear_geocode_cache(self):
+        get_geocode_cache().clear()
+        cache.clear()
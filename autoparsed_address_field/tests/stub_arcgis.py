@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SERVICE_PATH = "/arcgis/rest/services/World/GeocodeServer"
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 drops concurrent connections, which clients
+    # only retry after a second
+    request_queue_size = 128
+
+
+def make_candidate(street, city, region, region_abbr, postal, x, y, score=100):
+    """
+    Builds an ArcGIS candidate for `StubArcGISServer.candidates`.
+    """
+    return {
+        "address": f"{street}, {city}, {region}, {postal}",
+        "location": {"x": x, "y": y},
+        "score": score,
+        "attributes": {
+            "StAddr": street,
+            "SubAddr": "",
+            "City": city,
+            "Region": region,
+            "RegionAbbr": region_abbr,
+            "Postal": postal,
+            "Country": "USA",
+        },
+    }
+
+
+class StubArcGISServer:
+    """
+    Local HTTP server answering the ArcGIS GeocodeServer operations used by
+    ArcGISGeocodingService.
+
+    `candidates` maps raw address strings to candidates; anything else is
+    unmatched. `latency` (seconds) and `status` apply to every request, to
+    simulate a slow or failing service. Requests are recorded as
+    `(method, operation, params)` tuples in `requests`.
+    """
+
+    def __init__(self, candidates=None, suggested_batch_size=150, max_batch_size=1000):
+        self.candidates = candidates or {}
+        self.suggested_batch_size = suggested_batch_size
+        self.max_batch_size = max_batch_size
+        self.latency = 0
+        self.status = 200
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def domain(self):
+        host, port = self._server.server_address
+        return f"{host}:{port}"
+
+    @property
+    def settings(self):
+        """
+        Settings pointing the ArcGIS geolocator at this server.
+        """
+        return {"ADDRESS_ARCGIS_SCHEME": "http", "ADDRESS_ARCGIS_DOMAIN": self.domain}
+
+    def operations(self, operation):
+        with self._lock:
+            return [request for request in self.requests if request[1] == operation]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def record(self, method, path, params):
+        operation = path[len(SERVICE_PATH) :].strip("/")
+        with self._lock:
+            self.requests.append((method, operation, params))
+        return operation
+
+    def respond(self, operation, params):
+        if operation == "":
+            return {
+                "locatorProperties": {
+                    "SuggestedBatchSize": self.suggested_batch_size,
+                    "MaxBatchSize": self.max_batch_size,
+                }
+            }
+        if operation == "findAddressCandidates":
+            candidate = self.candidates.get(params.get("singleLine"))
+            return {"candidates": [candidate] if candidate else []}
+        if operation == "geocodeAddresses":
+            records = json.loads(params["addresses"])["records"]
+            locations = []
+            for record in records:
+                attributes = record["attributes"]
+                candidate = self.candidates.get(attributes["SingleLine"]) or {
+                    "address": "",
+                    "location": {"x": "NaN", "y": "NaN"},
+                    "score": 0,
+                    "attributes": {"Status": "U"},
+                }
+                locations.append(
+                    {
+                        **candidate,
+                        "attributes": {
+                            **candidate["attributes"],
+                            "ResultID": attributes["OBJECTID"],
+                        },
+                    }
+                )
+            # The real service doesn't preserve the input order either
+            return {"locations": list(reversed(locations))}
+        return {"error": {"code": 400, "message": f"Unknown operation {operation}"}}
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                self._reply(url.path, parse_qs(url.query))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                self._reply(urlparse(self.path).path, parse_qs(body.decode("utf-8")))
+
+            def _reply(self, path, query):
+                params = {key: values[0] for key, values in query.items()}
+                operation = stub.record(self.command, path, params)
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                status = stub.status
+                payload = (
+                    stub.respond(operation, params)
+                    if status == 200
+                    else {"error": {"code": status, "message": "Stub error"}}
+                )
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
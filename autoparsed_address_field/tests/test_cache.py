@@ -0,0 +1,368 @@
+import multiprocessing
+import json
+import os
+import tempfile
+import time
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from ..cache import (
+    GeocodeCache,
+    LRUCache,
+    SQLiteGeocodeCache,
+    get_geocode_cache,
+    get_reference_cache,
+)
+from ..models import Address, Country, Locality, State
+from ..services.base import BaseGeocodingService
+
+COMPONENTS = {"formatted": "123 MAIN ST, SPRINGFIELD, IL"}
+
+
+class LRUCacheTest(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(2)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+
+        self.assertEqual(lru.get("a"), 1)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.get("c"), 3)
+        self.assertEqual(len(lru), 2)
+
+
+class GeocodeCacheTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.geocode_cache = GeocodeCache(maxsize=8)
+
+    def test_miss_then_local_hit(self):
+        geocode = MagicMock(return_value=COMPONENTS)
+
+        first = self.geocode_cache.get_or_geocode("arcgis", "123 Main St", geocode)
+        second = self.geocode_cache.get_or_geocode("arcgis", "123  MAIN st", geocode)
+
+        geocode.assert_called_once_with("123 Main St")
+        self.assertEqual(first, COMPONENTS)
+        self.assertEqual(second, COMPONENTS)
+        stats = self.geocode_cache.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["local_hits"], 1)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["local_size"], 1)
+
+    def test_shared_hit_after_local_clear(self):
+        self.geocode_cache.set("arcgis", "123 Main St", COMPONENTS)
+        self.geocode_cache.clear()
+
+        self.assertEqual(self.geocode_cache.get("arcgis", "123 Main St"), COMPONENTS)
+        self.assertEqual(self.geocode_cache.stats()["shared_hits"], 1)
+
+    def test_keyed_on_provider(self):
+        self.geocode_cache.set("arcgis", "123 Main St", COMPONENTS)
+
+        self.assertIsNone(self.geocode_cache.get("scourgify", "123 Main St"))
+
+    def test_failed_geocode_is_negatively_cached(self):
+        geocode = MagicMock(return_value=None)
+
+        self.geocode_cache.get_or_geocode("arcgis", "Invalid Address", geocode)
+        result = self.geocode_cache.get_or_geocode("arcgis", "invalid address", geocode)
+
+        geocode.assert_called_once_with("Invalid Address")
+        self.assertIsNone(result)
+        self.assertEqual(
+            self.geocode_cache.lookup("arcgis", "Invalid Address"), (True, None)
+        )
+        stats = self.geocode_cache.stats()
+        self.assertEqual(stats["negative_hits"], 2)
+        self.assertEqual(stats["hits"], 0)
+
+    def test_negative_entry_expires(self):
+        geocode_cache = GeocodeCache(maxsize=8, negative_timeout=60)
+        geocode = MagicMock(return_value=None)
+        geocode_cache.get_or_geocode("arcgis", "Invalid Address", geocode)
+
+        with patch("time.time", return_value=time.time() + 61):
+            geocode_cache.get_or_geocode("arcgis", "Invalid Address", geocode)
+
+        self.assertEqual(geocode.call_count, 2)
+
+    def test_local_entry_expires(self):
+        geocode_cache = GeocodeCache(alias=None, maxsize=8, timeout=60)
+        geocode = MagicMock(return_value=COMPONENTS)
+        geocode_cache.get_or_geocode("arcgis", "123 Main St", geocode)
+
+        with patch("time.time", return_value=time.time() + 61):
+            geocode_cache.get_or_geocode("arcgis", "123 Main St", geocode)
+
+        self.assertEqual(geocode.call_count, 2)
+
+    def test_negative_entry_in_shared_tier(self):
+        self.geocode_cache.set_failed("arcgis", "Invalid Address")
+        self.geocode_cache.clear()
+
+        self.assertEqual(
+            self.geocode_cache.lookup("arcgis", "Invalid Address"), (True, None)
+        )
+        self.assertEqual(self.geocode_cache.stats()["negative_hits"], 1)
+
+    def test_negative_cache_disabled(self):
+        geocode_cache = GeocodeCache(maxsize=8, negative_timeout=0)
+        geocode = MagicMock(return_value=None)
+
+        geocode_cache.get_or_geocode("arcgis", "Invalid Address", geocode)
+        geocode_cache.get_or_geocode("arcgis", "Invalid Address", geocode)
+
+        self.assertEqual(geocode.call_count, 2)
+
+    def test_exception_is_not_cached(self):
+        geocode = MagicMock(side_effect=[RuntimeError("Unavailable"), COMPONENTS])
+
+        with self.assertRaises(RuntimeError):
+            self.geocode_cache.get_or_geocode("arcgis", "123 Main St", geocode)
+        result = self.geocode_cache.get_or_geocode("arcgis", "123 Main St", geocode)
+
+        self.assertEqual(result, COMPONENTS)
+        self.assertEqual(geocode.call_count, 2)
+
+    def test_local_tier_only(self):
+        geocode_cache = GeocodeCache(alias=None, maxsize=8)
+        geocode_cache.set("arcgis", "123 Main St", COMPONENTS)
+
+        self.assertIsNone(cache.get(geocode_cache.make_key("arcgis", "123 Main St")))
+        self.assertEqual(geocode_cache.get("arcgis", "123 Main St"), COMPONENTS)
+
+    def test_shared_tier_only(self):
+        geocode_cache = GeocodeCache(maxsize=0)
+        geocode_cache.set("arcgis", "123 Main St", COMPONENTS)
+
+        self.assertEqual(geocode_cache.get("arcgis", "123 Main St"), COMPONENTS)
+        self.assertEqual(geocode_cache.stats()["shared_hits"], 1)
+
+
+def write_disk_entries(path, worker, count):
+    disk = SQLiteGeocodeCache(path)
+    for i in range(count):
+        disk.set(f"{worker}:{i}", {"worker": worker, "index": i})
+
+
+class SQLiteGeocodeCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "geocode.sqlite3")
+
+    def test_set_and_get(self):
+        disk = SQLiteGeocodeCache(self.path)
+        disk.set("key", COMPONENTS)
+
+        self.assertEqual(disk.get("key"), COMPONENTS)
+        self.assertIsNone(disk.get("missing"))
+        self.assertEqual(len(disk), 1)
+
+    def test_expired_entry(self):
+        disk = SQLiteGeocodeCache(self.path, timeout=60)
+        disk.set("key", COMPONENTS)
+
+        later = time.time() + 61
+        with patch("autoparsed_address_field.cache.time.time", return_value=later):
+            self.assertIsNone(disk.get("key"))
+        self.assertEqual(len(disk), 0)
+
+    def test_tracks_size(self):
+        disk = SQLiteGeocodeCache(self.path)
+        disk.set("key", COMPONENTS)
+        size = disk.size()
+        disk.set("key", {"formatted": ""})
+
+        self.assertGreater(size, disk.size())
+        disk.delete("key")
+        self.assertEqual(disk.size(), 0)
+
+    def test_evicts_least_recently_used_over_size_limit(self):
+        entry_size = len("key-00") + len(json.dumps(COMPONENTS))
+        disk = SQLiteGeocodeCache(self.path, size_limit=entry_size * 10, timeout=None)
+        disk.cull_batch = 1
+
+        for i in range(11):
+            with patch("autoparsed_address_field.cache.time.time", return_value=i):
+                disk.set(f"key-{i:02d}", COMPONENTS)
+
+        self.assertLessEqual(disk.size(), entry_size * 9)
+        self.assertIsNone(disk.get("key-00"))
+        self.assertEqual(disk.get("key-10"), COMPONENTS)
+
+    def test_shared_between_processes(self):
+        context = multiprocessing.get_context("fork")
+        processes = [
+            context.Process(target=write_disk_entries, args=(self.path, worker, 50))
+            for worker in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+        disk = SQLiteGeocodeCache(self.path)
+        self.assertEqual(len(disk), 200)
+        self.assertEqual(disk.get("3:49"), {"worker": 3, "index": 49})
+
+    def test_geocode_cache_disk_tier(self):
+        disk = SQLiteGeocodeCache(self.path)
+        GeocodeCache(alias=None, disk=disk).set("arcgis", "123 Main St", COMPONENTS)
+
+        # A fresh process-local cache finds the entry on disk
+        geocode_cache = GeocodeCache(alias=None, disk=SQLiteGeocodeCache(self.path))
+        self.assertEqual(geocode_cache.get("arcgis", "123 Main St"), COMPONENTS)
+        self.assertEqual(geocode_cache.get("arcgis", "123 Main St"), COMPONENTS)
+        stats = geocode_cache.stats()
+        self.assertEqual(stats["disk_hits"], 1)
+        self.assertEqual(stats["local_hits"], 1)
+
+    def test_negative_entry_expires_on_disk(self):
+        disk = SQLiteGeocodeCache(self.path)
+        GeocodeCache(alias=None, disk=disk, negative_timeout=60).set_failed(
+            "arcgis", "Invalid Address"
+        )
+
+        geocode_cache = GeocodeCache(alias=None, disk=disk, maxsize=0)
+        self.assertEqual(
+            geocode_cache.lookup("arcgis", "Invalid Address"), (True, None)
+        )
+        with patch("time.time", return_value=time.time() + 61):
+            self.assertEqual(
+                geocode_cache.lookup("arcgis", "Invalid Address"), (False, None)
+            )
+
+    def test_configured_from_settings(self):
+        with self.settings(
+            ADDRESS_GEOCODE_CACHE_PATH=self.path, ADDRESS_GEOCODE_CACHE_SIZE_LIMIT=1024
+        ):
+            disk = get_geocode_cache().disk
+            self.assertEqual(disk.path, self.path)
+            self.assertEqual(disk.size_limit, 1024)
+
+
+class GetGeocodeCacheTest(SimpleTestCase):
+    def test_configured_from_settings(self):
+        with self.settings(
+            ADDRESS_GEOCODE_CACHE_MAXSIZE=5, ADDRESS_GEOCODE_CACHE_TIMEOUT=60
+        ):
+            geocode_cache = get_geocode_cache()
+            self.assertIs(get_geocode_cache(), geocode_cache)
+            self.assertEqual(geocode_cache.local.maxsize, 5)
+            self.assertEqual(geocode_cache.timeout, 60)
+
+    def test_negative_timeout_from_settings(self):
+        with self.settings(ADDRESS_GEOCODE_CACHE_NEGATIVE_TIMEOUT=600):
+            self.assertEqual(get_geocode_cache().negative_timeout, 600)
+
+    def test_no_disk_tier_by_default(self):
+        self.assertIsNone(get_geocode_cache().disk)
+
+    def test_disabled(self):
+        with self.settings(ADDRESS_GEOCODE_CACHE_ENABLED=False):
+            self.assertIsNone(get_geocode_cache())
+
+
+class ReferenceCacheTest(TestCase):
+    components = {
+        "address_line_1": "123 MAIN ST",
+        "address_line_2": None,
+        "formatted": "123 MAIN ST, SPRINGFIELD, IL 62701",
+        "latitude": None,
+        "longitude": None,
+        "locality_name": "SPRINGFIELD",
+        "postal_code": "62701",
+        "state_name": "ILLINOIS",
+        "state_code": "IL",
+        "country_name": "USA",
+        "country_code": "USA",
+    }
+
+    def setUp(self):
+        get_reference_cache().clear()
+        self.addCleanup(get_reference_cache().clear)
+
+    def populate(self):
+        address = Address(raw="123 Main St, Springfield, IL 62701")
+        BaseGeocodingService().populate(address, self.components)
+        return address
+
+    def test_cached_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.populate()
+
+        with self.assertNumQueries(0):
+            second = self.populate()
+
+        self.assertEqual(second.locality, first.locality)
+        self.assertEqual(second.locality.state.code, "IL")
+
+    def test_not_cached_before_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.populate()
+
+        with self.assertNumQueries(3):
+            self.populate()
+        self.assertEqual(len(get_reference_cache()), 0)
+        self.assertEqual(len(callbacks), 3)
+
+    def test_update_invalidates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            address = self.populate()
+
+        state = State.objects.get(pk=address.locality.state_id)
+        state.name = "IL"
+        state.save()
+
+        self.assertEqual(len(get_reference_cache()), 0)
+        self.assertEqual(self.populate().locality.state.name, "ILLINOIS")
+
+    def test_delete_invalidates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            address = self.populate()
+
+        Locality.objects.filter(pk=address.locality_id).delete()
+
+        self.assertEqual(len(get_reference_cache()), 0)
+
+    def test_create_keeps_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.populate()
+
+        Country.objects.create(name="CANADA", code="CAN")
+
+        self.assertEqual(len(get_reference_cache()), 3)
+
+    def test_keyed_on_natural_key(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            country, created = Country.objects.get_or_create_cached(
+                name="USA", defaults={"code": "USA"}
+            )
+            self.assertTrue(created)
+            other, created = Country.objects.get_or_create_cached(
+                name="CANADA", defaults={"code": "CAN"}
+            )
+            self.assertTrue(created)
+
+        self.assertEqual(
+            Country.objects.get_or_create_cached(name="USA"), (country, False)
+        )
+        self.assertNotEqual(country, other)
+
+    def test_disabled(self):
+        with self.settings(ADDRESS_REFERENCE_CACHE_MAXSIZE=0):
+            self.assertIsNone(get_reference_cache())
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.populate()
+            self.assertEqual(callbacks, [])
+
+            with self.assertNumQueries(3):
+                self.populate()
@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from ..coalescing import SingleFlight
+from ..services.base import get_single_flight
+from .fake_geocoder import FakeGeocodingService, GeocodeCacheTestMixin, make_raws
+
+
+def run_threads(count, target):
+    """
+    Runs `target(number)` in `count` threads started together, returning the
+    results in thread order.
+    """
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(number):
+        barrier.wait()
+        results[number] = target(number)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class SingleFlightTest(SimpleTestCase):
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.calls = 0
+
+    def slow(self, value):
+        def fn():
+            self.calls += 1
+            time.sleep(0.05)
+            return value
+
+        return fn
+
+    def test_concurrent_calls_share_one_call(self):
+        results = run_threads(8, lambda _: self.flights.do("key", self.slow(42)))
+
+        self.assertEqual(results, [42] * 8)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.flights.stats(), {"calls": 1, "shared": 7})
+
+    def test_keys_are_independent(self):
+        results = run_threads(
+            4, lambda number: self.flights.do(number % 2, self.slow(number % 2))
+        )
+
+        self.assertEqual(results, [0, 1, 0, 1])
+        self.assertEqual(self.calls, 2)
+
+    def test_exception_is_shared(self):
+        def fail():
+            time.sleep(0.05)
+            raise ValueError("Unavailable")
+
+        def call(_):
+            try:
+                self.flights.do("key", fail)
+            except ValueError as e:
+                return str(e)
+
+        self.assertEqual(run_threads(4, call), ["Unavailable"] * 4)
+        self.assertEqual(self.flights.stats()["calls"], 1)
+
+    def test_result_is_not_kept(self):
+        self.flights.do("key", self.slow(1))
+        self.assertEqual(self.flights.do("key", self.slow(2)), 2)
+        self.assertEqual(self.calls, 2)
+
+    def test_async_calls_share_one_call(self):
+        async def fn():
+            self.calls += 1
+            await asyncio.sleep(0.05)
+            return 42
+
+        async def main():
+            callers = [asyncio.ensure_future(self.flights.ado("key", fn))]
+            callers += [
+                asyncio.ensure_future(self.flights.ado("key", fn)) for _ in range(4)
+            ]
+            await asyncio.sleep(0)
+            # Cancelling the first caller doesn't cancel the shared call
+            callers[0].cancel()
+            return await asyncio.gather(*callers[1:])
+
+        self.assertEqual(asyncio.run(main()), [42] * 4)
+        self.assertEqual(self.calls, 1)
+
+
+class SlowGeocodingService(FakeGeocodingService):
+    """
+    FakeGeocodingService whose geocodes take `delay` seconds, like a remote
+    provider.
+    """
+
+    delay = 0.05
+
+    def geocode(self, raw):
+        time.sleep(self.delay)
+        return super().geocode(raw)
+
+
+class GeocodeCoalescingBenchmarkTest(GeocodeCacheTestMixin, SimpleTestCase):
+    """
+    Parses a few raw addresses from many threads at once, as during an import
+    or traffic spike, and compares the provider calls made with and without
+    coalescing.
+    """
+
+    threads = 32
+    addresses = 4
+
+    def setUp(self):
+        super().setUp()
+        get_single_flight().clear()
+
+    def run_load(self):
+        service = SlowGeocodingService()
+        raws = make_raws(self.addresses)
+
+        def parse(number):
+            # Threads spell the same address differently
+            raw = raws[number % self.addresses]
+            return service.cached_geocode(raw.upper() if number % 3 else raw)
+
+        started = time.monotonic()
+        results = run_threads(self.threads, parse)
+        elapsed = time.monotonic() - started
+
+        self.assertTrue(all(components is not None for components in results))
+        return len(service.geocoded), elapsed
+
+    def test_fewer_provider_calls_under_concurrent_load(self):
+        with self.settings(ADDRESS_GEOCODE_COALESCING=False):
+            uncoalesced_calls, _ = self.run_load()
+
+        self.clear_geocode_cache()
+        coalesced_calls, elapsed = self.run_load()
+
+        # Every thread misses the cache before the first geocode returns
+        self.assertEqual(uncoalesced_calls, self.threads)
+        self.assertEqual(coalesced_calls, self.addresses)
+        self.assertEqual(
+            get_single_flight().stats(),
+            {"calls": self.addresses, "shared": self.threads - self.addresses},
+        )
+        self.assertLess(elapsed, 1)
+
+    def test_blank_raw_is_not_coalesced(self):
+        service = SlowGeocodingService()
+
+        run_threads(4, lambda _: service.cached_geocode(""))
+
+        self.assertEqual(get_single_flight().stats()["calls"], 0)
@@ -0,0 +1,506 @@
+import csv
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import TestCase
+
+from ..models import Address, Country, State
+from ..utils.create_address_from_keys import create_addresses_from_keys
+from ..utils.uuid import generate_uuid_from_address
+from .fake_geocoder import FakeGeocodingService, GeocodeCacheTestMixin, make_raws
+
+KEYED_FIELDS = [
+    "raw",
+    "address_line_1",
+    "locality_name",
+    "state_name",
+    "postal_code",
+    "country_name",
+    "country_code",
+    "latitude",
+    "longitude",
+]
+
+
+class ImportAddressesTest(GeocodeCacheTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = FakeGeocodingService()
+        patcher = patch.object(
+            Address, "_get_geocoding_service", return_value=self.service
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+
+    def write_csv(self, rows):
+        path = os.path.join(self.tmp_dir, "addresses.csv")
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, KEYED_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def write_jsonl(self, rows):
+        path = os.path.join(self.tmp_dir, "addresses.jsonl")
+        with open(path, "w") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n\n")
+        return path
+
+    def import_addresses(self, *args, **options):
+        stdout = StringIO()
+        call_command("import_addresses", *args, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_import_csv(self):
+        keyed = {
+            "address_line_1": "9 Elm St",
+            "locality_name": "Columbus",
+            "state_name": "OH",
+            "postal_code": "43212",
+            "country_name": "USA",
+            "country_code": "USA",
+            "latitude": "39.99",
+            "longitude": "-83.04",
+        }
+        path = self.write_csv([{"raw": raw} for raw in make_raws(3)] + [keyed])
+
+        output = self.import_addresses(path, chunk_size=2)
+
+        self.assertIn("Imported 4 rows", output)
+        self.assertIn("rows/s", output)
+        self.assertEqual(Address.objects.count(), 4)
+        # Two chunks of raw addresses, and the keyed row
+        self.assertEqual(len(self.service.batches), 3)
+        address = Address.objects.get(raw="1 Main St, Springfield, IL 62701")
+        self.assertEqual(address.locality.name, "SPRINGFIELD")
+        address = Address.objects.get(raw="9 Elm St, Columbus, OH, 43212, USA")
+        self.assertEqual(address.locality.name, "COLUMBUS")
+
+    def test_import_keyed_skip_parsing(self):
+        keyed = {
+            "address_line_1": "9 Elm St",
+            "locality_name": "Columbus",
+            "state_name": "OH",
+            "postal_code": "43212",
+            "country_name": "USA",
+            "country_code": "USA",
+            "latitude": "39.99",
+            "longitude": "",
+        }
+        path = self.write_csv([keyed])
+
+        self.import_addresses(path, skip_parsing=True)
+
+        address = Address.objects.get()
+        self.assertEqual(address.address_line_1, "9 Elm St")
+        self.assertEqual(address.locality.name, "Columbus")
+        self.assertEqual(address.latitude, 39.99)
+        self.assertIsNone(address.longitude)
+        self.assertFalse(os.path.exists(path + ".checkpoint"))
+
+    def test_import_jsonl(self):
+        path = self.write_jsonl([{"address": raw} for raw in make_raws(3)])
+
+        self.import_addresses(path, raw_field="address", skip_parsing=True)
+
+        self.assertEqual(Address.objects.count(), 3)
+        self.assertEqual(self.service.geocoded, [])
+
+    def test_import_is_idempotent(self):
+        path = self.write_csv([{"raw": raw} for raw in make_raws(3)])
+
+        self.import_addresses(path)
+        self.import_addresses(path)
+
+        self.assertEqual(Address.objects.count(), 3)
+
+    def test_resume_after_interruption(self):
+        path = self.write_csv([{"raw": raw} for raw in make_raws(5)])
+        bulk_create_from_raw = Address.objects.bulk_create_from_raw
+        calls = []
+
+        def fail_on_second_chunk(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("Interrupted")
+            return bulk_create_from_raw(*args, **kwargs)
+
+        with patch.object(
+            Address.objects, "bulk_create_from_raw", side_effect=fail_on_second_chunk
+        ):
+            with self.assertRaises(RuntimeError):
+                self.import_addresses(path, chunk_size=2)
+
+        # The first chunk was committed, the second rolled back
+        self.assertEqual(Address.objects.count(), 2)
+        with open(path + ".checkpoint") as f:
+            self.assertEqual(json.load(f), {"rows": 2})
+
+        output = self.import_addresses(path, chunk_size=2)
+
+        self.assertIn("Resuming after row 2", output)
+        self.assertIn("Imported 3 rows", output)
+        self.assertEqual(Address.objects.count(), 5)
+        self.assertEqual(len(self.service.geocoded), 5)
+
+    def test_restart(self):
+        path = self.write_csv([{"raw": raw} for raw in make_raws(3)])
+        with open(path + ".checkpoint", "w") as f:
+            json.dump({"rows": 3}, f)
+
+        output = self.import_addresses(path, restart=True)
+
+        self.assertIn("Imported 3 rows", output)
+
+    def test_invalid_json(self):
+        path = os.path.join(self.tmp_dir, "addresses.jsonl")
+        with open(path, "w") as f:
+            f.write("{nope\n")
+
+        with self.assertRaises(CommandError):
+            self.import_addresses(path)
+
+    def test_unknown_format(self):
+        path = os.path.join(self.tmp_dir, "addresses.txt")
+        open(path, "w").close()
+
+        with self.assertRaises(CommandError):
+            self.import_addresses(path)
+
+
+class ExportAddressesTest(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+
+    def create_addresses(self):
+        create_addresses_from_keys(
+            [
+                {
+                    "address_line_1": "1 Main St",
+                    "locality_name": "Springfield",
+                    "state_name": "IL",
+                    "postal_code": "62701",
+                    "country_name": "USA",
+                    "country_code": "USA",
+                    "latitude": 39.78,
+                    "longitude": -89.65,
+                },
+                {
+                    "address_line_1": "2 Main St",
+                    "locality_name": "Springfield",
+                    "state_name": "IL",
+                    "postal_code": "62701",
+                    "country_name": "USA",
+                    "country_code": "USA",
+                },
+            ],
+            skip_parsing=True,
+        )
+        Address(raw="Somewhere").save(skip_parsing=True)
+
+    def export_addresses(self, filename, **options):
+        path = os.path.join(self.tmp_dir, filename)
+        call_command("export_addresses", path, stdout=StringIO(), **options)
+        with open(path) as f:
+            return f.read()
+
+    def test_export_csv(self):
+        self.create_addresses()
+        rows = list(csv.DictReader(StringIO(self.export_addresses("out.csv"))))
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]["raw"], "1 Main St, Springfield, IL, 62701, USA")
+        self.assertEqual(rows[0]["locality_name"], "Springfield")
+        self.assertEqual(rows[0]["country_code"], "USA")
+        self.assertEqual(rows[0]["latitude"], "39.78")
+        self.assertEqual(rows[2]["locality_name"], "")
+
+    def test_export_jsonl(self):
+        self.create_addresses()
+        rows = [
+            json.loads(line) for line in self.export_addresses("out.jsonl").splitlines()
+        ]
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]["state_name"], "IL")
+        self.assertEqual(rows[0]["longitude"], -89.65)
+        self.assertIsNone(rows[2]["locality_name"])
+
+    def test_export_geojson(self):
+        self.create_addresses()
+        collection = json.loads(self.export_addresses("out.geojson"))
+
+        self.assertEqual(collection["type"], "FeatureCollection")
+        features = collection["features"]
+        self.assertEqual(len(features), 3)
+        self.assertEqual(
+            features[0]["geometry"], {"type": "Point", "coordinates": [-89.65, 39.78]}
+        )
+        self.assertEqual(features[0]["properties"]["postal_code"], "62701")
+        self.assertIsNone(features[1]["geometry"])
+
+    def test_export_empty_geojson(self):
+        collection = json.loads(self.export_addresses("out.geojson"))
+
+        self.assertEqual(collection["features"], [])
+
+    def test_export_to_stdout(self):
+        self.create_addresses()
+        stdout = StringIO()
+        call_command(
+            "export_addresses", format="jsonl", stdout=stdout, stderr=StringIO()
+        )
+
+        self.assertEqual(len(stdout.getvalue().splitlines()), 3)
+
+    def test_export_is_importable(self):
+        with transaction.atomic():
+            self.create_addresses()
+            exported = self.export_addresses("out.csv")
+            raws = sorted(Address.objects.values_list("raw", flat=True))
+            transaction.set_rollback(True)
+        path = os.path.join(self.tmp_dir, "in.csv")
+        with open(path, "w") as f:
+            f.write(exported)
+
+        call_command("import_addresses", path, skip_parsing=True, stdout=StringIO())
+
+        self.assertEqual(sorted(Address.objects.values_list("raw", flat=True)), raws)
+        address = Address.objects.get(address_line_1="1 Main St")
+        self.assertEqual(address.raw, "1 Main St, Springfield, IL, 62701, USA")
+        self.assertEqual(address.locality.name, "Springfield")
+        self.assertEqual(address.locality.postal_code, "62701")
+        self.assertEqual(address.locality.state.country.code, "USA")
+        self.assertEqual((address.latitude, address.longitude), (39.78, -89.65))
+        self.assertEqual(address.formatted, "1 Main St, Springfield, IL 62701")
+        self.assertIsNone(Address.objects.get(raw="Somewhere").locality)
+
+    def test_export_without_codes_is_importable(self):
+        with transaction.atomic():
+            self.create_addresses()
+            # Scourgify creates Countries and States without codes
+            Country.objects.update(code="")
+            State.objects.update(code="")
+            exported = self.export_addresses("out.csv")
+            raws = sorted(Address.objects.values_list("raw", flat=True))
+            transaction.set_rollback(True)
+        path = os.path.join(self.tmp_dir, "in.csv")
+        with open(path, "w") as f:
+            f.write(exported)
+        Country.objects.create(name="USA", code="")
+
+        call_command("import_addresses", path, skip_parsing=True, stdout=StringIO())
+
+        self.assertEqual(sorted(Address.objects.values_list("raw", flat=True)), raws)
+        country = Address.objects.get(address_line_1="1 Main St").locality.state.country
+        self.assertEqual((country.name, country.code), ("USA", ""))
+        self.assertEqual(Country.objects.count(), 1)
+        self.assertEqual(State.objects.count(), 1)
+
+    def test_streams_with_iterator(self):
+        with patch(
+            "django.db.models.query.QuerySet.iterator", autospec=True
+        ) as iterator:
+            iterator.return_value = iter([])
+            self.export_addresses("out.csv", chunk_size=10)
+
+        iterator.assert_called_once()
+        self.assertEqual(iterator.call_args.kwargs, {"chunk_size": 10})
+
+
+class ReparseAddressesTest(GeocodeCacheTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = FakeGeocodingService()
+        patcher = patch.object(
+            Address, "_get_geocoding_service", return_value=self.service
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.checkpoint = os.path.join(tmp_dir.name, "reparse.checkpoint")
+
+        self.raws = make_raws(4) + ["Invalid Address"]
+        self.addresses = Address.objects.bulk_create_from_raw(
+            self.raws, skip_parsing=True
+        )
+        Address.objects.filter(pk=self.addresses[0].pk).update(
+            latitude=1.0, longitude=1.0
+        )
+
+    def reparse_addresses(self, **options):
+        stdout = StringIO()
+        call_command(
+            "reparse_addresses",
+            checkpoint=self.checkpoint,
+            stdout=stdout,
+            stderr=StringIO(),
+            **options,
+        )
+        return stdout.getvalue()
+
+    def test_reparse(self):
+        output = self.reparse_addresses(chunk_size=2, workers=2)
+
+        self.assertIn("Parsed 5 addresses, updated 4", output)
+        self.assertIn("2/5 addresses", output)
+        self.assertIn("ETA", output)
+        self.assertCountEqual(self.service.geocoded, self.raws)
+        address = Address.objects.get(pk=self.addresses[1].pk)
+        self.assertEqual(address.formatted, "2 MAIN ST, SPRINGFIELD, IL 62701")
+        self.assertEqual(address.locality.name, "SPRINGFIELD")
+        self.assertEqual(address.latitude, 39.78)
+        self.assertEqual(address.address_id, generate_uuid_from_address(address))
+        self.assertIsNone(Address.objects.get(raw="Invalid Address").formatted)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_filters(self):
+        self.reparse_addresses(missing_coordinates=True)
+        self.assertEqual(len(self.service.geocoded), 4)
+        self.assertNotIn(self.raws[0], self.service.geocoded)
+
+        self.service.geocoded.clear()
+        self.reparse_addresses(country="USA", refresh=True)
+        self.assertCountEqual(self.service.geocoded, self.raws[1:4])
+
+        # The invalid address failed in the first run and is negatively cached
+        self.service.geocoded.clear()
+        self.reparse_addresses(unparsed=True)
+        self.assertEqual(self.service.geocoded, [self.raws[0]])
+
+    def test_country_matches_name(self):
+        self.reparse_addresses()
+        # Countries created by Scourgify have a name but no code
+        Country.objects.update(name="USA", code="")
+
+        self.service.geocoded.clear()
+        self.reparse_addresses(country="usa", refresh=True)
+        self.assertCountEqual(self.service.geocoded, self.raws[:4])
+
+        self.service.geocoded.clear()
+        self.reparse_addresses(country="CAN", refresh=True)
+        self.assertEqual(self.service.geocoded, [])
+
+    def test_parse_status(self):
+        self.reparse_addresses()
+
+        statuses = dict(Address.objects.values_list("raw", "parse_status"))
+        self.assertEqual(statuses.pop("Invalid Address"), Address.ParseStatus.FAILED)
+        self.assertEqual(set(statuses.values()), {Address.ParseStatus.OK})
+
+    def test_pending(self):
+        Address.objects.filter(pk__in=[a.pk for a in self.addresses[1:3]]).update(
+            parse_status=Address.ParseStatus.PENDING
+        )
+
+        with patch.object(
+            self.service, "geocode_many", side_effect=RuntimeError("Unavailable")
+        ):
+            self.reparse_addresses(pending=True)
+        self.assertEqual(
+            Address.objects.filter(parse_status=Address.ParseStatus.PENDING).count(),
+            2,
+        )
+
+        self.reparse_addresses(pending=True)
+        self.assertCountEqual(self.service.geocoded, self.raws[1:3])
+        self.assertFalse(
+            Address.objects.filter(parse_status=Address.ParseStatus.PENDING).exists()
+        )
+
+    def test_refresh_ignores_cache(self):
+        self.reparse_addresses()
+        self.service.geocoded.clear()
+
+        self.reparse_addresses()
+        self.assertEqual(self.service.geocoded, [])
+
+        self.service.geocoded.clear()
+        self.reparse_addresses(refresh=True)
+        self.assertCountEqual(self.service.geocoded, self.raws)
+
+    def test_resume(self):
+        filters = {
+            "provider": None,
+            "missing_coordinates": False,
+            "unparsed": False,
+            "pending": False,
+            "country": None,
+        }
+        with open(self.checkpoint, "w") as f:
+            json.dump({"filters": filters, "last_pk": self.addresses[2].pk}, f)
+
+        output = self.reparse_addresses()
+
+        self.assertIn(f"Resuming after address {self.addresses[2].pk}", output)
+        self.assertCountEqual(self.service.geocoded, self.raws[3:])
+
+    def test_checkpoint_with_other_filters(self):
+        with open(self.checkpoint, "w") as f:
+            json.dump({"filters": {"country": "CAN"}, "last_pk": 1}, f)
+
+        with self.assertRaises(CommandError):
+            self.reparse_addresses()
+
+        self.reparse_addresses(restart=True)
+        self.assertEqual(len(self.service.geocoded), 5)
+
+    @skipUnless("fork" in multiprocessing.get_all_start_methods(), "Requires fork()")
+    def test_process_pool(self):
+        output = self.reparse_addresses(processes=True, workers=2)
+
+        self.assertIn("updated 4", output)
+        self.assertEqual(
+            Address.objects.get(pk=self.addresses[3].pk).locality.name, "SPRINGFIELD"
+        )
+
+    @skipUnless("fork" in multiprocessing.get_all_start_methods(), "Requires fork()")
+    def test_process_pool_forks_without_connections(self):
+        events = []
+        close_all = connections.close_all
+        submit = ProcessPoolExecutor.submit
+
+        def record_query(execute, sql, params, many, context):
+            events.append("query")
+            return execute(sql, params, many, context)
+
+        def record_close():
+            events.append("close")
+            close_all()
+
+        def record_submit(executor, *args, **kwargs):
+            events.append("submit")
+            return submit(executor, *args, **kwargs)
+
+        with connection.execute_wrapper(record_query), patch.object(
+            connections, "close_all", side_effect=record_close
+        ), patch.object(ProcessPoolExecutor, "submit", record_submit):
+            self.reparse_addresses(processes=True, workers=2)
+
+        # No query reopens the connection between closing it and forking
+        first_submit = events.index("submit")
+        self.assertEqual(events[first_submit - 1], "close")
+
+    def test_unknown_provider(self):
+        with patch.object(
+            Address, "_get_geocoding_service", side_effect=ValueError("Unsupported")
+        ):
+            with self.assertRaises(CommandError):
+                self.reparse_addresses(provider="nope")
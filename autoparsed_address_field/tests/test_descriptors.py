@@ -1,25 +1,83 @@
-from autoparsed_address_field.models import Address
+from autoparsed_address_field.models import Address, Country, State, Locality
+from django.core.exceptions import ValidationError
+from django.db import connection, models
 from django.test import TestCase
-from unittest.mock import MagicMock
 
 from autoparsed_address_field.descriptors import AddressDescriptor
+from autoparsed_address_field.fields import AutoParsedAddressField
 
 
-class AddressDescriptorTest(TestCase):
+class AddressOwner(models.Model):
+    """
+    Model owning an AutoParsedAddressField, backed by a table created for these tests.
+    """
+
+    address = AutoParsedAddressField(related_name="+", null=True, blank=True)
+
+    class Meta:
+        app_label = "autoparsed_address_field"
+        managed = False
+
+
+class DeferredAddressOwner(models.Model):
+    """
+    Model owning an AutoParsedAddressField that defers parsing until save.
+    """
+
+    address = AutoParsedAddressField(
+        related_name="+", null=True, blank=True, defer_parsing=True
+    )
+
+    class Meta:
+        app_label = "autoparsed_address_field"
+        managed = False
+
+
+class RequiredDeferredAddressOwner(models.Model):
+    """
+    Model owning a non-null AutoParsedAddressField that defers parsing.
+    """
+
+    address = AutoParsedAddressField(related_name="+", defer_parsing=True)
+
+    class Meta:
+        app_label = "autoparsed_address_field"
+        managed = False
+
+
+class AddressOwnerTestCase(TestCase):
+    """
+    Creates the address owner tables around the test class.
+    """
+
+    owner_models = (AddressOwner, DeferredAddressOwner, RequiredDeferredAddressOwner)
+
+    @classmethod
+    def setUpClass(cls):
+        # SQLite can only alter the schema outside of the test transaction
+        with connection.schema_editor() as schema_editor:
+            for model in cls.owner_models:
+                schema_editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as schema_editor:
+            for model in cls.owner_models:
+                schema_editor.delete_model(model)
+
+
+class AddressDescriptorTest(AddressOwnerTestCase):
     def setUp(self):
-        # Mock the model field
-        self.mock_field = MagicMock()
-        self.mock_field.attname = "address_id"
-        self.mock_field.name = "address"
+        # The model field backing the descriptor
+        self.mock_field = AddressOwner._meta.get_field("address")
 
         # Create the descriptor
         self.descriptor = AddressDescriptor(self.mock_field)
 
-        # Create a mock instance
-        class MockInstance:
-            pass
-
-        self.mock_instance = MockInstance()
+        # Create an unsaved instance
+        self.mock_instance = AddressOwner()
 
     def test_get_with_valid_address(self):
         # Create an Address instance
@@ -47,7 +105,8 @@ class AddressDescriptorTest(TestCase):
         address.delete()
 
         # Retrieve the value using the descriptor
-        result = self.descriptor.__get__(self.mock_instance, None)
+        with self.assertNoLogs("autoparsed_address_field.descriptors"):
+            result = self.descriptor.__get__(self.mock_instance, None)
         self.assertIsNone(result)
 
     def test_set_with_string(self):
@@ -83,3 +142,183 @@ class AddressDescriptorTest(TestCase):
         # Attempt to set an invalid value
         with self.assertRaises(ValueError):
             self.descriptor.__set__(self.mock_instance, 12345)
+
+
+class AddressDescriptorCachingTest(AddressOwnerTestCase):
+    def setUp(self):
+        self.address = Address.objects.create(raw="123 Mock St, Mock City, MO")
+        self.owner = AddressOwner.objects.create(address=self.address)
+
+    def test_get_queries_once(self):
+        owner = AddressOwner.objects.get(pk=self.owner.pk)
+
+        with self.assertNumQueries(1):
+            first = owner.address
+            second = owner.address
+
+        self.assertEqual(first, self.address)
+        self.assertIs(first, second)
+
+    def test_get_caches_missing_address(self):
+        owner = AddressOwner.objects.create()
+
+        with self.assertNumQueries(0):
+            self.assertIsNone(owner.address)
+            self.assertIsNone(owner.address)
+
+    def test_set_replaces_cached_address(self):
+        other = Address.objects.create(raw="456 Mock Blvd, Mock Town, MT")
+        owner = AddressOwner.objects.get(pk=self.owner.pk)
+        self.assertEqual(owner.address, self.address)
+
+        owner.address = other
+
+        with self.assertNumQueries(0):
+            self.assertIs(owner.address, other)
+
+    def test_set_none_clears_cached_address(self):
+        owner = AddressOwner.objects.get(pk=self.owner.pk)
+        self.assertEqual(owner.address, self.address)
+
+        owner.address = None
+
+        self.assertIsNone(owner.address)
+        self.assertIsNone(owner.address_id)
+
+    def test_changing_attname_clears_cached_address(self):
+        other = Address.objects.create(raw="456 Mock Blvd, Mock Town, MT")
+        owner = AddressOwner.objects.get(pk=self.owner.pk)
+        self.assertEqual(owner.address, self.address)
+
+        owner.address_id = other.pk
+
+        self.assertEqual(owner.address, other)
+
+    def test_refresh_from_db_clears_cached_address(self):
+        other = Address.objects.create(raw="456 Mock Blvd, Mock Town, MT")
+        owner = AddressOwner.objects.get(pk=self.owner.pk)
+        self.assertEqual(owner.address, self.address)
+
+        AddressOwner.objects.filter(pk=owner.pk).update(address=other)
+        owner.refresh_from_db()
+
+        self.assertEqual(owner.address, other)
+
+
+class AddressDescriptorListingTest(AddressOwnerTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        country = Country.objects.create(name="USA", code="USA")
+        states = [
+            State.objects.create(name=name, code=code, country=country)
+            for name, code in (("OHIO", "OH"), ("TEXAS", "TX"))
+        ]
+        for i in range(20):
+            locality = Locality.objects.create(
+                name=f"TOWN {i}", postal_code=f"4{i:04d}", state=states[i % 2]
+            )
+            address = Address.objects.create(
+                formatted=f"{i} MAIN ST, TOWN {i}", locality=locality
+            )
+            AddressOwner.objects.create(address=address)
+
+    def test_listing_with_select_related(self):
+        with self.assertNumQueries(1):
+            owners = list(AddressOwner.objects.select_related("address"))
+            formatted = [owner.address.formatted for owner in owners]
+
+        self.assertEqual(len(formatted), 20)
+
+    def test_listing_with_prefetch_related(self):
+        with self.assertNumQueries(4):
+            owners = list(
+                AddressOwner.objects.prefetch_related("address__locality__state")
+            )
+            states = [owner.address.locality.state.code for owner in owners]
+
+        self.assertEqual(sorted(set(states)), ["OH", "TX"])
+
+    def test_listing_query_count_does_not_grow_with_rows(self):
+        with self.assertNumQueries(3):
+            owners = AddressOwner.objects.select_related(
+                "address__locality"
+            ).prefetch_related("address__locality__state__country")
+            for owner in owners:
+                self.assertEqual(owner.address.locality.state.country.code, "USA")
+
+
+class AddressDescriptorDeferredParsingTest(AddressOwnerTestCase):
+    raw_address = "456 Mock Blvd, Mock Town, MT"
+
+    def test_set_with_string_records_pending_address(self):
+        with self.assertNumQueries(0):
+            owner = DeferredAddressOwner(address=self.raw_address)
+
+        self.assertIsNone(owner.address_id)
+        self.assertIsNone(owner.address.pk)
+        self.assertEqual(owner.address.raw, self.raw_address)
+        self.assertFalse(Address.objects.filter(raw=self.raw_address).exists())
+
+    def test_save_resolves_pending_address(self):
+        owner = DeferredAddressOwner(address=self.raw_address)
+        owner.save()
+
+        address = Address.objects.get(raw=self.raw_address)
+        self.assertEqual(owner.address_id, address.pk)
+        self.assertEqual(owner.address, address)
+        self.assertEqual(
+            DeferredAddressOwner.objects.get(pk=owner.pk).address_id, address.pk
+        )
+
+    def test_save_reuses_existing_address(self):
+        address = Address.objects.create(raw=self.raw_address)
+
+        owner = DeferredAddressOwner.objects.create(address=self.raw_address)
+
+        self.assertEqual(owner.address_id, address.pk)
+        self.assertEqual(Address.objects.filter(raw=self.raw_address).count(), 1)
+
+    def test_assignment_replaces_pending_address(self):
+        address = Address.objects.create(raw="789 Mock Ave, Mock Village, CA")
+        owner = DeferredAddressOwner(address=self.raw_address)
+
+        owner.address = address
+        owner.save()
+
+        self.assertEqual(owner.address, address)
+        self.assertFalse(Address.objects.filter(raw=self.raw_address).exists())
+
+    def test_pending_address_validates_on_required_field(self):
+        owner = RequiredDeferredAddressOwner(address=self.raw_address)
+
+        with self.assertNumQueries(0):
+            owner.full_clean()
+        owner.save()
+
+        self.assertEqual(owner.address, Address.objects.get(raw=self.raw_address))
+
+    def test_required_field_without_address(self):
+        with self.assertRaises(ValidationError) as context:
+            RequiredDeferredAddressOwner().full_clean()
+
+        self.assertIn("address", context.exception.message_dict)
+
+    def test_required_field_without_address_is_none(self):
+        owner = RequiredDeferredAddressOwner()
+
+        with self.assertNoLogs("autoparsed_address_field.descriptors"):
+            self.assertIsNone(owner.address)
+            self.assertIsNone(owner.address)
+
+    def test_update_fields_without_address_keeps_it_pending(self):
+        owner = DeferredAddressOwner.objects.create()
+        owner.address = self.raw_address
+
+        owner.save(update_fields=[])
+        self.assertFalse(Address.objects.filter(raw=self.raw_address).exists())
+
+        owner.save(update_fields=["address"])
+        self.assertEqual(
+            DeferredAddressOwner.objects.get(pk=owner.pk).address.raw,
+            self.raw_address,
+        )
@@ -72,3 +72,14 @@ class AutoParsedAddressFieldTest(TestCase):
         field = self.TestModel._meta.get_field("address")
         descriptor = getattr(self.TestModel, "address")
         self.assertIsInstance(descriptor, AddressDescriptor)
+
+    def test_deconstruct_defer_parsing(self):
+        """
+        Test that defer_parsing is only serialized when enabled.
+        """
+        field = self.TestModel._meta.get_field("address")
+        _, _, _, kwargs = field.deconstruct()
+        self.assertNotIn("defer_parsing", kwargs)
+
+        _, _, _, kwargs = AutoParsedAddressField(defer_parsing=True).deconstruct()
+        self.assertTrue(kwargs["defer_parsing"])
@@ -0,0 +1,147 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.core.management import call_command
+from django.db import IntegrityError, connections, transaction
+from django.test import TestCase, TransactionTestCase
+
+from ..cache import get_reference_cache
+from ..models import Country, Locality, State
+
+
+class ReferenceDataManagerTest(TestCase):
+    def test_get_or_insert(self):
+        country, created = Country.objects.get_or_insert(
+            name="USA", defaults={"code": "USA"}
+        )
+        self.assertTrue(created)
+        self.assertIsNotNone(country.pk)
+        self.assertEqual(country.code, "USA")
+
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                Country.objects.get_or_insert(name="USA", defaults={"code": "X"}),
+                (country, False),
+            )
+
+    def test_conflict_on_other_constraint(self):
+        Country.objects.create(name="USA", code="USA")
+
+        with transaction.atomic():
+            with self.assertRaises(IntegrityError):
+                Country.objects.get_or_insert(
+                    name="UNITED STATES", defaults={"code": "USA"}
+                )
+            # The transaction is still usable
+            self.assertEqual(Country.objects.count(), 1)
+
+    def test_duplicate_null_postal_codes(self):
+        country = Country.objects.create(name="USA", code="USA")
+        state = State.objects.create(name="OHIO", country=country)
+        first = Locality.objects.create(name="COLUMBUS", postal_code=None, state=state)
+        Locality.objects.create(name="COLUMBUS", postal_code=None, state=state)
+
+        locality, created = Locality.objects.get_or_insert(
+            name="COLUMBUS", postal_code=None, state=state
+        )
+        self.assertEqual((locality, created), (first, False))
+
+
+class ReferenceDataConcurrencyTest(TransactionTestCase):
+    """
+    Resolves the same reference data from several threads, each with its own
+    connection. The in-memory test database can't be shared between
+    connections, so this runs against a temporary SQLite file.
+    """
+
+    alias = "reference_concurrency"
+    databases = {"default", alias}
+    threads = 8
+    localities = 25
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        connections.settings[cls.alias] = connections.configure_settings(
+            {
+                **connections.settings,
+                cls.alias: {
+                    "ENGINE": "django.db.backends.sqlite3",
+                    "NAME": os.path.join(cls.tmp_dir.name, "db.sqlite3"),
+                    "OPTIONS": {"timeout": 30},
+                },
+            }
+        )[cls.alias]
+        call_command("migrate", database=cls.alias, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[cls.alias].close()
+        del connections[cls.alias]
+        del connections.settings[cls.alias]
+        cls.tmp_dir.cleanup()
+
+    def setUp(self):
+        get_reference_cache().clear()
+        self.addCleanup(get_reference_cache().clear)
+
+    def resolve(self, index):
+        country, _ = Country.objects.db_manager(self.alias).get_or_create_cached(
+            name="USA", defaults={"code": "USA"}
+        )
+        state, _ = State.objects.db_manager(self.alias).get_or_create_cached(
+            name=f"STATE {index % 5}", country=country
+        )
+        locality, _ = Locality.objects.db_manager(self.alias).get_or_create_cached(
+            name=f"CITY {index}", postal_code=f"{index:05}", state=state
+        )
+        return locality.pk
+
+    def test_concurrent_resolution(self):
+        self.assert_resolves_concurrently()
+
+    def test_concurrent_resolution_without_cache(self):
+        with self.settings(ADDRESS_REFERENCE_CACHE_MAXSIZE=0):
+            self.assert_resolves_concurrently()
+
+    def assert_resolves_concurrently(self):
+        barrier = threading.Barrier(self.threads)
+        results = {}
+        errors = []
+
+        def worker(number):
+            try:
+                barrier.wait()
+                # Each worker walks the same keys in a different order
+                indexes = list(range(self.localities))
+                indexes = indexes[number:] + indexes[:number]
+                for _ in range(3):
+                    for index in indexes:
+                        results.setdefault(index, set()).add(self.resolve(index))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections[self.alias].close()
+
+        threads = [
+            threading.Thread(target=worker, args=(number,))
+            for number in range(self.threads)
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Country.objects.using(self.alias).count(), 1)
+        self.assertEqual(State.objects.using(self.alias).count(), 5)
+        self.assertEqual(Locality.objects.using(self.alias).count(), self.localities)
+        # Every worker resolved each key to the same row
+        self.assertTrue(all(len(pks) == 1 for pks in results.values()))
+        self.assertLess(elapsed, 10)
@@ -0,0 +1,60 @@
+from importlib import import_module
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase
+
+from ..models import Address
+from ..utils.raw_key import generate_raw_key
+
+backfill_migration = import_module(
+    "autoparsed_address_field.migrations.0004_backfill_address_raw_key"
+)
+
+
+class BackfillRawKeyMigrationTest(TestCase):
+    def backfill(self):
+        schema_editor = SimpleNamespace(connection=connection)
+        backfill_migration.backfill_raw_key(apps, schema_editor)
+
+    def create_unkeyed(self, raw):
+        address = Address(raw=raw)
+        address.save(skip_parsing=True)
+        Address.objects.filter(pk=address.pk).update(raw_key=None)
+        return address
+
+    def test_backfills_raw_key(self):
+        address = self.create_unkeyed("123 Main St, Springfield, IL")
+        blank = self.create_unkeyed("")
+
+        self.backfill()
+
+        address.refresh_from_db()
+        blank.refresh_from_db()
+        self.assertEqual(address.raw_key, generate_raw_key(address.raw))
+        self.assertIsNone(blank.raw_key)
+
+    def test_duplicates_keep_null_key(self):
+        first = self.create_unkeyed("123 Main St")
+        duplicate = self.create_unkeyed("123  main st ")
+
+        self.backfill()
+
+        first.refresh_from_db()
+        duplicate.refresh_from_db()
+        self.assertEqual(first.raw_key, generate_raw_key("123 Main St"))
+        self.assertIsNone(duplicate.raw_key)
+
+    def test_backfills_across_batches(self):
+        addresses = [self.create_unkeyed(f"{i} Main St") for i in range(5)]
+
+        with patch.object(backfill_migration, "BATCH_SIZE", 2):
+            self.backfill()
+
+        self.assertFalse(
+            Address.objects.filter(
+                pk__in=[a.pk for a in addresses], raw_key__isnull=True
+            ).exists()
+        )
@@ -1,6 +1,23 @@
-from django.test import TestCase
+import asyncio
+import gc
+import time
+from unittest.mock import patch
 
+from asgiref.sync import sync_to_async
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..cache import get_geocode_cache
 from ..models import Address, Country, State, Locality
+from ..services import ArcGISGeocodingService
+from ..services.base import _async_semaphores, get_async_semaphore
+from ..signals import addresses_parsed
+from ..utils.raw_key import generate_raw_key
+from ..utils.uuid import generate_uuid_from_address
+from .fake_geocoder import FakeGeocodingService, GeocodeCacheTestMixin, make_raws
 
 
 class AddressModelTest(TestCase):
@@ -104,3 +121,470 @@ class AddressModelTest(TestCase):
                 address.parse_address()
 
             self.assertIn("Unsupported geocoding provider", str(context.exception))
+
+    def test_save_sets_raw_key(self):
+        """
+        Test that saving stores the normalized raw key.
+        """
+        address = Address(raw="123 Main St, Springfield, IL")
+        address.save(skip_parsing=True)
+
+        self.assertEqual(address.raw_key, generate_raw_key(address.raw))
+
+    def test_get_or_create_from_raw_matches_normalized_raw(self):
+        """
+        Test that equivalent raw strings resolve to the same Address.
+        """
+        with self.settings(ADDRESS_GEOCODER_PROVIDER="scourgify"):
+            address, created = Address.objects.get_or_create_from_raw("123 Main St")
+            same, same_created = Address.objects.get_or_create_from_raw("123  main st ")
+
+        self.assertTrue(created)
+        self.assertFalse(same_created)
+        self.assertEqual(address.pk, same.pk)
+        self.assertEqual(same.raw, "123 Main St")
+
+    def test_save_with_existing_raw_keeps_row(self):
+        """
+        Test that saving a new Address with an existing raw key raises instead
+        of overwriting the existing row.
+        """
+        first = Address(
+            raw="123 Main St, Springfield, IL",
+            address_line_2="Apt 4B",
+            locality=self.locality,
+            formatted="123 MAIN ST, APT 4B, LOS ANGELES, CA 90001",
+            parse_status=Address.ParseStatus.OK,
+        )
+        first.save(skip_parsing=True)
+
+        with self.assertRaises(ValidationError) as context:
+            Address(raw="123  main st, springfield, il").save(skip_parsing=True)
+        with self.assertRaises(ValidationError):
+            Address.objects.create(raw="123 MAIN ST, SPRINGFIELD, IL")
+
+        self.assertIn("raw", context.exception.message_dict)
+        self.assertEqual(Address.objects.count(), 1)
+        first.refresh_from_db()
+        self.assertEqual(first.raw, "123 Main St, Springfield, IL")
+        self.assertEqual(first.address_line_2, "Apt 4B")
+        self.assertEqual(first.locality, self.locality)
+        self.assertEqual(first.parse_status, Address.ParseStatus.OK)
+
+    def test_get_or_create_from_raw_keeps_existing_row(self):
+        """
+        Test that get_or_create_from_raw returns an existing Address unchanged.
+        """
+        first = Address(raw="123 Main St, Springfield, IL", address_line_2="Apt 4B")
+        first.save(skip_parsing=True)
+
+        address, created = Address.objects.get_or_create_from_raw(
+            "123  main st, springfield, il", defaults={"address_line_2": ""}
+        )
+
+        self.assertFalse(created)
+        self.assertEqual(address.pk, first.pk)
+        self.assertEqual(address.address_line_2, "Apt 4B")
+
+    def test_changing_raw_to_existing_raw(self):
+        """
+        Test that changing raw to another Address's raw key raises
+        ValidationError, from save() and full_clean().
+        """
+        Address.objects.create(raw="123 Main St, Springfield, IL")
+        address = Address.objects.create(raw="456 Main St, Springfield, IL")
+        address.raw = "123 main st, springfield, il"
+
+        with self.assertRaises(ValidationError):
+            address.full_clean()
+        with self.assertRaises(ValidationError):
+            address.save(skip_parsing=True)
+
+        address.refresh_from_db()
+        self.assertEqual(address.raw, "456 Main St, Springfield, IL")
+
+    def test_get_or_create_from_blank_raw(self):
+        """
+        Test that blank raw strings always create a new Address.
+        """
+        first, first_created = Address.objects.get_or_create_from_raw("")
+        second, second_created = Address.objects.get_or_create_from_raw("")
+
+        self.assertTrue(first_created)
+        self.assertTrue(second_created)
+        self.assertNotEqual(first.pk, second.pk)
+
+    def test_geocoding_service_is_reused(self):
+        """
+        Test that saves share one service instance per provider.
+        """
+        with self.settings(ADDRESS_GEOCODER_PROVIDER="arcgis"):
+            service = Address()._get_geocoding_service()
+            self.assertIsInstance(service, ArcGISGeocodingService)
+            self.assertIs(Address()._get_geocoding_service(), service)
+
+
+@patch.object(Address, "parse_address")
+class AddressDirtyTrackingTest(TestCase):
+    raw_address = "123 Main St, Springfield, IL"
+
+    def setUp(self):
+        address = Address(raw=self.raw_address, formatted="123 MAIN ST")
+        address.save(skip_parsing=True)
+        self.pk = address.pk
+
+    def test_new_address_is_parsed(self, parse_address):
+        """
+        Test that a new address with a raw value is parsed.
+        """
+        Address.objects.create(raw="456 Main St, Anytown, TX")
+        parse_address.assert_called_once_with()
+
+    def test_unchanged_raw_is_not_parsed(self, parse_address):
+        """
+        Test that saving unrelated changes doesn't parse again.
+        """
+        address = Address.objects.get(pk=self.pk)
+        address.latitude = 39.99
+        address.save()
+
+        parse_address.assert_not_called()
+        self.assertFalse(address.raw_has_changed())
+
+    def test_changed_raw_is_parsed(self, parse_address):
+        """
+        Test that changing the raw value parses it.
+        """
+        address = Address.objects.get(pk=self.pk)
+        address.raw = "456 Main St, Anytown, TX"
+        self.assertTrue(address.raw_has_changed())
+
+        address.save()
+
+        parse_address.assert_called_once_with()
+        self.assertFalse(address.raw_has_changed())
+
+    def test_changed_raw_updates_raw_key(self, parse_address):
+        """
+        Test that the raw key follows the raw value.
+        """
+        address = Address.objects.get(pk=self.pk)
+        address.raw = "456 Main St, Anytown, TX"
+        address.save(update_fields=["raw"])
+
+        address.refresh_from_db()
+        self.assertEqual(address.raw_key, generate_raw_key(address.raw))
+
+    def test_force_parsing(self, parse_address):
+        """
+        Test that force_parsing parses an unchanged raw value.
+        """
+        address = Address.objects.get(pk=self.pk)
+        address.save(force_parsing=True)
+
+        parse_address.assert_called_once_with()
+
+    def test_skip_parsing_with_changed_raw(self, parse_address):
+        """
+        Test that skip_parsing still prevents parsing.
+        """
+        address = Address.objects.get(pk=self.pk)
+        address.raw = "456 Main St, Anytown, TX"
+        address.save(skip_parsing=True)
+
+        parse_address.assert_not_called()
+
+    def test_deferred_raw_is_not_loaded_or_parsed(self, parse_address):
+        """
+        Test that saving with a deferred raw value neither loads nor parses it.
+        """
+        address = Address.objects.defer("raw").get(pk=self.pk)
+        address.latitude = 39.99
+
+        with self.assertNumQueries(1):
+            address.save()
+
+        parse_address.assert_not_called()
+
+    def test_refresh_from_db_resets_tracking(self, parse_address):
+        """
+        Test that refreshing discards the unsaved raw change.
+        """
+        address = Address.objects.get(pk=self.pk)
+        address.raw = "456 Main St, Anytown, TX"
+        address.refresh_from_db()
+
+        self.assertFalse(address.raw_has_changed())
+
+
+class BulkCreateFromRawTest(GeocodeCacheTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = FakeGeocodingService()
+        patcher = patch.object(
+            Address, "_get_geocoding_service", return_value=self.service
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_creates_parsed_addresses(self):
+        raws = [
+            "1 Main St, Springfield, IL 62701",
+            "1  main st, springfield, il 62701",
+            "",
+            "2 Main St, Chicago, IL 60601",
+            "Invalid Address",
+        ]
+
+        addresses = Address.objects.bulk_create_from_raw(raws)
+
+        self.assertEqual(Address.objects.count(), 3)
+        self.assertIs(addresses[0], addresses[1])
+        self.assertIsNone(addresses[2])
+        first = Address.objects.get(pk=addresses[0].pk)
+        self.assertEqual(first.raw, raws[0])
+        self.assertEqual(first.raw_key, generate_raw_key(raws[0]))
+        self.assertEqual(first.formatted, "1 MAIN ST, SPRINGFIELD, IL 62701")
+        self.assertEqual(first.locality.name, "SPRINGFIELD")
+        self.assertEqual(first.locality.state.country.code, "USA")
+        self.assertEqual(first.address_id, generate_uuid_from_address(first))
+        self.assertEqual(addresses[3].locality.name, "CHICAGO")
+        self.assertEqual(addresses[3].locality.state, first.locality.state)
+        self.assertIsNone(Address.objects.get(pk=addresses[4].pk).locality)
+        self.assertEqual(Locality.objects.count(), 2)
+
+    def test_batches(self):
+        raws = make_raws(5)
+
+        addresses = Address.objects.bulk_create_from_raw(raws, batch_size=2)
+
+        self.assertEqual([len(batch) for batch in self.service.batches], [2, 2, 1])
+        self.assertEqual([address.raw for address in addresses], raws)
+        self.assertEqual(Locality.objects.count(), 1)
+
+    def test_queries_per_batch_are_constant(self):
+        # Creates the Country and State
+        Address.objects.bulk_create_from_raw(make_raws(1))
+
+        with CaptureQueriesContext(connection) as few:
+            Address.objects.bulk_create_from_raw(
+                make_raws(5, city="Peoria", postal_code="61602")
+            )
+        with CaptureQueriesContext(connection) as many:
+            Address.objects.bulk_create_from_raw(
+                make_raws(50, city="Chicago", postal_code="60601")
+            )
+
+        self.assertEqual(len(few), len(many))
+
+    def test_existing_addresses_are_reused(self):
+        existing = Address(raw="1 Main St, Springfield, IL 62701")
+        existing.save(skip_parsing=True)
+
+        addresses = Address.objects.bulk_create_from_raw(make_raws(2))
+
+        self.assertEqual(addresses[0], existing)
+        self.assertEqual(self.service.geocoded, [make_raws(2)[1]])
+        self.assertEqual(Address.objects.count(), 2)
+
+    def test_skip_parsing(self):
+        addresses = Address.objects.bulk_create_from_raw(
+            make_raws(2), skip_parsing=True
+        )
+
+        self.assertEqual(self.service.geocoded, [])
+        self.assertIsNone(addresses[0].formatted)
+        self.assertTrue(addresses[0].address_id)
+        self.assertFalse(addresses[0].raw_has_changed())
+
+    def test_parse_status(self):
+        parsed, failed = Address.objects.bulk_create_from_raw(
+            [make_raws(1)[0], "Invalid Address"]
+        )
+        with patch.object(self.service, "geocode_many", side_effect=RuntimeError):
+            (pending,) = Address.objects.bulk_create_from_raw(
+                make_raws(1, city="Chicago", postal_code="60601")
+            )
+        (unparsed,) = Address.objects.bulk_create_from_raw(
+            make_raws(1, city="Peoria", postal_code="61602"), skip_parsing=True
+        )
+
+        statuses = dict(Address.objects.values_list("pk", "parse_status"))
+        self.assertEqual(statuses[parsed.pk], Address.ParseStatus.OK)
+        self.assertEqual(statuses[failed.pk], Address.ParseStatus.FAILED)
+        self.assertEqual(statuses[pending.pk], Address.ParseStatus.PENDING)
+        self.assertEqual(statuses[unparsed.pk], "")
+
+    def test_known_bad_address_is_not_geocoded_again(self):
+        Address.objects.bulk_create_from_raw(["Invalid Address"])
+
+        address = Address(raw="invalid  ADDRESS")
+        address.parse_address()
+
+        self.assertEqual(self.service.geocoded, ["Invalid Address"])
+        self.assertEqual(address.parse_status, Address.ParseStatus.FAILED)
+        self.assertEqual(get_geocode_cache().stats()["negative_hits"], 1)
+
+        with self.settings(ADDRESS_GEOCODE_CACHE_NEGATIVE_TIMEOUT=0):
+            address.parse_address()
+        self.assertEqual(len(self.service.geocoded), 2)
+
+    def test_save_marks_address_pending_on_error(self):
+        address = Address(raw=make_raws(1)[0])
+        with patch.object(self.service, "geocode", side_effect=RuntimeError):
+            address.save()
+
+        address.refresh_from_db()
+        self.assertEqual(address.parse_status, Address.ParseStatus.PENDING)
+        self.assertIsNone(address.locality)
+
+        address.save(force_parsing=True)
+        address.refresh_from_db()
+        self.assertEqual(address.parse_status, Address.ParseStatus.OK)
+        self.assertEqual(address.locality.name, "SPRINGFIELD")
+
+    def test_signal_is_sent_per_batch(self):
+        batches = []
+
+        def receiver(sender, model_name, address_instances, **kwargs):
+            batches.append([address.pk for address in address_instances])
+
+        addresses_parsed.connect(receiver)
+        self.addCleanup(addresses_parsed.disconnect, receiver)
+        Address.objects.bulk_create_from_raw(make_raws(3), batch_size=2)
+        Address.objects.bulk_create_from_raw(make_raws(3), batch_size=2)
+
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(
+            sorted(pk for batch in batches for pk in batch),
+            sorted(Address.objects.values_list("pk", flat=True)),
+        )
+
+
+class SlowAsyncGeocodingService(FakeGeocodingService):
+    """
+    FakeGeocodingService whose async geocodes take `delay` seconds, tracking
+    how many are in flight at once.
+    """
+
+    delay = 0.05
+
+    def __init__(self):
+        super().__init__()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def ageocode(self, raw):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            return self.geocode(raw)
+        finally:
+            self.in_flight -= 1
+
+
+class AsyncSemaphoreTest(SimpleTestCase):
+    def test_dropped_when_the_loop_shuts_down(self):
+        async def contend():
+            semaphore = get_async_semaphore()
+
+            async def hold():
+                async with semaphore:
+                    await asyncio.sleep(0)
+
+            await asyncio.gather(hold(), hold())
+            return semaphore
+
+        with self.settings(ADDRESS_ASYNC_CONCURRENCY=1):
+            semaphores = [asyncio.run(contend()) for _ in range(5)]
+            gc.collect()
+
+            self.assertEqual(len(set(map(id, semaphores))), 5)
+            self.assertEqual(len(_async_semaphores), 0)
+
+
+class AsyncAddressTest(GeocodeCacheTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = SlowAsyncGeocodingService()
+        patcher = patch.object(
+            Address, "_get_geocoding_service", return_value=self.service
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_aget_or_create_from_raw(self):
+        raw = make_raws(1)[0]
+
+        address, created = await Address.objects.aget_or_create_from_raw(raw)
+        again, created_again = await Address.objects.aget_or_create_from_raw(
+            raw.lower()
+        )
+
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(again, address)
+        self.assertEqual(address.formatted, "1 MAIN ST, SPRINGFIELD, IL 62701")
+        self.assertEqual(address.locality.name, "SPRINGFIELD")
+        self.assertEqual(address.address_id, generate_uuid_from_address(address))
+        self.assertFalse(address.raw_has_changed())
+        self.assertEqual(self.service.geocoded, [raw])
+
+    async def test_concurrent_geocodes_are_bounded(self):
+        raws = make_raws(40)
+
+        with self.settings(ADDRESS_ASYNC_CONCURRENCY=10):
+            started = time.monotonic()
+            results = await asyncio.gather(
+                *(Address.objects.aget_or_create_from_raw(raw) for raw in raws)
+            )
+            elapsed = time.monotonic() - started
+
+        self.assertTrue(all(created for _, created in results))
+        self.assertEqual(await sync_to_async(Address.objects.count)(), 40)
+        self.assertEqual(self.service.max_in_flight, 10)
+        # 40 geocodes of 50ms each take 2s one after another
+        self.assertLess(elapsed, 40 * self.service.delay / 2)
+
+    async def test_concurrent_calls_for_the_same_address(self):
+        raw = make_raws(1)[0]
+
+        results = await asyncio.gather(
+            *(Address.objects.aget_or_create_from_raw(raw) for _ in range(5))
+        )
+
+        self.assertEqual(len({address.pk for address, _ in results}), 1)
+        self.assertEqual([created for _, created in results].count(True), 1)
+        self.assertEqual(await sync_to_async(Address.objects.count)(), 1)
+        # The concurrent parses share one provider call
+        self.assertEqual(self.service.geocoded, [raw])
+
+    async def test_failed_geocode_still_creates_address(self):
+        address, created = await Address.objects.aget_or_create_from_raw(
+            "Invalid Address"
+        )
+
+        self.assertTrue(created)
+        self.assertIsNotNone(address.pk)
+        self.assertIsNone(address.formatted)
+        self.assertIsNone(address.locality_id)
+        self.assertEqual(address.parse_status, Address.ParseStatus.FAILED)
+
+        other = Address(raw="INVALID ADDRESS")
+        await other.aparse_address()
+        self.assertEqual(other.parse_status, Address.ParseStatus.FAILED)
+        self.assertEqual(self.service.geocoded, ["Invalid Address"])
+
+    async def test_asave_parses_changed_raw(self):
+        address = Address(raw=make_raws(1)[0])
+        await address.asave()
+        self.assertEqual(address.locality.name, "SPRINGFIELD")
+
+        address.raw = make_raws(1, city="Chicago", postal_code="60601")[0]
+        await address.asave(skip_parsing=True)
+        self.assertEqual(address.locality.name, "SPRINGFIELD")
+
+        await address.asave(force_parsing=True)
+        self.assertEqual(address.locality.name, "CHICAGO")
+        self.assertEqual(len(self.service.geocoded), 2)
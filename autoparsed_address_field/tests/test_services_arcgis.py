@@ -1,7 +1,54 @@
-from django.test import TestCase
+import asyncio
+import json
+import multiprocessing
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import AsyncMock, patch
+
+from django.test import SimpleTestCase, TestCase
+from geopy.location import Location
 
 from ..models import Address, Country, State, Locality
 from ..services import ArcGISGeocodingService
+from ..services.arcgis import (
+    PooledAioHTTPAdapter,
+    _async_geolocators,
+    aclose_async_geolocator,
+    get_async_geolocator,
+    get_circuit_breaker,
+    get_geolocator,
+    reset_geolocator,
+    reset_throttling,
+)
+from ..throttling import CircuitBreaker
+from .fake_geocoder import GeocodeCacheTestMixin
+from .stub_arcgis import StubArcGISServer, make_candidate
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+WHITE_HOUSE_CANDIDATE = {
+    "address": "1600 Pennsylvania Ave NW, Washington, District of Columbia, 20500",
+    "location": {"x": -77.03654, "y": 38.89767},
+    "score": 100,
+    "attributes": {
+        "StAddr": "1600 Pennsylvania Ave NW",
+        "SubAddr": "",
+        "City": "Washington",
+        "Region": "District of Columbia",
+        "RegionAbbr": "DC",
+        "Postal": "20500",
+        "Country": "USA",
+    },
+}
+
+
+def make_location(candidate):
+    location = candidate["location"]
+    return Location(candidate["address"], (location["y"], location["x"]), candidate)
 
 
 class ArcGISGeocodingServiceTest(TestCase):
@@ -56,3 +103,491 @@ class ArcGISGeocodingServiceTest(TestCase):
         locality = Locality.objects.get(name="WASHINGTON", state=state)
 
         self.assertIsNotNone(locality)
+
+
+@patch("autoparsed_address_field.services.arcgis.ArcGIS")
+class ArcGISGeocodingServiceMockedTest(GeocodeCacheTestMixin, TestCase):
+    raw_address = "1600 Pennsylvania Ave NW, Washington, DC 20500"
+
+    def setUp(self):
+        super().setUp()
+        reset_geolocator()
+        self.addCleanup(reset_geolocator)
+
+    def test_parse_populates_address(self, arcgis):
+        arcgis.return_value.geocode.return_value = make_location(WHITE_HOUSE_CANDIDATE)
+        address = Address(raw=self.raw_address)
+
+        ArcGISGeocodingService().parse(address)
+
+        self.assertEqual(address.address_line_1, "1600 PENNSYLVANIA AVE NW")
+        self.assertEqual(
+            address.formatted,
+            "1600 PENNSYLVANIA AVE NW, WASHINGTON, DISTRICT OF COLUMBIA 20500",
+        )
+        self.assertEqual(address.latitude, 38.89767)
+        self.assertEqual(address.longitude, -77.03654)
+        self.assertEqual(address.locality.name, "WASHINGTON")
+        self.assertEqual(address.locality.state.code, "DC")
+        self.assertEqual(address.locality.state.country.code, "USA")
+
+    def test_parse_low_score(self, arcgis):
+        arcgis.return_value.geocode.return_value = make_location(
+            {**WHITE_HOUSE_CANDIDATE, "score": 80}
+        )
+        address = Address(raw=self.raw_address)
+
+        ArcGISGeocodingService().parse(address)
+
+        self.assertIsNone(address.formatted)
+        self.assertIsNone(address.locality)
+
+    def test_parse_uses_cached_result(self, arcgis):
+        arcgis.return_value.geocode.return_value = make_location(WHITE_HOUSE_CANDIDATE)
+        service = ArcGISGeocodingService()
+
+        first = Address(raw=self.raw_address)
+        service.parse(first)
+        second = Address(raw=self.raw_address.lower())
+        service.parse(second)
+
+        arcgis.return_value.geocode.assert_called_once()
+        self.assertEqual(second.formatted, first.formatted)
+        self.assertEqual(second.locality, first.locality)
+
+
+def report_child_geolocator(parent_geolocator_id, connection):
+    from ..services import arcgis
+
+    connection.send(
+        (arcgis._geolocator is None, id(get_geolocator()) != parent_geolocator_id)
+    )
+    connection.close()
+
+
+class ArcGISGeolocatorTest(SimpleTestCase):
+    def setUp(self):
+        reset_geolocator()
+        self.addCleanup(reset_geolocator)
+
+    def test_geolocator_is_reused(self):
+        self.assertIs(get_geolocator(), get_geolocator())
+
+    def test_geolocator_is_shared_between_threads(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            geolocators = set(
+                map(id, executor.map(lambda _: get_geolocator(), range(32)))
+            )
+
+        self.assertEqual(len(geolocators), 1)
+
+    def test_geolocator_configured_from_settings(self):
+        with self.settings(
+            ADDRESS_ARCGIS_POOL_SIZE=25,
+            ADDRESS_ARCGIS_TIMEOUT=3,
+            ADDRESS_ARCGIS_SCHEME="http",
+            ADDRESS_ARCGIS_DOMAIN="localhost:8000",
+        ):
+            geolocator = get_geolocator()
+
+            self.assertEqual(geolocator.timeout, 3)
+            self.assertTrue(geolocator.api.startswith("http://localhost:8000/"))
+            http_adapter = geolocator.adapter.session.get_adapter("http://localhost")
+            self.assertEqual(http_adapter._pool_maxsize, 25)
+
+        self.assertIsNot(get_geolocator(), geolocator)
+
+    def test_geolocator_recreated_after_fork(self):
+        parent_geolocator = get_geolocator()
+        context = multiprocessing.get_context("fork")
+        receiver, sender = context.Pipe(duplex=False)
+
+        process = context.Process(
+            target=report_child_geolocator, args=(id(parent_geolocator), sender)
+        )
+        process.start()
+        reset_in_child, recreated_in_child = receiver.recv()
+        process.join()
+
+        self.assertTrue(reset_in_child)
+        self.assertTrue(recreated_in_child)
+        self.assertIs(get_geolocator(), parent_geolocator)
+
+
+class ArcGISBatchGeocodingTest(GeocodeCacheTestMixin, TestCase):
+    candidates = {
+        f"{number} Main St, Columbus, OH 43212": make_candidate(
+            f"{number} Main St", "Columbus", "Ohio", "OH", "43212", -83.0, 39.9
+        )
+        for number in range(100, 105)
+    }
+
+    def setUp(self):
+        super().setUp()
+        reset_geolocator()
+        self.addCleanup(reset_geolocator)
+
+        self.server = StubArcGISServer(self.candidates, suggested_batch_size=3)
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        # Batch geocoding needs a token
+        self.batch_settings = {**self.server.settings, "ADDRESS_ARCGIS_API_KEY": "key"}
+
+    def test_parse_many_in_batches(self):
+        raws = list(self.candidates) + ["Invalid Address"]
+        addresses = [Address(raw=raw) for raw in raws]
+
+        with self.settings(**self.batch_settings, ADDRESS_ARCGIS_BATCH_SIZE=2):
+            ArcGISGeocodingService().parse_many(addresses)
+
+        batches = self.server.operations("geocodeAddresses")
+        self.assertEqual(len(batches), 3)
+        for address, raw in zip(addresses, raws[:-1]):
+            self.assertEqual(address.address_line_1, raw.split(",")[0].upper())
+            self.assertEqual(address.locality.name, "COLUMBUS")
+            self.assertEqual(address.locality.state.code, "OH")
+            self.assertEqual(address.latitude, 39.9)
+        self.assertIsNone(addresses[-1].formatted)
+        self.assertIsNone(addresses[-1].locality)
+
+    def test_batch_size_from_service(self):
+        with self.settings(**self.batch_settings):
+            service = ArcGISGeocodingService()
+            results = service.geocode_many(list(self.candidates))
+            self.assertEqual(service.get_batch_size(), 3)
+
+        self.assertEqual(len(self.server.operations("")), 1)
+        self.assertEqual(len(self.server.operations("geocodeAddresses")), 2)
+        self.assertTrue(all(results))
+
+    def test_batch_size_capped_by_service_maximum(self):
+        self.server.max_batch_size = 2
+
+        with self.settings(**self.server.settings):
+            self.assertEqual(ArcGISGeocodingService().get_batch_size(), 2)
+
+    def test_parse_many_skips_cached_and_duplicate_addresses(self):
+        raw = next(iter(self.candidates))
+
+        with self.settings(**self.batch_settings, ADDRESS_ARCGIS_BATCH_SIZE=10):
+            service = ArcGISGeocodingService()
+            service.parse(Address(raw=raw))
+            addresses = [Address(raw=raw) for raw in self.candidates]
+            addresses.append(Address(raw=raw.upper()))
+            service.parse_many(addresses)
+
+        (batch,) = self.server.operations("geocodeAddresses")
+        records = json.loads(batch[2]["addresses"])["records"]
+        self.assertEqual(len(records), len(self.candidates) - 1)
+        self.assertNotIn(
+            raw, [record["attributes"]["SingleLine"] for record in records]
+        )
+        self.assertTrue(all(address.formatted for address in addresses))
+
+    def test_api_key_is_sent(self):
+        with self.settings(
+            **self.server.settings,
+            ADDRESS_ARCGIS_BATCH_SIZE=10,
+            ADDRESS_ARCGIS_API_KEY="secret",
+        ):
+            ArcGISGeocodingService().geocode_many(list(self.candidates))
+
+        (batch,) = self.server.operations("geocodeAddresses")
+        self.assertEqual(batch[2]["token"], "secret")
+
+    def test_parse_many_without_api_key(self):
+        raws = list(self.candidates) + ["Invalid Address"]
+        addresses = [Address(raw=raw) for raw in raws]
+
+        with self.settings(**self.server.settings):
+            ArcGISGeocodingService().parse_many(addresses)
+
+        self.assertEqual(self.server.operations("geocodeAddresses"), [])
+        self.assertEqual(
+            len(self.server.operations("findAddressCandidates")), len(raws)
+        )
+        for address, raw in zip(addresses, raws[:-1]):
+            self.assertEqual(address.address_line_1, raw.split(",")[0].upper())
+            self.assertEqual(address.parse_status, Address.ParseStatus.OK)
+        self.assertEqual(addresses[-1].parse_status, Address.ParseStatus.FAILED)
+
+    def test_single_geocode_through_stub(self):
+        raw = next(iter(self.candidates))
+        address = Address(raw=raw)
+
+        with self.settings(**self.server.settings):
+            ArcGISGeocodingService().parse(address)
+
+        self.assertEqual(address.address_line_1, raw.split(",")[0].upper())
+        self.assertEqual(len(self.server.operations("findAddressCandidates")), 1)
+
+
+@patch("autoparsed_address_field.services.arcgis.get_async_geolocator")
+class ArcGISAsyncGeocodingMockedTest(GeocodeCacheTestMixin, TestCase):
+    raw_address = "1600 Pennsylvania Ave NW, Washington, DC 20500"
+
+    async def test_aparse_populates_address(self, get_async_geolocator):
+        geocode = get_async_geolocator.return_value.geocode = AsyncMock(
+            return_value=make_location(WHITE_HOUSE_CANDIDATE)
+        )
+        service = ArcGISGeocodingService()
+
+        first = Address(raw=self.raw_address)
+        await service.aparse(first)
+        second = Address(raw=self.raw_address.upper())
+        await service.aparse(second)
+
+        geocode.assert_awaited_once_with(
+            self.raw_address, exactly_one=True, out_fields="*"
+        )
+        self.assertEqual(first.address_line_1, "1600 PENNSYLVANIA AVE NW")
+        self.assertEqual(first.latitude, 38.89767)
+        self.assertEqual(first.locality.name, "WASHINGTON")
+        self.assertEqual(second.locality, first.locality)
+
+    async def test_aparse_low_score(self, get_async_geolocator):
+        get_async_geolocator.return_value.geocode = AsyncMock(
+            return_value=make_location({**WHITE_HOUSE_CANDIDATE, "score": 80})
+        )
+        address = Address(raw=self.raw_address)
+
+        await ArcGISGeocodingService().aparse(address)
+
+        self.assertIsNone(address.formatted)
+        self.assertIsNone(address.locality)
+
+
+class ArcGISAsyncGeolocatorLifetimeTest(SimpleTestCase):
+    def setUp(self):
+        reset_geolocator()
+        self.addCleanup(reset_geolocator)
+        # Lets the adapter be created without aiohttp; no session is opened
+        patcher = patch("geopy.adapters.aiohttp_available", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch.object(PooledAioHTTPAdapter, "__aexit__", new_callable=AsyncMock)
+    def test_closed_when_the_loop_shuts_down(self, aexit):
+        async def geolocate():
+            geolocator = get_async_geolocator()
+            self.assertIs(get_async_geolocator(), geolocator)
+            return asyncio.get_running_loop()
+
+        for _ in range(3):
+            loop = asyncio.run(geolocate())
+            self.assertNotIn(loop, _async_geolocators)
+
+        self.assertEqual(aexit.await_count, 3)
+        self.assertEqual(len(_async_geolocators), 0)
+
+    @patch.object(PooledAioHTTPAdapter, "__aexit__", new_callable=AsyncMock)
+    def test_closed_explicitly(self, aexit):
+        async def geolocate():
+            geolocator = get_async_geolocator()
+            await aclose_async_geolocator()
+            self.assertIsNot(get_async_geolocator(), geolocator)
+
+        asyncio.run(geolocate())
+
+        self.assertEqual(aexit.await_count, 2)
+
+
+@unittest.skipUnless(aiohttp, "aiohttp is not installed")
+class ArcGISAsyncGeolocatorTest(GeocodeCacheTestMixin, TestCase):
+    candidates = {
+        f"{number} Main St, Columbus, OH 43212": make_candidate(
+            f"{number} Main St", "Columbus", "Ohio", "OH", "43212", -83.0, 39.9
+        )
+        for number in range(100, 120)
+    }
+
+    def setUp(self):
+        super().setUp()
+        reset_geolocator()
+        self.addCleanup(reset_geolocator)
+
+        self.server = StubArcGISServer(self.candidates)
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+
+    async def test_geolocator_is_reused_within_a_loop(self):
+        with self.settings(**self.server.settings):
+            geolocator = get_async_geolocator()
+            self.assertIs(get_async_geolocator(), geolocator)
+            await aclose_async_geolocator()
+            self.assertIsNot(get_async_geolocator(), geolocator)
+            await aclose_async_geolocator()
+
+    def test_session_closed_with_the_loop(self):
+        async def geolocate():
+            adapter = get_async_geolocator().adapter
+            self.assertFalse(adapter.session.closed)
+            return adapter.__dict__["session"]
+
+        session = asyncio.run(geolocate())
+
+        self.assertTrue(session.closed)
+
+    async def test_concurrent_aparse(self):
+        self.server.latency = 0.1
+        addresses = [Address(raw=raw) for raw in self.candidates]
+
+        with self.settings(**self.server.settings, ADDRESS_ARCGIS_POOL_SIZE=20):
+            try:
+                await asyncio.gather(
+                    *(ArcGISGeocodingService().aparse(a) for a in addresses)
+                )
+            finally:
+                await aclose_async_geolocator()
+
+        self.assertEqual(len(self.server.operations("findAddressCandidates")), 20)
+        for address, raw in zip(addresses, self.candidates):
+            self.assertEqual(address.address_line_1, raw.split(",")[0].upper())
+            self.assertEqual(address.locality.name, "COLUMBUS")
+
+
+class ArcGISThrottlingTest(GeocodeCacheTestMixin, TestCase):
+    candidates = {
+        f"{number} Main St, Columbus, OH 43212": make_candidate(
+            f"{number} Main St", "Columbus", "Ohio", "OH", "43212", -83.0, 39.9
+        )
+        for number in range(100, 105)
+    }
+
+    def setUp(self):
+        super().setUp()
+        reset_geolocator()
+        reset_throttling()
+        self.addCleanup(reset_geolocator)
+        self.addCleanup(reset_throttling)
+
+        self.server = StubArcGISServer(self.candidates)
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.raws = iter(self.candidates)
+
+    def settings(self, **kwargs):
+        return super().settings(
+            **self.server.settings,
+            ADDRESS_GEOCODER_PROVIDER="arcgis",
+            ADDRESS_ARCGIS_MAX_RETRIES=0,
+            **kwargs,
+        )
+
+    def save_address(self):
+        address = Address(raw=next(self.raws))
+        started = time.monotonic()
+        address.save()
+        return address, time.monotonic() - started
+
+    def geocode_requests(self):
+        return len(self.server.operations("findAddressCandidates"))
+
+    def test_errors_open_the_circuit(self):
+        self.server.status = 500
+
+        with self.settings(ADDRESS_ARCGIS_CIRCUIT_BREAKER_THRESHOLD=2):
+            for _ in range(2):
+                address, _ = self.save_address()
+                self.assertEqual(address.parse_status, Address.ParseStatus.PENDING)
+            self.assertEqual(get_circuit_breaker().state, CircuitBreaker.OPEN)
+
+            address, _ = self.save_address()
+
+        self.assertEqual(self.geocode_requests(), 2)
+        self.assertIsNotNone(address.pk)
+        self.assertIsNone(address.locality)
+        self.assertEqual(address.parse_status, Address.ParseStatus.PENDING)
+
+    def test_slow_service_opens_the_circuit(self):
+        self.server.latency = 0.5
+
+        with self.settings(
+            ADDRESS_ARCGIS_TIMEOUT=0.1, ADDRESS_ARCGIS_CIRCUIT_BREAKER_THRESHOLD=2
+        ):
+            for _ in range(2):
+                _, elapsed = self.save_address()
+                self.assertLess(elapsed, self.server.latency)
+            address, elapsed = self.save_address()
+
+        # Once open, saves don't wait for the timeout at all
+        self.assertLess(elapsed, 0.05)
+        self.assertEqual(self.geocode_requests(), 2)
+        self.assertEqual(address.parse_status, Address.ParseStatus.PENDING)
+
+    def test_circuit_closes_after_successful_trial(self):
+        self.server.status = 500
+
+        with self.settings(
+            ADDRESS_ARCGIS_CIRCUIT_BREAKER_THRESHOLD=1,
+            ADDRESS_ARCGIS_CIRCUIT_BREAKER_TIMEOUT=0.2,
+        ):
+            self.save_address()
+            self.server.status = 200
+            address, _ = self.save_address()
+            self.assertEqual(address.parse_status, Address.ParseStatus.PENDING)
+
+            time.sleep(0.2)
+            address, _ = self.save_address()
+
+            self.assertEqual(get_circuit_breaker().state, CircuitBreaker.CLOSED)
+        self.assertEqual(address.parse_status, Address.ParseStatus.OK)
+        self.assertEqual(address.locality.name, "COLUMBUS")
+        self.assertEqual(self.geocode_requests(), 2)
+
+    async def test_cancelled_trial_releases_the_circuit(self):
+        service = ArcGISGeocodingService()
+        with self.settings(
+            ADDRESS_ARCGIS_CIRCUIT_BREAKER_THRESHOLD=1,
+            ADDRESS_ARCGIS_CIRCUIT_BREAKER_TIMEOUT=0,
+        ):
+            circuit_breaker = get_circuit_breaker()
+            circuit_breaker.before_call()
+            circuit_breaker.record_failure()
+
+            async def slow_call():
+                await asyncio.sleep(1)
+
+            trial = asyncio.ensure_future(service._athrottled(slow_call))
+            await asyncio.sleep(0)
+            trial.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await trial
+
+            def interrupted_call():
+                raise KeyboardInterrupt
+
+            with self.assertRaises(KeyboardInterrupt):
+                service._throttled(interrupted_call)
+
+            # The next call is let through as a trial again
+            self.assertEqual(service._throttled(lambda: "result"), "result")
+            self.assertEqual(circuit_breaker.state, CircuitBreaker.CLOSED)
+
+    def test_rate_limit(self):
+        with self.settings(
+            ADDRESS_ARCGIS_RATE_LIMIT=5,
+            ADDRESS_ARCGIS_RATE_LIMIT_BURST=1,
+            ADDRESS_ARCGIS_RATE_LIMIT_WAIT=0,
+        ):
+            parsed, _ = self.save_address()
+            limited, elapsed = self.save_address()
+
+        self.assertEqual(parsed.parse_status, Address.ParseStatus.OK)
+        self.assertEqual(limited.parse_status, Address.ParseStatus.PENDING)
+        self.assertLess(elapsed, 0.05)
+        self.assertEqual(self.geocode_requests(), 1)
+
+    def test_rate_limit_waits_for_a_token(self):
+        with self.settings(
+            ADDRESS_ARCGIS_RATE_LIMIT=10,
+            ADDRESS_ARCGIS_RATE_LIMIT_BURST=1,
+            ADDRESS_ARCGIS_RATE_LIMIT_WAIT=1,
+        ):
+            service = ArcGISGeocodingService()
+            started = time.monotonic()
+            results = [service.geocode(raw) for raw in list(self.candidates)[:4]]
+            elapsed = time.monotonic() - started
+
+        self.assertTrue(all(results))
+        self.assertGreaterEqual(elapsed, 0.3)
@@ -0,0 +1,179 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from ..models import Address
+from ..services import ChainedGeocodingService, get_geocoding_service
+from ..services.registry import reset_geocoding_services
+from .fake_geocoder import FakeGeocodingService, GeocodeCacheTestMixin, make_raws
+
+LOCAL_LATITUDE = 40.0
+
+
+class LocalGeocodingService(FakeGeocodingService):
+    """
+    Only geocodes Illinois addresses, without a postal code for ZIP 00000, and
+    sets its own coordinates.
+    """
+
+    name = "local"
+
+    def geocode(self, raw):
+        components = super().geocode(raw)
+        if components is None or components["state_name"] != "IL":
+            return None
+        if components["postal_code"] == "00000":
+            components["postal_code"] = ""
+        return components
+
+    def apply_components(self, address_instance, components):
+        super().apply_components(address_instance, components)
+        address_instance.latitude = LOCAL_LATITUDE
+
+
+class RemoteGeocodingService(FakeGeocodingService):
+    """
+    Geocodes anything FakeGeocodingService does, except places in Nowhere.
+    """
+
+    name = "remote"
+
+    def geocode(self, raw):
+        components = super().geocode(raw)
+        if components is None or components["locality_name"] == "NOWHERE":
+            return None
+        return components
+
+
+@override_settings(
+    ADDRESS_GEOCODER_PROVIDERS={
+        "local": f"{__name__}.LocalGeocodingService",
+        "remote": f"{__name__}.RemoteGeocodingService",
+    },
+    ADDRESS_GEOCODER_CHAIN=["local", "remote"],
+)
+class ChainedGeocodingServiceTest(GeocodeCacheTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        reset_geocoding_services()
+        self.addCleanup(reset_geocoding_services)
+        self.chain = get_geocoding_service("chain")
+        self.local = get_geocoding_service("local")
+        self.remote = get_geocoding_service("remote")
+
+    def test_remote_provider_only_on_local_miss(self):
+        raws = make_raws(2) + make_raws(1, "Columbus", "OH", "43212")
+        raws.append("Invalid Address")
+        addresses = [Address(raw=raw) for raw in raws]
+
+        self.chain.parse_many(addresses)
+
+        self.assertEqual(self.local.batches, [raws])
+        self.assertEqual(self.remote.batches, [raws[2:]])
+        self.assertEqual(addresses[0].locality.name, "SPRINGFIELD")
+        self.assertEqual(addresses[0].latitude, LOCAL_LATITUDE)
+        self.assertEqual(addresses[2].locality.name, "COLUMBUS")
+        self.assertEqual(addresses[2].latitude, 39.78)
+        self.assertIsNone(addresses[3].locality)
+        self.assertEqual(self.chain.stats(), {"local": 2, "remote": 1, "misses": 1})
+
+    def test_incomplete_results(self):
+        incomplete = make_raws(1, postal_code="00000")[0]
+        fallback = make_raws(1, city="Nowhere", postal_code="00000")[0]
+
+        first = self.chain.cached_geocode(incomplete)
+        second = self.chain.cached_geocode(fallback)
+
+        # The remote provider fills in what the local one left out
+        self.assertEqual(first["provider"], "remote")
+        self.assertEqual(first["postal_code"], "00000")
+        # Without a better result, the local one is used
+        self.assertEqual(second["provider"], "local")
+        self.assertEqual(second["postal_code"], "")
+        self.assertEqual(self.chain.stats(), {"local": 1, "remote": 1, "misses": 0})
+
+    def test_save_uses_chain(self):
+        raw = make_raws(1)[0]
+
+        with self.settings(ADDRESS_GEOCODER_PROVIDER="chain"):
+            first = Address(raw=raw)
+            first.save()
+            second = Address(raw=raw.upper())
+            second.parse_address()
+            chain = get_geocoding_service()
+            local = get_geocoding_service("local")
+            remote = get_geocoding_service("remote")
+
+        self.assertIsInstance(chain, ChainedGeocodingService)
+        self.assertEqual(second.locality, first.locality)
+        self.assertEqual(second.latitude, LOCAL_LATITUDE)
+        # The second parse is served from the local provider's cache
+        self.assertEqual(local.geocoded, [raw])
+        self.assertEqual(remote.geocoded, [])
+        self.assertEqual(chain.stats()["local"], 2)
+
+    async def test_aparse(self):
+        address = Address(raw=make_raws(1, "Columbus", "OH", "43212")[0])
+
+        await self.chain.aparse(address)
+
+        self.assertEqual(address.locality.name, "COLUMBUS")
+        self.assertEqual(self.chain.stats()["remote"], 1)
+
+    def test_failing_provider_keeps_earlier_results(self):
+        raws = make_raws(2) + make_raws(1, "Columbus", "OH", "43212")
+        raws.append("Invalid Address")
+
+        with self.settings(ADDRESS_GEOCODER_PROVIDER="chain"), patch.object(
+            RemoteGeocodingService, "geocode", side_effect=RuntimeError("No API key")
+        ):
+            addresses = Address.objects.bulk_create_from_raw(raws)
+
+        statuses = dict(Address.objects.values_list("raw", "parse_status"))
+        self.assertEqual(statuses[raws[0]], Address.ParseStatus.OK)
+        self.assertEqual(statuses[raws[1]], Address.ParseStatus.OK)
+        # Only the addresses left to the failing provider are pending
+        self.assertEqual(statuses[raws[2]], Address.ParseStatus.PENDING)
+        self.assertEqual(statuses[raws[3]], Address.ParseStatus.PENDING)
+        self.assertEqual(addresses[0].locality.name, "SPRINGFIELD")
+
+    def test_failing_provider_single_address(self):
+        with patch.object(
+            LocalGeocodingService, "geocode", side_effect=RuntimeError("Down")
+        ):
+            # A later provider still resolves the address
+            components = self.chain.cached_geocode(make_raws(1)[0])
+        self.assertEqual(components["provider"], "remote")
+
+        with patch.object(
+            RemoteGeocodingService, "geocode", side_effect=RuntimeError("Down")
+        ):
+            with self.assertRaises(RuntimeError):
+                self.chain.cached_geocode(make_raws(1, "Columbus", "OH", "43212")[0])
+            # An incomplete result from the first provider is kept
+            fallback = self.chain.cached_geocode(make_raws(1, postal_code="00000")[0])
+        self.assertEqual(fallback["provider"], "local")
+
+    def test_failing_providers_batch(self):
+        with patch.object(
+            RemoteGeocodingService, "geocode", side_effect=RuntimeError("Down")
+        ):
+            with self.assertRaises(RuntimeError):
+                self.chain.cached_geocode_many(["Invalid Address"])
+            results = self.chain.cached_geocode_many(
+                [make_raws(1)[0], "Invalid Address"]
+            )
+
+        self.assertEqual(results[0]["provider"], "local")
+        self.assertIsNone(results[1])
+
+    def test_clear_stats(self):
+        self.chain.cached_geocode("Invalid Address")
+        self.chain.clear_stats()
+
+        self.assertEqual(self.chain.stats(), {"local": 0, "remote": 0, "misses": 0})
+
+    def test_invalid_chain(self):
+        for providers in [[], ["local", "chain"]]:
+            with self.assertRaises(ValueError):
+                ChainedGeocodingService(providers)
@@ -0,0 +1,84 @@
+from django.test import TestCase
+
+from ..models import Address
+from ..services import (
+    ArcGISGeocodingService,
+    ScourgifyGeocodingService,
+    get_geocoding_service,
+    register_provider,
+    unregister_provider,
+)
+from ..services.registry import get_provider_class, reset_geocoding_services
+from .fake_geocoder import FakeGeocodingService, GeocodeCacheTestMixin, make_raws
+
+FAKE_PATH = "autoparsed_address_field.tests.fake_geocoder.FakeGeocodingService"
+
+
+class GeocodingServiceRegistryTest(GeocodeCacheTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        reset_geocoding_services()
+        self.addCleanup(reset_geocoding_services)
+
+    def test_builtin_providers(self):
+        self.assertEqual(get_provider_class("arcgis"), ArcGISGeocodingService)
+        self.assertEqual(get_provider_class("scourgify"), ScourgifyGeocodingService)
+
+    def test_service_is_created_once(self):
+        service = get_geocoding_service("arcgis")
+
+        self.assertIsInstance(service, ArcGISGeocodingService)
+        self.assertIs(get_geocoding_service("arcgis"), service)
+
+    def test_default_provider_follows_settings(self):
+        default = get_geocoding_service()
+        self.assertIsInstance(default, ScourgifyGeocodingService)
+        self.assertIs(get_geocoding_service("scourgify"), default)
+
+        with self.settings(ADDRESS_GEOCODER_PROVIDER="arcgis"):
+            self.assertIsInstance(get_geocoding_service(), ArcGISGeocodingService)
+            self.assertIs(Address._get_geocoding_service(), get_geocoding_service())
+
+        self.assertIsInstance(get_geocoding_service(), ScourgifyGeocodingService)
+
+    def test_dotted_path(self):
+        service = get_geocoding_service(FAKE_PATH)
+
+        self.assertIsInstance(service, FakeGeocodingService)
+        self.assertIs(get_geocoding_service(FAKE_PATH), service)
+
+    def test_providers_setting(self):
+        with self.settings(ADDRESS_GEOCODER_PROVIDERS={"fake": FAKE_PATH}):
+            self.assertIsInstance(get_geocoding_service("fake"), FakeGeocodingService)
+
+        with self.assertRaises(ValueError):
+            get_geocoding_service("fake")
+
+    def test_register_provider(self):
+        @register_provider("local")
+        class LocalGeocodingService(FakeGeocodingService):
+            name = "local"
+
+        self.addCleanup(unregister_provider, "local")
+
+        with self.settings(ADDRESS_GEOCODER_PROVIDER="local"):
+            address = Address(raw=make_raws(1)[0])
+            address.save()
+            service = get_geocoding_service()
+
+        self.assertIsInstance(service, LocalGeocodingService)
+        self.assertEqual(service.geocoded, [address.raw])
+        self.assertEqual(address.locality.name, "SPRINGFIELD")
+
+    def test_register_replaces_cached_service(self):
+        service = get_geocoding_service("arcgis")
+        register_provider("arcgis", FakeGeocodingService)
+        self.addCleanup(register_provider, "arcgis", ArcGISGeocodingService)
+
+        self.assertIsInstance(get_geocoding_service("arcgis"), FakeGeocodingService)
+        self.assertIsNot(get_geocoding_service("arcgis"), service)
+
+    def test_unsupported_provider(self):
+        for provider in ["unknown", "autoparsed_address_field.tests.Missing"]:
+            with self.assertRaisesMessage(ValueError, "Unsupported geocoding provider"):
+                get_geocoding_service(provider)
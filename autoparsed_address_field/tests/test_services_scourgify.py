@@ -1,7 +1,13 @@
+import threading
+from unittest import mock
+
+from django.apps import apps
 from django.test import TestCase
 
 from ..models import Address, Country, State, Locality
 from ..services import ScourgifyGeocodingService
+from ..services import scourgify
+from .fake_geocoder import GeocodeCacheTestMixin
 
 
 class ScourgifyGeocodingServiceTest(TestCase):
@@ -50,3 +56,135 @@ class ScourgifyGeocodingServiceTest(TestCase):
         self.assertIsNone(address.latitude)
         self.assertIsNone(address.longitude)
         self.assertIsNone(address.locality)
+
+
+@mock.patch("autoparsed_address_field.services.scourgify.SearchEngine")
+class ScourgifySearchEngineTest(GeocodeCacheTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        scourgify.reset_search_engine()
+        self.addCleanup(scourgify.reset_search_engine)
+
+    def test_engine_is_shared_between_parses(self, search_engine):
+        search_engine.return_value.by_zipcode.return_value = mock.Mock(
+            lat=38.9, lng=-77.0
+        )
+        service = ScourgifyGeocodingService()
+
+        for raw in [
+            "1600 Pennsylvania Ave NW, Washington, DC 20500",
+            "1 First St NE, Washington, DC 20543",
+        ]:
+            address = Address(raw=raw)
+            service.parse(address)
+            self.assertEqual(address.latitude, 38.9)
+
+        search_engine.assert_called_once_with()
+        self.assertEqual(search_engine.return_value.by_zipcode.call_count, 2)
+
+    def test_engine_is_shared_between_threads(self, search_engine):
+        barrier = threading.Barrier(8)
+        engines = []
+
+        def lookup():
+            barrier.wait()
+            scourgify.lookup_zipcode("20500")
+            engines.append(scourgify.get_search_engine())
+
+        threads = [threading.Thread(target=lookup) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        search_engine.assert_called_once_with()
+        self.assertEqual(len(set(map(id, engines))), 1)
+
+    def test_reset(self, search_engine):
+        engine = scourgify.get_search_engine()
+        scourgify.reset_search_engine()
+
+        engine.close.assert_called_once_with()
+        scourgify.get_search_engine()
+        self.assertEqual(search_engine.call_count, 2)
+
+    def test_engine_is_recreated_after_fork(self, search_engine):
+        engine = scourgify.get_search_engine()
+        scourgify._reset_search_engine_after_fork()
+
+        # The child must not close the parent's connection
+        engine.close.assert_not_called()
+        scourgify.get_search_engine()
+        self.assertEqual(search_engine.call_count, 2)
+
+    def test_preload(self, search_engine):
+        app_config = apps.get_app_config("autoparsed_address_field")
+
+        app_config.ready()
+        search_engine.assert_not_called()
+
+        with self.settings(ADDRESS_USZIPCODE_PRELOAD=True):
+            app_config.ready()
+        search_engine.assert_called_once_with()
+
+
+class ScourgifyProcessPoolTest(GeocodeCacheTestMixin, TestCase):
+    raws = [
+        "1600 Pennsylvania Ave NW, Washington, DC 20500",
+        "1 First St NE, Washington, DC 20543",
+        "Invalid Address",
+        "350 Fifth Avenue, New York, NY 10118",
+        "233 S Wacker Dr, Chicago, IL 60606",
+    ]
+
+    def setUp(self):
+        super().setUp()
+        scourgify.reset_process_pool()
+        self.addCleanup(scourgify.reset_process_pool)
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(scourgify.get_process_pool())
+
+    def test_geocode_many_in_process_pool(self):
+        service = ScourgifyGeocodingService()
+        expected = [service.geocode(raw) for raw in self.raws]
+
+        with self.settings(
+            ADDRESS_SCOURGIFY_PROCESSES=2, ADDRESS_SCOURGIFY_CHUNK_SIZE=2
+        ):
+            results = service.geocode_many(self.raws)
+            self.assertIsNotNone(scourgify._process_pool)
+
+        self.assertEqual(results, expected)
+        self.assertIsNone(results[2])
+        self.assertEqual(results[3]["locality_name"], "NEW YORK")
+        # Leaving the settings shuts the pool down
+        self.assertIsNone(scourgify._process_pool)
+
+    def test_small_batches_run_inline(self):
+        with self.settings(
+            ADDRESS_SCOURGIFY_PROCESSES=2, ADDRESS_SCOURGIFY_CHUNK_SIZE=10
+        ):
+            results = ScourgifyGeocodingService().geocode_many(self.raws)
+            self.assertIsNone(scourgify._process_pool)
+
+        self.assertEqual(len(results), len(self.raws))
+
+    @mock.patch("autoparsed_address_field.services.scourgify.SearchEngine")
+    def test_parse_many(self, search_engine):
+        search_engine.return_value.by_zipcode.return_value = mock.Mock(
+            lat=38.9, lng=-77.0
+        )
+        self.addCleanup(scourgify.reset_search_engine)
+        addresses = [Address(raw=raw) for raw in self.raws]
+
+        with self.settings(
+            ADDRESS_SCOURGIFY_PROCESSES=2, ADDRESS_SCOURGIFY_CHUNK_SIZE=2
+        ):
+            ScourgifyGeocodingService().parse_many(addresses)
+
+        self.assertEqual(addresses[0].locality.name, "WASHINGTON")
+        self.assertEqual(addresses[0].locality.state, addresses[1].locality.state)
+        self.assertIsNone(addresses[2].locality)
+        self.assertEqual(addresses[4].locality.state.name, "IL")
+        self.assertEqual(addresses[4].latitude, 38.9)
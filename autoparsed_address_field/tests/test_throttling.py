@@ -0,0 +1,113 @@
+from django.test import SimpleTestCase
+from geopy.exc import GeocoderRateLimited
+
+from ..throttling import CircuitBreaker, CircuitOpenError, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTest(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(2, burst=3, clock=self.clock)
+
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0, 0, 0])
+        with self.assertRaises(GeocoderRateLimited) as context:
+            bucket.reserve()
+        self.assertEqual(context.exception.retry_after, 0.5)
+
+        self.clock.now = 0.5
+        self.assertEqual(bucket.reserve(), 0)
+
+    def test_reserve_with_wait(self):
+        bucket = TokenBucket(4, burst=1, clock=self.clock)
+
+        self.assertEqual(bucket.reserve(max_wait=1), 0)
+        self.assertEqual(bucket.reserve(max_wait=1), 0.25)
+        self.assertEqual(bucket.reserve(max_wait=1), 0.5)
+
+    def test_rejected_reservation_takes_no_token(self):
+        bucket = TokenBucket(1, clock=self.clock)
+        bucket.reserve()
+
+        for _ in range(3):
+            with self.assertRaises(GeocoderRateLimited):
+                bucket.reserve(max_wait=0.5)
+
+        self.clock.now = 1
+        self.assertEqual(bucket.reserve(), 0)
+
+    def test_tokens_capped_at_burst(self):
+        bucket = TokenBucket(10, burst=2, clock=self.clock)
+        self.clock.now = 60
+
+        bucket.reserve()
+        bucket.reserve()
+        with self.assertRaises(GeocoderRateLimited):
+            bucket.reserve()
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(threshold=3, timeout=10, clock=self.clock)
+
+    def fail(self, times):
+        for _ in range(times):
+            self.breaker.before_call()
+            self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.fail(2)
+        self.breaker.record_success()
+        self.fail(2)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+        self.fail(1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+    def test_trial_call_after_timeout(self):
+        self.fail(3)
+        self.clock.now = 10
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+
+        self.breaker.before_call()
+        # Only one trial call at a time
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_released_trial(self):
+        self.fail(3)
+        self.clock.now = 10
+        self.breaker.before_call()
+
+        self.breaker.release()
+
+        # Another trial call may go ahead
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.breaker.before_call()
+
+    def test_failed_trial_reopens(self):
+        self.fail(3)
+        self.clock.now = 10
+
+        self.fail(1)
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.clock.now = 19
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.clock.now = 20
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
@@ -1,7 +1,18 @@
+from unittest.mock import patch
+
+from django.db import connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from autoparsed_address_field.models import Address, Locality, State
+from autoparsed_address_field.signals import addresses_parsed
 from autoparsed_address_field.utils.create_address_from_keys import (
     create_address_from_keys,
+    create_addresses_from_keys,
 )
+from autoparsed_address_field.utils.uuid import generate_uuid_from_address
+
+from .fake_geocoder import FakeGeocodingService, GeocodeCacheTestMixin
 
 
 class CreateAddressFromKeysTest(TestCase):
@@ -65,3 +76,121 @@ class CreateAddressFromKeysTest(TestCase):
             f"{self.address_data['address_line_1']}, {self.address_data['address_line_2']}, {self.address_data['locality_name']}, "
             f"OH {self.address_data['postal_code']}".strip().upper(),
         )
+
+    def test_create_address_reuses_matching_raw_address(self):
+        """
+        Test that repeating the same keys updates the existing Address.
+        """
+        first = create_address_from_keys(self.address_data, skip_parsing=True)
+        second = create_address_from_keys(
+            {**self.address_data, "latitude": 39.99}, skip_parsing=True
+        )
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(second.latitude, 39.99)
+
+
+class CreateAddressesFromKeysTest(GeocodeCacheTestMixin, TestCase):
+    def make_data(self, count, **overrides):
+        return [
+            {
+                "address_line_1": f"{number} Main St",
+                "address_line_2": None,
+                "locality_name": "Columbus",
+                "state_name": "OH",
+                "postal_code": "43212",
+                "country_name": "USA",
+                "country_code": "USA",
+                "latitude": 39.99,
+                "longitude": -83.04,
+                **overrides,
+            }
+            for number in range(1, count + 1)
+        ]
+
+    def test_create_addresses_skip_parsing(self):
+        data = self.make_data(3) + self.make_data(2, locality_name="Dublin")
+
+        created, updated = create_addresses_from_keys(
+            iter(data), skip_parsing=True, chunk_size=2
+        )
+
+        self.assertEqual((created, updated), (5, 0))
+        self.assertEqual(Locality.objects.count(), 2)
+        self.assertEqual(State.objects.count(), 1)
+        address = Address.objects.get(raw="1 Main St, Dublin, OH, 43212, USA")
+        self.assertEqual(address.locality.name, "Dublin")
+        self.assertEqual(address.formatted, "1 Main St, Dublin, OH 43212")
+        self.assertEqual(address.latitude, 39.99)
+        self.assertEqual(address.address_id, generate_uuid_from_address(address))
+
+    def test_matches_single_version(self):
+        (data,) = self.make_data(1, address_line_2="Apt 4B")
+        with transaction.atomic():
+            single = create_address_from_keys(data, skip_parsing=True)
+            transaction.set_rollback(True)
+
+        create_addresses_from_keys([data], skip_parsing=True)
+
+        bulk = Address.objects.get()
+        for field in ["address_line_1", "address_line_2", "raw", "raw_key"]:
+            self.assertEqual(getattr(bulk, field), getattr(single, field))
+        self.assertEqual(bulk.formatted, single.formatted)
+        self.assertEqual(bulk.locality.name, single.locality.name)
+        self.assertEqual(bulk.address_id, single.address_id)
+
+    def test_updates_existing_addresses(self):
+        create_addresses_from_keys(self.make_data(2), skip_parsing=True)
+
+        data = self.make_data(3, latitude=40.0)
+        data.append({**data[0], "latitude": 41.0})
+        created, updated = create_addresses_from_keys(data, skip_parsing=True)
+
+        self.assertEqual((created, updated), (1, 2))
+        self.assertEqual(Address.objects.count(), 3)
+        self.assertEqual(
+            Address.objects.get(raw__startswith="1 Main St").latitude, 41.0
+        )
+
+    def test_queries_per_chunk_are_constant(self):
+        create_addresses_from_keys(self.make_data(1), skip_parsing=True)
+
+        with CaptureQueriesContext(connection) as few:
+            create_addresses_from_keys(
+                self.make_data(5, locality_name="Dublin"), skip_parsing=True
+            )
+        with CaptureQueriesContext(connection) as many:
+            create_addresses_from_keys(
+                self.make_data(50, locality_name="Worthington"), skip_parsing=True
+            )
+
+        self.assertEqual(len(few), len(many))
+
+    def test_parsing(self):
+        service = FakeGeocodingService()
+        data = self.make_data(2, address_line_1=None)
+        data[0]["address_line_1"] = "1 Main St"
+        data[1]["address_line_1"] = "2 Main St"
+        create_addresses_from_keys(data[:1], skip_parsing=True)
+
+        with patch.object(Address, "_get_geocoding_service", return_value=service):
+            created, updated = create_addresses_from_keys(data)
+
+        self.assertEqual((created, updated), (1, 1))
+        # The existing address's raw text didn't change
+        self.assertEqual(service.geocoded, ["2 Main St, Columbus, OH, 43212, USA"])
+        address = Address.objects.get(raw__startswith="2 Main St")
+        self.assertEqual(address.formatted, "2 MAIN ST, COLUMBUS, OH 43212")
+        self.assertEqual(address.locality.name, "COLUMBUS")
+
+    def test_signal_is_sent_per_chunk(self):
+        batches = []
+
+        def receiver(sender, address_instances, **kwargs):
+            batches.append(len(address_instances))
+
+        addresses_parsed.connect(receiver)
+        self.addCleanup(addresses_parsed.disconnect, receiver)
+        create_addresses_from_keys(self.make_data(3), skip_parsing=True, chunk_size=2)
+
+        self.assertEqual(batches, [2, 1])
@@ -0,0 +1,49 @@
+import unittest
+
+from autoparsed_address_field.utils.raw_key import (
+    generate_raw_key,
+    normalize_raw_address,
+)
+
+
+class NormalizeRawAddressTest(unittest.TestCase):
+    def test_collapses_whitespace_and_case(self):
+        """Test that spacing and case differences normalize away."""
+        self.assertEqual(normalize_raw_address("123  main st "), "123 MAIN ST")
+
+    def test_normalizes_comma_spacing(self):
+        """Test that commas are spaced consistently."""
+        self.assertEqual(
+            normalize_raw_address("123 Main St ,Springfield,  IL,"),
+            "123 MAIN ST, SPRINGFIELD, IL",
+        )
+
+    def test_blank_address(self):
+        """Test that blank input normalizes to an empty string."""
+        self.assertEqual(normalize_raw_address(None), "")
+        self.assertEqual(normalize_raw_address("  "), "")
+
+
+class GenerateRawKeyTest(unittest.TestCase):
+    def test_equivalent_addresses_share_key(self):
+        """Test that equivalent spellings produce the same key."""
+        self.assertEqual(
+            generate_raw_key("123 Main St"), generate_raw_key("123  main st ")
+        )
+
+    def test_different_addresses_differ(self):
+        """Test that different addresses produce different keys."""
+        self.assertNotEqual(
+            generate_raw_key("123 Main St"), generate_raw_key("124 Main St")
+        )
+
+    def test_key_is_sha256_hex(self):
+        """Test that the key fits the 64 character column."""
+        raw_key = generate_raw_key("123 Main St")
+        self.assertEqual(len(raw_key), 64)
+        int(raw_key, 16)
+
+    def test_blank_address_has_no_key(self):
+        """Test that blank addresses produce no key."""
+        self.assertIsNone(generate_raw_key(""))
+        self.assertIsNone(generate_raw_key(None))
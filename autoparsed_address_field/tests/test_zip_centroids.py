@@ -0,0 +1,125 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+
+from ..models import Address
+from ..services import ScourgifyGeocodingService
+from ..zip_centroids import (
+    ZipCentroids,
+    get_zip_centroids,
+    parse_zipcode,
+    write_zip_centroids,
+)
+from .fake_geocoder import GeocodeCacheTestMixin
+
+ROWS = [
+    ("20500", 38.89, -77.03),
+    ("10001", 40.75, -73.99),
+    ("00501", 40.81, -73.04),
+    ("99950", 55.54, -131.43),
+    ("12345", None, None),
+    ("bad", 1.0, 1.0),
+]
+
+
+class ZipCentroidsTest(SimpleTestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, "zip_centroids.bin")
+
+    def test_lookup(self):
+        self.assertEqual(write_zip_centroids(self.path, ROWS), 4)
+        table = ZipCentroids.open(self.path)
+
+        self.assertEqual(len(table), 4)
+        self.assertEqual(list(table.zipcodes), [501, 10001, 20500, 99950])
+        self.assertEqual(table.lookup("20500"), (38.89, -77.03))
+        self.assertEqual(table.lookup("00501"), (40.81, -73.04))
+        self.assertEqual(table.lookup("99950-1234"), (55.54, -131.43))
+        self.assertIsNone(table.lookup("12345"))
+        self.assertIsNone(table.lookup("99999"))
+        self.assertIsNone(table.lookup("00000"))
+        self.assertIsNone(table.lookup(""))
+        self.assertIsNone(table.lookup(None))
+
+    def test_empty_table(self):
+        table = ZipCentroids.from_rows([])
+
+        self.assertEqual(len(table), 0)
+        self.assertIsNone(table.lookup("20500"))
+
+    def test_invalid_file(self):
+        with open(self.path, "wb") as f:
+            f.write(b"\0" * 64)
+
+        with self.assertRaises(ValueError):
+            ZipCentroids.open(self.path)
+
+    def test_parse_zipcode(self):
+        self.assertEqual(parse_zipcode("20500"), 20500)
+        self.assertEqual(parse_zipcode(" 02134-0001"), 2134)
+        self.assertIsNone(parse_zipcode("2050"))
+        self.assertIsNone(parse_zipcode("ABCDE"))
+
+    def test_setting(self):
+        write_zip_centroids(self.path, ROWS)
+
+        self.assertIsNone(get_zip_centroids())
+        with self.settings(ADDRESS_ZIP_CENTROIDS_PATH=self.path):
+            table = get_zip_centroids()
+            self.assertIs(get_zip_centroids(), table)
+            self.assertEqual(table.lookup("10001"), (40.75, -73.99))
+        self.assertIsNone(get_zip_centroids())
+
+    def test_build_command(self):
+        search_engine = mock.Mock()
+        search_engine.ses.query.return_value.all.return_value = ROWS
+        stdout = StringIO()
+
+        with mock.patch(
+            "autoparsed_address_field.services.scourgify.get_search_engine",
+            return_value=search_engine,
+        ):
+            call_command("build_zip_centroids", self.path, stdout=stdout)
+
+        self.assertIn("Wrote 4 ZIP codes", stdout.getvalue())
+        self.assertEqual(ZipCentroids.open(self.path).lookup("20500"), (38.89, -77.03))
+
+    def test_build_command_requires_path(self):
+        with self.assertRaises(CommandError):
+            call_command("build_zip_centroids")
+
+
+class ScourgifyZipCentroidsTest(GeocodeCacheTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, "zip_centroids.bin")
+        write_zip_centroids(self.path, ROWS)
+
+    @mock.patch("autoparsed_address_field.services.scourgify.lookup_zipcode")
+    def test_coordinates_from_table(self, lookup_zipcode):
+        address = Address(raw="1600 Pennsylvania Ave NW, Washington, DC 20500")
+
+        with self.settings(ADDRESS_ZIP_CENTROIDS_PATH=self.path):
+            ScourgifyGeocodingService().parse(address)
+
+        self.assertEqual((address.latitude, address.longitude), (38.89, -77.03))
+        lookup_zipcode.assert_not_called()
+
+    @mock.patch("autoparsed_address_field.services.scourgify.lookup_zipcode")
+    def test_unknown_zipcode(self, lookup_zipcode):
+        address = Address(raw="1 Main St, Schenectady, NY 12345")
+
+        with self.settings(ADDRESS_ZIP_CENTROIDS_PATH=self.path):
+            ScourgifyGeocodingService().parse(address)
+
+        self.assertEqual(address.address_line_1, "1 MAIN ST")
+        self.assertIsNone(address.latitude)
+        lookup_zipcode.assert_not_called()
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from geopy.exc import GeocoderRateLimited, GeocoderUnavailable
+
+
+class CircuitOpenError(GeocoderUnavailable):
+    """
+    Raised instead of calling a provider while its circuit breaker is open.
+    """
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing `rate` calls per second on average, in
+    bursts of up to `burst` calls.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait=0):
+        """
+        Takes a token, returning the seconds to wait before it may be used.
+        Raises GeocoderRateLimited, without taking a token, when that would be
+        longer than `max_wait`.
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+
+            wait = max(0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                raise GeocoderRateLimited("Rate limit exceeded", retry_after=wait)
+            self._tokens -= 1
+            return wait
+
+    def acquire(self, max_wait=0):
+        wait = self.reserve(max_wait)
+        if wait:
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing provider.
+
+    After `threshold` consecutive failures the circuit opens, and calls fail
+    fast with CircuitOpenError for `timeout` seconds. Then a single trial call
+    is let through: the circuit closes if it succeeds and opens again if it
+    fails. Every call let through must end with `record_success()`,
+    `record_failure()` or `release()`.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, threshold=5, timeout=30, clock=time.monotonic):
+        self.threshold = threshold
+        self.timeout = timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def before_call(self):
+        """
+        Raises CircuitOpenError unless the call may go ahead.
+        """
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return
+        raise CircuitOpenError("Circuit breaker is open")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def release(self):
+        """
+        Ends a call without an outcome, e.g. when it was cancelled, so a trial
+        call doesn't keep the circuit half-open for good.
+        """
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial = False
+            if self._opened_at is not None or self._failures >= self.threshold:
+                self._opened_at = self._clock()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._clock() - self._opened_at >= self.timeout:
+            return self.HALF_OPEN
+        return self.OPEN
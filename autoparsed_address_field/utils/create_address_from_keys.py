@@ -1,4 +1,13 @@
+import logging
+from itertools import islice
+
 from autoparsed_address_field.models import Address, Locality, State, Country
+from autoparsed_address_field.models.address import UNNAMED_ADDRESS
+from autoparsed_address_field.signals import addresses_parsed
+from autoparsed_address_field.utils.raw_key import generate_raw_key
+from autoparsed_address_field.utils.uuid import generate_uuid_from_address
+
+logger = logging.getLogger(__name__)
 
 
 def create_address_from_keys(address_data, skip_parsing=False):
@@ -6,6 +15,10 @@ def create_address_from_keys(address_data, skip_parsing=False):
     Creates and saves an Address instance directly from a dictionary
     where keys match the Address model structure.
 
+    An existing Address with the same normalized raw address is updated
+    instead of creating a duplicate. The raw and formatted addresses are built
+    from the components unless `raw` or `formatted` is given.
+
     Args:
         address_data (dict): A dictionary containing address fields.
         skip_parsing (bool): Whether to skip parsing the address fields.
@@ -13,50 +26,197 @@ def create_address_from_keys(address_data, skip_parsing=False):
     Returns:
         Address: The created Address instance.
     """
-    # Fetch or create the country
-    country, _ = Country.objects.get_or_create(
+    # Fetch or create the country and state by name, like geocoding does
+    country, _ = Country.objects.get_or_create_cached(
         name=address_data.get("country_name"),
-        code=address_data.get("country_code"),
+        defaults=_code_defaults(address_data.get("country_code")),
     )
-
-    # Fetch or create the state
-    state, _ = State.objects.get_or_create(
+    state, _ = State.objects.get_or_create_cached(
         name=address_data.get("state_name"),
         country=country,
+        defaults=_code_defaults(address_data.get("state_code")),
     )
 
     # Fetch or create the locality
-    locality, _ = Locality.objects.get_or_create(
+    locality, _ = Locality.objects.get_or_create_cached(
         name=address_data.get("locality_name"),
         postal_code=address_data.get("postal_code"),
         state=state,
     )
 
-    # Create the Address instance without saving
-    address = Address(
-        address_line_1=address_data.get("address_line_1"),
-        address_line_2=address_data.get("address_line_2"),
-        locality=locality,
-        raw=", ".join(
-            filter(
-                None,
-                [
-                    address_data.get("address_line_1"),
-                    address_data.get("address_line_2"),
-                    address_data.get("locality_name"),
-                    address_data.get("state_name"),
-                    address_data.get("postal_code"),
-                    address_data.get("country_name"),
-                ],
-            )
-        ),
-        formatted=f"{address_data.get('address_line_1')}, {address_data.get('locality_name')}, "
-        f"{address_data.get('state_name')} {address_data.get('postal_code')}".strip(),
-        latitude=address_data.get("latitude"),
-        longitude=address_data.get("longitude"),
-    )
+    raw = _raw_from_keys(address_data)
+
+    # Reuse the Address matching the raw key, or create one without saving
+    address = Address.objects.filter(raw_key=generate_raw_key(raw)).first()
+    if address is None:
+        address = Address()
+
+    address.address_line_1 = address_data.get("address_line_1")
+    address.address_line_2 = address_data.get("address_line_2")
+    address.locality = locality
+    address.raw = raw
+    address.formatted = _formatted_from_keys(address_data)
+    address.latitude = address_data.get("latitude")
+    address.longitude = address_data.get("longitude")
 
     # Save with skip_parsing=True
     address.save(skip_parsing=skip_parsing)
 
     return address
+
+
+def _raw_from_keys(address_data):
+    if address_data.get("raw"):
+        return address_data["raw"]
+    return ", ".join(
+        filter(
+            None,
+            [
+                address_data.get("address_line_1"),
+                address_data.get("address_line_2"),
+                address_data.get("locality_name"),
+                address_data.get("state_name"),
+                address_data.get("postal_code"),
+                address_data.get("country_name"),
+            ],
+        )
+    )
+
+
+def _formatted_from_keys(address_data):
+    if address_data.get("formatted"):
+        return address_data["formatted"]
+    return (
+        f"{address_data.get('address_line_1')}, {address_data.get('locality_name')}, "
+        f"{address_data.get('state_name')} {address_data.get('postal_code')}".strip()
+    )
+
+
+ADDRESS_FIELDS = [
+    "address_line_1",
+    "address_line_2",
+    "locality",
+    "raw",
+    "raw_key",
+    "formatted",
+    "latitude",
+    "longitude",
+    "address_id",
+    "parse_status",
+]
+
+
+def create_addresses_from_keys(address_data_list, skip_parsing=False, chunk_size=1000):
+    """
+    Bulk version of `create_address_from_keys`.
+
+    The dicts are consumed in chunks of `chunk_size`. For each chunk, the
+    distinct Countries, States and Localities are resolved with a few
+    set-based queries, Addresses matching an existing raw key are updated with
+    `bulk_update()` and the rest are inserted with `bulk_create()`. When the
+    same raw address appears more than once in a chunk, the last dict wins.
+
+    Unless `skip_parsing` is True, new Addresses and Addresses whose raw text
+    changed are parsed together, like `save()` would. `addresses_parsed` is
+    sent once per chunk instead of `address_parsed` per Address.
+
+    Args:
+        address_data_list (iterable): Dictionaries containing address fields.
+        skip_parsing (bool): Whether to skip parsing the address fields.
+        chunk_size (int): Number of dicts handled per chunk.
+
+    Returns:
+        tuple: The number of Addresses created and updated.
+    """
+    created = updated = 0
+    for chunk in _chunks(address_data_list, chunk_size):
+        chunk_created, chunk_updated = _create_addresses_chunk(chunk, skip_parsing)
+        created += chunk_created
+        updated += chunk_updated
+    return created, updated
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _create_addresses_chunk(chunk, skip_parsing):
+    countries = Country.objects.get_or_create_cached_many(
+        [{"name": data.get("country_name")} for data in chunk],
+        defaults=[_code_defaults(data.get("country_code")) for data in chunk],
+    )
+    states = State.objects.get_or_create_cached_many(
+        [
+            {"name": data.get("state_name"), "country": country}
+            for data, country in zip(chunk, countries)
+        ],
+        defaults=[_code_defaults(data.get("state_code")) for data in chunk],
+    )
+    localities = Locality.objects.get_or_create_cached_many(
+        {
+            "name": data.get("locality_name"),
+            "postal_code": data.get("postal_code"),
+            "state": state,
+        }
+        for data, state in zip(chunk, states)
+    )
+
+    rows = {}
+    for index, (data, locality) in enumerate(zip(chunk, localities)):
+        raw = _raw_from_keys(data)
+        raw_key = generate_raw_key(raw)
+        # Blank addresses have no key, and are never merged
+        rows[raw_key if raw_key is not None else index] = (data, locality, raw, raw_key)
+
+    existing = Address.objects.in_bulk(
+        [row[3] for row in rows.values() if row[3] is not None], field_name="raw_key"
+    )
+    addresses = []
+    for data, locality, raw, raw_key in rows.values():
+        address = existing.get(raw_key) or Address()
+        address.address_line_1 = data.get("address_line_1")
+        address.address_line_2 = data.get("address_line_2")
+        address.locality = locality
+        address.raw = raw
+        address.raw_key = raw_key
+        address.formatted = _formatted_from_keys(data)
+        address.latitude = data.get("latitude")
+        address.longitude = data.get("longitude")
+        addresses.append(address)
+
+    if not skip_parsing:
+        to_parse = [
+            address
+            for address in addresses
+            if address.raw and address.raw_has_changed()
+        ]
+        if to_parse:
+            try:
+                Address._get_geocoding_service().parse_many(to_parse)
+            except Exception as e:
+                logger.error("Error parsing addresses: %s", e)
+                for address in to_parse:
+                    address.parse_status = Address.ParseStatus.PENDING
+
+    for address in addresses:
+        if str(address) != UNNAMED_ADDRESS:
+            address.address_id = generate_uuid_from_address(address)
+
+    new = [address for address in addresses if address._state.adding]
+    changed = [address for address in addresses if not address._state.adding]
+    Address.objects._bulk_insert(new)
+    Address.objects.bulk_update(changed, ADDRESS_FIELDS)
+    for address in changed:
+        address._loaded_raw = address.raw
+
+    addresses_parsed.send(
+        sender=Address, model_name=Address._meta.model_name, address_instances=addresses
+    )
+    return len(new), len(changed)
+
+
+def _code_defaults(code):
+    # Blank codes (e.g. from scourgify) aren't set on new rows
+    return {"code": code} if code else {}
@@ -0,0 +1,59 @@
+from scourgify import normalize_address_record
+from scourgify.exceptions import UnParseableAddressError
+
+# This module doesn't import Django, so process pool workers can run it without
+# setting Django up.
+
+
+def normalize_components(raw):
+    """
+    Normalizes a raw address with scourgify into address components.
+
+    :param raw: The raw address string.
+    :return: A dict of components, in the format geocoding services return.
+    :raises UnParseableAddressError: When scourgify can't parse the address.
+    """
+    parsed = normalize_address_record(raw)
+
+    address_line_1 = parsed.get("address_line_1", "")
+    address_line_2 = parsed.get("address_line_2", "")
+    locality_name = parsed.get("city", "")
+    postal_code = parsed.get("postal_code", "")
+    state_name = parsed.get("state", "")
+
+    formatted = (
+        f"{address_line_1 or ''}"
+        f"{', ' + address_line_2 if address_line_2 else ''}, "
+        f"{locality_name or ''}, {state_name or ''} {postal_code or ''}".strip(", ")
+    )
+
+    return {
+        "address_line_1": address_line_1,
+        "address_line_2": address_line_2,
+        "formatted": formatted,
+        "latitude": None,
+        "longitude": None,
+        "locality_name": locality_name,
+        "postal_code": postal_code,
+        "state_name": state_name,
+        "state_code": None,
+        "country_name": "USA",
+        "country_code": None,
+    }
+
+
+def normalize_chunk(raws):
+    """
+    Normalizes a chunk of raw addresses in a worker process.
+
+    :param raws: A list of raw address strings.
+    :return: The components for each raw address, or None where scourgify
+        can't parse it.
+    """
+    results = []
+    for raw in raws:
+        try:
+            results.append(normalize_components(raw))
+        except UnParseableAddressError:
+            results.append(None)
+    return results
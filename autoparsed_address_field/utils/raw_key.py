@@ -0,0 +1,35 @@
+import hashlib
+import re
+
+_COMMA_RE = re.compile(r"\s*,\s*")
+
+
+def normalize_raw_address(raw):
+    """
+    Normalizes a raw address string so equivalent spellings compare equal.
+
+    Whitespace is collapsed, commas are spaced consistently and the result is
+    upper-cased, so "123  main st , Springfield" and "123 Main St, Springfield"
+    normalize to the same string.
+
+    :param raw: The raw address string.
+    :return: The normalized string, empty when the address is blank.
+    """
+    if not raw:
+        return ""
+
+    return " ".join(_COMMA_RE.sub(", ", raw).split()).strip(", ").upper()
+
+
+def generate_raw_key(raw):
+    """
+    Generates the lookup key stored in `Address.raw_key` for a raw address.
+
+    :param raw: The raw address string.
+    :return: A 64 character SHA-256 hex digest, or None when the address is blank.
+    """
+    normalized = normalize_raw_address(raw)
+    if not normalized:
+        return None
+
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
@@ -0,0 +1,174 @@
+import bisect
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from array import array
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# Header: magic, format version, number of ZIP codes, padding. The header is
+# followed by the latitudes and longitudes (doubles) and the ZIP codes
+# (unsigned 32-bit ints, sorted), all in native byte order.
+MAGIC = b"ZIPC"
+VERSION = 1
+HEADER = struct.Struct("=4sII4x")
+
+
+class ZipCentroids:
+    """
+    Read-only table of US ZIP code centroids.
+
+    ZIP codes are stored sorted, with their coordinates in parallel arrays, so
+    a lookup is a binary search. The table is usually opened from a file built
+    by the `build_zip_centroids` management command with `ZipCentroids.open()`,
+    which memory-maps it so worker processes share the same pages.
+    """
+
+    def __init__(self, buffer):
+        magic, version, count = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a ZIP centroid table.")
+
+        view = memoryview(buffer)
+        offset = HEADER.size
+        self.latitudes = view[offset : offset + 8 * count].cast("d")
+        offset += 8 * count
+        self.longitudes = view[offset : offset + 8 * count].cast("d")
+        offset += 8 * count
+        self.zipcodes = view[offset : offset + 4 * count].cast("I")
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Builds an in-memory table from `(zipcode, latitude, longitude)` rows.
+        """
+        return cls(pack_rows(rows))
+
+    def __len__(self):
+        return len(self.zipcodes)
+
+    def lookup(self, postal_code):
+        """
+        Returns `(latitude, longitude)` for a ZIP or ZIP+4 code, or None if it
+        isn't in the table.
+        """
+        zipcode = parse_zipcode(postal_code)
+        if zipcode is None:
+            return None
+
+        index = bisect.bisect_left(self.zipcodes, zipcode)
+        if index == len(self.zipcodes) or self.zipcodes[index] != zipcode:
+            return None
+        return self.latitudes[index], self.longitudes[index]
+
+
+def parse_zipcode(postal_code):
+    """
+    Returns the 5-digit ZIP code of a ZIP or ZIP+4 string as an int, or None.
+    """
+    zipcode = str(postal_code or "").strip()[:5]
+    if len(zipcode) != 5 or not zipcode.isdigit():
+        return None
+    return int(zipcode)
+
+
+def pack_rows(rows):
+    """
+    Serializes `(zipcode, latitude, longitude)` rows into the table format.
+    Rows without coordinates or a valid ZIP code are skipped.
+    """
+    centroids = {}
+    for postal_code, latitude, longitude in rows:
+        zipcode = parse_zipcode(postal_code)
+        if zipcode is not None and latitude is not None and longitude is not None:
+            centroids[zipcode] = (latitude, longitude)
+
+    zipcodes = sorted(centroids)
+    latitudes = array("d", (centroids[zipcode][0] for zipcode in zipcodes))
+    longitudes = array("d", (centroids[zipcode][1] for zipcode in zipcodes))
+    return b"".join(
+        [
+            HEADER.pack(MAGIC, VERSION, len(zipcodes)),
+            latitudes.tobytes(),
+            longitudes.tobytes(),
+            array("I", zipcodes).tobytes(),
+        ]
+    )
+
+
+def write_zip_centroids(path, rows):
+    """
+    Writes a ZIP centroid table file, replacing any existing file atomically.
+    Returns the number of ZIP codes written.
+    """
+    data = pack_rows(rows)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return HEADER.unpack_from(data)[2]
+
+
+def build_zip_centroids(path, search_engine=None):
+    """
+    Builds a ZIP centroid table file from the uszipcode database.
+    """
+    from uszipcode.model import SimpleZipcode
+
+    if search_engine is None:
+        from .services.scourgify import get_search_engine
+
+        search_engine = get_search_engine()
+
+    rows = search_engine.ses.query(
+        SimpleZipcode.zipcode, SimpleZipcode.lat, SimpleZipcode.lng
+    ).all()
+    return write_zip_centroids(path, rows)
+
+
+_zip_centroids = None
+_zip_centroids_lock = threading.Lock()
+
+
+def get_zip_centroids():
+    """
+    Returns the table configured by `ADDRESS_ZIP_CENTROIDS_PATH`, opening it on
+    first use, or None if the setting isn't set.
+    """
+    global _zip_centroids
+
+    path = getattr(settings, "ADDRESS_ZIP_CENTROIDS_PATH", None)
+    if not path:
+        return None
+
+    with _zip_centroids_lock:
+        if _zip_centroids is None:
+            _zip_centroids = ZipCentroids.open(path)
+        return _zip_centroids
+
+
+def reset_zip_centroids():
+    global _zip_centroids
+
+    with _zip_centroids_lock:
+        _zip_centroids = None
+
+
+@receiver(setting_changed)
+def _reset_zip_centroids_on_setting_changed(setting, **kwargs):
+    if setting == "ADDRESS_ZIP_CENTROIDS_PATH":
+        reset_zip_centroids()